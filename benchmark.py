@@ -0,0 +1,431 @@
+"""
+Benchmark for the initIOCs generation pipeline.
+
+Builds a synthetic ioc-template git repository and a fake areaDetector binary tree with a
+number of drivers in a scratch directory, then generates 10, 100 and 1000 IOCs phase by
+phase: read_ioc_config, template and binary index preparation, IOCAction.process,
+update_unique, update_config, fix_env_paths and cleanup. The IOCs are then regenerated
+end to end by generate_iocs, including staging, fsync and install. Wall time, read, write
+and sync system calls, subprocesses and peak memory are reported for each phase. Peak
+Python memory is measured in a second pass with tracemalloc on, so its allocation hooks do
+not inflate the wall times of the first pass.
+
+Everything is local, so the benchmark runs offline on any Linux machine with git.
+
+Usage: python benchmark.py [--sizes 10 100 1000] [--drivers 20] [--mode clone|link] [--json report.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+
+import initiocs
+
+
+# phases of the pipeline, in the order they run
+PHASES = ["read_ioc_config", "prepare", "process", "update_unique", "update_config", "fix_env_paths", "cleanup", "generate_iocs"]
+
+# architecture the fake IOC binaries are built for
+BENCH_ARCH = "linux-x86_64"
+
+
+def driver_names(num_drivers):
+    """ Function that returns the names of the synthetic drivers ex. Bench007 """
+
+    return ["Bench{:03d}".format(i) for i in range(num_drivers)]
+
+
+def build_template(template_path, drivers):
+    """
+    Function that creates a synthetic ioc-template git repository with a startup script,
+    autosave file and dependency file for every driver
+
+    Parameters
+    ----------
+    template_path : str
+        directory to create the repository in
+    drivers : list of str
+        driver names, without the AD prefix
+    """
+
+    for folder in ["startupScripts", "autosaveFiles", "dependancyFiles", "iocBoot"]:
+        os.makedirs(template_path + "/" + folder)
+    for driver in drivers:
+        with open(template_path + "/startupScripts/st_{}.cmd".format(driver), "w") as st:
+            st.write("#!../../bin/{}/{}App\n".format(BENCH_ARCH, driver.lower()))
+            st.write("< envPaths\n< unique.cmd\n")
+            st.write('{}Config("$(PORT)", "$(CAM-CONNECT)", 0, 0)\n'.format(driver))
+            for i in range(50):
+                st.write('dbLoadRecords("$(ADCORE)/db/NDPlugin{}.template", "P=$(PREFIX),R=P{}:")\n'.format(i, i))
+            st.write("iocInit()\n")
+        with open(template_path + "/autosaveFiles/{}_auto_settings.req".format(driver.lower()), "w") as req:
+            req.write('file "ADBase_settings.req", P=$(P), R=$(R)\n')
+        with open(template_path + "/dependancyFiles/{}_plugins.cmd".format(driver), "w") as dep:
+            dep.write("# plugins for {}\n".format(driver))
+    with open(template_path + "/st.cmd", "w") as st:
+        st.write("#!../../bin/linux-x86_64/placeholderApp\n")
+    with open(template_path + "/unique.cmd", "w") as unique:
+        for key in ["PREFIX", "CTPREFIX", "IOC", "IOCNAME", "PORT", "ENGINEER", "HOSTNAME", "CAM-CONNECT",
+                "SUPPORT_DIR", "EPICS_CA_ADDR_LIST"]:
+            unique.write('epicsEnvSet("{}", "x")\n'.format(key))
+    with open(template_path + "/config", "w") as config:
+        config.write("NAME=x\nPORT=4000\nHOST=localhost\nUSER=softioc\n")
+    with open(template_path + "/envPaths", "w") as env_paths:
+        env_paths.write('epicsEnvSet("ARCH","{}")\n'.format(BENCH_ARCH))
+        env_paths.write('epicsEnvSet("SUPPORT","/epics/support")\nepicsEnvSet("EPICS_BASE","/epics/base")\n')
+    with open(template_path + "/iocBoot/README", "w") as readme:
+        readme.write("boot files\n")
+    with open(template_path + "/cleanup.sh", "w") as cleanup:
+        cleanup.write('DIR=$(dirname "$0")\nrm -rf $DIR/startupScripts $DIR/autosaveFiles $DIR/dependancyFiles '
+            '$DIR/.git $DIR/cleanup.sh $DIR/cleanup.bat $DIR/cleanup.manifest\n')
+    os.chmod(template_path + "/cleanup.sh", 0o755)
+    with open(template_path + "/" + initiocs.CLEANUP_MANIFEST, "w") as manifest:
+        manifest.write("# removed from every generated IOC\ncleanup.sh\ncleanup.bat\n")
+    git = ["git", "-C", template_path, "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+    subprocess.check_call(git[:3] + ["init", "--quiet"])
+    subprocess.check_call(git[:3] + ["add", "-A"])
+    subprocess.check_call(git + ["commit", "--quiet", "-m", "synthetic template"])
+
+
+def build_binaries(bin_top, drivers):
+    """
+    Function that creates a fake support/areaDetector/AD<driver>/iocs/<driver>IOC/bin/<arch>/<driver>App tree
+
+    Parameters
+    ----------
+    bin_top : str
+        top of the fake binary distribution
+    drivers : list of str
+        driver names, without the AD prefix
+    """
+
+    for driver in drivers:
+        bin_path = "{}/support/areaDetector/AD{}/iocs/{}IOC/bin/{}".format(bin_top, driver, driver.lower(), BENCH_ARCH)
+        os.makedirs(bin_path)
+        app = bin_path + "/{}App".format(driver.lower())
+        with open(app, "w") as executable:
+            executable.write("#!/bin/sh\n")
+        os.chmod(app, 0o755)
+
+
+def write_configure(path, ioc_top, bin_top, template_path, drivers, num_iocs, mode):
+    """
+    Function that writes a CONFIGURE file for num_iocs IOCs spread over the drivers
+
+    Parameters
+    ----------
+    path : str
+        path of the CONFIGURE file to write
+    ioc_top : str
+        IOC_DIR of the generated IOCs
+    bin_top : str
+        top of the fake binary distribution
+    template_path : str
+        synthetic ioc-template repository
+    drivers : list of str
+        driver names, without the AD prefix
+    num_iocs : int
+        number of IOCs to configure
+    mode : str
+        TEMPLATE_MODE, clone or link
+    """
+
+    with open(path, "w") as configure:
+        configure.write("IOC_DIR={}\nTOP_BINARY_DIR={}\nBINARIES_FLAT=NO\n".format(ioc_top, bin_top))
+        for i in range(num_iocs):
+            driver = drivers[i % len(drivers)]
+            configure.write("AD{}  cam-bench{}  B{}  {}  10.0.0.{}\n".format(driver, i, i, 4000 + i, i % 250))
+        configure.write("PREFIX=XF:BENCH:\nENGINEER=bench\nHOSTNAME=localhost\nCA_ADDRESS=127.0.0.255\n")
+        configure.write("TEMPLATE_URL={}\nTEMPLATE_CACHE=\nTEMPLATE_MODE={}\n".format(template_path, mode))
+
+
+def syscall_counts():
+    """ Function that returns the read and write system calls made by this process so far """
+
+    counts = {}
+    with open("/proc/self/io", "r") as io:
+        for line in io:
+            key, value = line.split(":")
+            counts[key] = int(value)
+    return counts.get("syscr", 0), counts.get("syscw", 0)
+
+
+class SyncCounter:
+    """
+    Counts the fsync and sync calls of the pipeline by wrapping os.fsync and os.sync, which still
+    sync as before. /proc/self/io only counts reads and writes, and syncs are what generate_iocs
+    waits on.
+
+    Attributes
+    ----------
+    calls : int
+        fsync and sync calls made since the counter was installed
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.fsync = os.fsync
+        self.sync = os.sync
+        os.fsync = self.counting(self.fsync)
+        os.sync = self.counting(self.sync)
+
+
+    def counting(self, function):
+        """ Function that wraps a sync function, counting its calls from any worker thread """
+
+        def counted(*args):
+            with self.lock:
+                self.calls = self.calls + 1
+            return function(*args)
+        return counted
+
+
+# installed when the benchmark starts, so every phase can report its sync calls
+sync_counter = None
+
+
+class PhaseTimer:
+    """
+    Measures one phase of the benchmark: wall time, read/write and sync system calls of this
+    process, CPU time of subprocesses, and peak process memory. Peak Python memory is only
+    measured while tracemalloc is tracing, otherwise it is None
+
+    Methods
+    -------
+    result()
+        returns the measurements as a dict
+    """
+
+    def __enter__(self):
+        self.traced = tracemalloc.is_tracing()
+        if self.traced:
+            tracemalloc.reset_peak()
+        self.syscr, self.syscw = syscall_counts()
+        self.syncs = sync_counter.calls
+        self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.start
+        syscr, syscw = syscall_counts()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.read_calls = syscr - self.syscr
+        self.write_calls = syscw - self.syscw
+        self.sync_calls = sync_counter.calls - self.syncs
+        self.child_cpu = (children.ru_utime + children.ru_stime) - (self.children.ru_utime + self.children.ru_stime)
+        self.peak_python = tracemalloc.get_traced_memory()[1] if self.traced else None
+        # ru_maxrss is in KiB on Linux and never decreases
+        self.max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return False
+
+
+    def result(self):
+        """ Function that returns the measurements as a dict """
+
+        return {"wall": self.wall, "read_calls": self.read_calls, "write_calls": self.write_calls,
+            "sync_calls": self.sync_calls, "child_cpu": self.child_cpu, "peak_python": self.peak_python, "max_rss": self.max_rss}
+
+
+def run_size(work_dir, template_path, bin_top, drivers, num_iocs, mode):
+    """
+    Function that generates num_iocs IOCs phase by phase and measures every phase
+
+    Parameters
+    ----------
+    work_dir : str
+        scratch directory for this size
+    template_path : str
+        synthetic ioc-template repository
+    bin_top : str
+        top of the fake binary distribution
+    drivers : list of str
+        driver names, without the AD prefix
+    num_iocs : int
+        number of IOCs to generate
+    mode : str
+        TEMPLATE_MODE, clone or link
+
+    Returns
+    -------
+    dict of str -> dict
+        measurements of each phase, plus the subprocess count and number of IOCs generated
+    """
+
+    ioc_top = work_dir + "/iocs"
+    configure_path = work_dir + "/CONFIGURE.txt"
+    write_configure(configure_path, ioc_top, bin_top, template_path, drivers, num_iocs, mode)
+    phases = {}
+
+    with PhaseTimer() as timer:
+        actions, configuration, bin_flat = initiocs.read_ioc_config(configure_path)
+    phases["read_ioc_config"] = timer.result()
+
+    with PhaseTimer() as timer:
+        initiocs.init_ioc_dir(ioc_top)
+        template_cache = initiocs.get_template_cache(configuration, ioc_top)
+        template_revision = initiocs.get_template_revision(template_cache)
+        template_tree = initiocs.TemplateTree(template_cache, template_revision or "HEAD")
+        template_index = initiocs.TemplateIndex.from_tree(template_tree)
+        renderer = initiocs.TemplateRenderer(template_tree, template_index)
+        template_snapshot = None
+        if mode == "link":
+            template_snapshot = initiocs.get_template_snapshot(template_tree, template_cache)
+        binary_index = initiocs.BinaryIndex(bin_top, bin_flat, ioc_top + "/" + initiocs.BINARY_INDEX_CACHE)
+    phases["prepare"] = timer.result()
+
+    generated = []
+    with PhaseTimer() as timer:
+        for action in actions:
+            if action.process(ioc_top, bin_top, bin_flat, template_cache, binary_index, template_index,
+                    template_snapshot, renderer) == 0:
+                generated.append(action)
+    phases["process"] = timer.result()
+
+    stages = [
+        ("update_unique", lambda action: action.update_unique(ioc_top, bin_top, bin_flat, configuration["PREFIX"],
+            configuration["ENGINEER"], configuration["HOSTNAME"], configuration["CA_ADDRESS"], renderer)),
+        ("update_config", lambda action: action.update_config(ioc_top, configuration["HOSTNAME"], renderer)),
+        ("fix_env_paths", lambda action: action.fix_env_paths(ioc_top, bin_flat, renderer)),
+        ("cleanup", lambda action: action.cleanup(ioc_top, template_index.cleanup_rules)),
+    ]
+    for phase, function in stages:
+        with PhaseTimer() as timer:
+            for action in generated:
+                function(action)
+        phases[phase] = timer.result()
+
+    for action in actions:
+        action.flush_log()
+
+    # the whole pipeline as a run uses it, every IOC is rebuilt in staging and installed
+    with PhaseTimer() as timer:
+        initiocs.generate_iocs(initiocs.read_ioc_config(configure_path)[0], configuration, bin_flat, force=True, deploy=False)
+    phases["generate_iocs"] = timer.result()
+    return {"phases": phases, "iocs": len(generated),
+        "subprocesses": sum(len(action.commands) for action in actions)}
+
+
+def run_size_quietly(work_top, name, drivers, num_iocs, mode, keep):
+    """
+    Function that runs run_size in a new directory of work_top with the pipeline output hidden
+
+    Parameters
+    ----------
+    work_top : str
+        scratch directory holding the template and the binaries
+    name : str
+        name of the directory the IOCs are generated in
+    drivers : list of str
+        names of the synthetic drivers
+    num_iocs : int
+        number of IOCs to generate
+    mode : str
+        TEMPLATE_MODE to generate with
+    keep : bool
+        keep the generated IOCs instead of removing them
+
+    Returns
+    -------
+    dict
+        measurements returned by run_size
+    """
+
+    work_dir = work_top + "/" + name
+    os.mkdir(work_dir)
+    # the pipeline prints its progress, only the tables are of interest here
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            result = run_size(work_dir, work_top + "/ioc-template", work_top + "/epics", drivers, num_iocs, mode)
+        finally:
+            sys.stdout = stdout
+    if not keep:
+        initiocs.remove_tree(work_dir)
+    return result
+
+
+def print_results(num_iocs, result):
+    """ Function that prints the measurements of one size as a table """
+
+    print("+----------------------------------------------------------------------------------+")
+    print("+ {:<80} +".format("{} IOCs ({} generated, {} subprocesses)".format(num_iocs, result["iocs"], result["subprocesses"])))
+    print("+----------------------------------------------------------------------------------+")
+    print("{:<18}{:>10}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}".format("Phase", "Wall s", "Read calls", "Write calls",
+        "Sync calls", "Child CPU s", "Peak Py MiB", "RSS MiB"))
+    for phase in PHASES:
+        measure = result["phases"][phase]
+        print("{:<18}{:>10.3f}{:>12}{:>12}{:>12}{:>12.3f}{:>12.2f}{:>12.1f}".format(phase, measure["wall"],
+            measure["read_calls"], measure["write_calls"], measure["sync_calls"], measure["child_cpu"], measure["peak_python"] / 2**20,
+            measure["max_rss"] / 2**20))
+    print()
+
+
+def parse_args():
+    """
+    Function that parses the command line arguments
+
+    Returns
+    -------
+    argparse.Namespace
+        parsed command line options
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the initIOCs generation pipeline on a synthetic template")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="numbers of IOCs to generate (default: %(default)s)")
+    parser.add_argument("--drivers", type=int, default=20, help="number of synthetic drivers (default: %(default)s)")
+    parser.add_argument("--mode", choices=["clone", "link"], default="clone", help="TEMPLATE_MODE to benchmark (default: %(default)s)")
+    parser.add_argument("--json", help="also write the measurements to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory instead of removing it")
+    return parser.parse_args()
+
+
+def main():
+    if not sys.platform.startswith("linux"):
+        print("Error the benchmark reads /proc/self/io and only runs on Linux")
+        return 1
+    args = parse_args()
+    global sync_counter
+    sync_counter = SyncCounter()
+    work_top = tempfile.mkdtemp(prefix="initiocs-bench-")
+    drivers = driver_names(args.drivers)
+    results = {}
+    try:
+        build_template(work_top + "/ioc-template", drivers)
+        build_binaries(work_top + "/epics", drivers)
+        for num_iocs in args.sizes:
+            result = run_size_quietly(work_top, "run-{}".format(num_iocs), drivers, num_iocs, args.mode, args.keep)
+            # tracemalloc hooks every allocation, so peak Python memory comes from a separate pass
+            tracemalloc.start()
+            try:
+                traced = run_size_quietly(work_top, "traced-{}".format(num_iocs), drivers, num_iocs, args.mode, args.keep)
+            finally:
+                tracemalloc.stop()
+            for phase in PHASES:
+                result["phases"][phase]["peak_python"] = traced["phases"][phase]["peak_python"]
+            print_results(num_iocs, result)
+            results[str(num_iocs)] = result
+    finally:
+        if args.keep:
+            print("Kept benchmark files in {}".format(work_top))
+        else:
+            initiocs.remove_tree(work_top)
+    if args.json is not None:
+        with open(args.json, "w") as report:
+            json.dump({"version": initiocs.version, "mode": args.mode, "drivers": args.drivers, "sizes": results}, report, indent=1)
+        print("Wrote benchmark results to {}".format(args.json))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
 from tkinter import *
-import os
-import re
-import subprocess
-from sys import platform
+from tkinter import ttk
+from tkinter import messagebox
+from tkinter import filedialog
+import sys
+import time
+import queue
+import threading
+import traceback
+# the IOC generation pipeline, which does not depend on tkinter
+from initiocs import *
 
-# version number
-version = "v0.0.2"
+# milliseconds the GUI waits after the last edit before saving CONFIGURE
+AUTOSAVE_DELAY_MS = 1500
 
 
 
@@ -50,473 +56,286 @@ def CreateToolTip(widget, text):
     widget.bind('<Leave>', leave)
 
 
-class IOCAction:
-
-
+class IOCTable(Frame):
     """
-    Helper class that stores information and functions for each IOC in the CONFIGURE file
+    Table of the IOC rows of a ConfigModel. Rows are edited in place and every change is applied
+    to the IOCRow it belongs to, so the model is always what is shown. Every row is a single
+    Treeview item, created once when the row is added, instead of a row of Entry widgets, and the
+    only cell widget is the editor opened on a double click. Sorting and filtering only reorder and
+    detach the existing items instead of rebuilding the table. Rows are not windowed, every IOC
+    keeps its item whether it is scrolled into view or not.
 
     Attributes
     ----------
-    ioc_type : str
-        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
-    ioc_name : str
-        name of the IOC ex. cam-ps1
-    ioc_port : str
-        telnet port on which procserver will run the IOC
-    connection : str
-        Value used to connect to the device ex. IP, serial num. etc.
-    ioc_num : int
-        Counter that keeps track of which IOC it is
+    model : ConfigModel
+        model whose iocs are shown
+    tree : ttk.Treeview
+        the table, one item per IOCRow
+    rows : dict of str -> IOCRow
+        row of every item
+    on_change : callable()
+        optional callback, called after rows were added, edited or deleted
+    template_index : TemplateIndex
+        index used to flag IOC types without a startup script, None to skip this check
+    issues : dict of str -> list of (str, str)
+        severity and message of the validation issues of every flagged item
 
     Methods
     -------
-    process(ioc_top : str, bin_loc : str, bin_flat : bool)
-        clones ioc-template instance, sets up appropriate st.cmd.
-    update_unique(ioc_top : str, bin_loc : str, bin_flat : bool, prefix : str, engineer : str, hostname : str, ca_ip : str)
-        Updates unique.cmd file with all of the required configuration options
-    update_config(ioc_top : str, hostname : str)
-        updates the config file with appropriate options
-    fix_env_paths(ioc_top: str, bin_flat : bool)
-        fixes the existing envpaths with new locations
-    getIOCbin(bin_loc : str, bin_flat : bool)
-        finds the path to the binary for the IOC based on binary top location
-    cleanup(ioc_top : str)
-        runs cleanup.sh script to remove unwanted files in generated IOC.
+    add_rows(rows : list of IOCRow)
+        appends rows to the model and the table
+    refresh()
+        reapplies the sort order and filter
+    sort_by(field : str)
+        sorts by a column, sorting by it again reverses the order
+    edit_cell(event)
+        opens an editor over the double-clicked cell
+    delete_selected()
+        removes the selected rows from the model and the table
+    validate()
+        runs validate_iocs and flags the offending rows
     """
 
-    def __init__(self, ioc_type, ioc_name, ioc_port, connection, ioc_num):
-        """
-        Constructor for the IOCAction class
-
-        Parameters
-        ----------
-        ioc_type : str
-        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
-        ioc_name : str
-            name of the IOC ex. cam-ps1
-        ioc_port : str
-            telnet port on which procserver will run the IOC
-        connection : str
-            Value used to connect to the device ex. IP, serial num. etc.
-        ioc_num : int
-            Counter that keeps track of which IOC it is
-        """
-
-        self.ioc_type = ioc_type
-        self.ioc_name = ioc_name
-        self.ioc_port = ioc_port
-        self.connection = connection
-        self.ioc_num = ioc_num
-    
-
-    def process(self, ioc_top, bin_loc, bin_flat):
+    # columns that can be used for filtering, All matches any of them
+    FILTER_FIELDS = ["All", "ioc_type", "ioc_name", "ioc_port", "host"]
+
+    def __init__(self, master, model, on_change=None, template_index=None):
+        Frame.__init__(self, master)
+        self.model = model
+        self.on_change = on_change
+        self.template_index = template_index
+        self.issues = {}
+        self.setting_issues = []
+        self.rows = {}
+        self.sort_field = None
+        self.sort_reverse = False
+        self.editor = None
+
+        filter_bar = Frame(self)
+        filter_bar.pack(fill=X)
+        Label(filter_bar, text="Filter").pack(side=LEFT)
+        self.filter_field = StringVar(value="All")
+        field_box = ttk.Combobox(filter_bar, textvariable=self.filter_field, values=self.FILTER_FIELDS, state="readonly", width=10)
+        field_box.pack(side=LEFT)
+        self.filter_text = StringVar()
+        Entry(filter_bar, textvariable=self.filter_text).pack(side=LEFT, fill=X, expand=TRUE)
+        self.filter_text.trace_add("write", lambda *args: self.refresh())
+        self.filter_field.trace_add("write", lambda *args: self.refresh())
+
+        # validation messages of the selected rows
+        self.status = Label(self, anchor=W, justify=LEFT)
+        self.status.pack(side=BOTTOM, fill=X)
+
+        self.tree = ttk.Treeview(self, columns=IOC_ROW_FIELDS, show="headings", height=10)
+        for field, column in zip(IOC_ROW_FIELDS, IOC_ROW_COLUMNS):
+            self.tree.heading(field, text=column, command=lambda field=field: self.sort_by(field))
+            self.tree.column(field, width=140)
+        scrollbar = Scrollbar(self, orient=VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=TRUE)
+        self.tree.bind("<Double-1>", self.edit_cell)
+        self.tree.bind("<Delete>", lambda event: self.delete_selected())
+        self.tree.bind("<<TreeviewSelect>>", lambda event: self.show_issues())
+        self.tree.tag_configure(VALIDATION_ERROR, background="#f4c7c3")
+        self.tree.tag_configure(VALIDATION_WARNING, background="#fce8b2")
+
+        for row in self.model.iocs:
+            self.insert_row(row)
+        self.validate()
+
+
+    def insert_row(self, row):
+        """ Function that adds an item for a row already in the model """
+
+        iid = self.tree.insert("", END, values=row.fields())
+        self.rows[iid] = row
+        return iid
+
+
+    def add_rows(self, rows):
         """
-        Function that clones ioc-template, and pulls correct st.cmd from startupScripts folder
-        The binary for the IOC is also identified and inserted into st.cmd
+        Function that appends rows to the model and the table
 
         Parameters
         ----------
-        ioc_top : str
-            Path to the top directory to contain generated IOCs
-        bin_loc : str
-            path to top level of binary distribution
-        bin_flat : bool
-            flag for deciding if binaries are flat or stacked
-
-        Returns
-        -------
-        int
-            -1 if error, 0 if success
+        rows : list of IOCRow
+            rows to add
         """
 
-        print("-------------------------------------------")
-        print("Setup process for IOC " + self.ioc_name)
-        print("-------------------------------------------")
-        out = subprocess.call(["git", "clone", "--quiet", "https://github.com/epicsNSLS2-deploy/ioc-template", ioc_top + "/" + self.ioc_name])
-        if out != 0:
-            print("Error failed to clone IOC template for ioc {}".format(self.ioc_name))
-            return -1
-        else:
-            print("IOC template cloned, converting st.cmd")
-            ioc_path = ioc_top +"/" + self.ioc_name
-            os.remove(ioc_path+"/st.cmd")
-
-            startup_path = ioc_path+"/startupScripts"
-            startup_type = self.ioc_type[2:].lower()
-
-            found = False
-
-            for file in os.listdir(ioc_path +"/startupScripts"):
-                if startup_type in file.lower():
-                    startup_path = startup_path + "/" + file
-                    found = True
-                    break
-            if not found:
-                print('ERROR - {} is not yet supported by initIOCs, skipping'.format(self.ioc_type))
-                return -1
-            
-            example_st = open(startup_path, "r+")
-            st = open(ioc_path+"/st.cmd", "w+")
-
-            line = example_st.readline()
-
-            while line:
-                if "#!" in line:
-                    st.write("#!" + self.getIOCBin(bin_loc, bin_flat) + "\n")
-                elif "envPaths" in line:
-                    st.write("< envPaths\n")
-                else:
-                    st.write(line)
-
-                line = example_st.readline()
+        self.model.add_rows(rows)
+        for row in rows:
+            self.insert_row(row)
+        if self.sort_field is not None or self.filter_text.get() != "":
+            self.refresh()
+        self.changed()
 
-            example_st.close()
-            st.close()
-
-            autosave_path = ioc_path + "/autosaveFiles"
-            autosave_type = self.ioc_type[2:].lower()
-            if os.path.exists(autosave_path + "/" + autosave_type + "_auto_settings.req"):
-                print("Generating auto_settings.req file for IOC {}.".format(self.ioc_name))
-                os.rename(autosave_path + "/" + autosave_type + "_auto_settings.req", ioc_path + "/auto_settings.req")
-            else:
-                print("Could not find supported auto_settings.req file for IOC {}.".format(self.ioc_name))
 
-            if os.path.exists(ioc_path + "/dependancyFiles"):
-                for file in os.listdir(ioc_path + "/dependancyFiles"):
-                    if startup_type in file.lower():
-                        print('Copying dependency file {} for {}'.format(file, self.ioc_type))
-                        os.rename(ioc_path + "/dependancyFiles/" + file, ioc_path + "/" + file)
+    def changed(self):
+        """ Function that revalidates the rows and notifies on_change that the model was modified """
 
-            return 0
+        self.validate()
+        if self.on_change is not None:
+            self.on_change()
 
 
-    def update_unique(self, ioc_top, bin_loc, bin_flat, prefix, engineer, hostname, ca_ip):
-        """
-        Function that updates the unique.cmd file with all of the required configurations
-
-        Parameters
-        ----------
-        ioc_top : str
-            Path to the top directory to contain generated IOCs
-        bin_loc : str
-            path to top level of binary distribution
-        bin_flat : bool
-            flag for deciding if binaries are flat or stacked
-        prefix : str
-            Prefix given to the IOC
-        engineer : str
-            Name of the engineer deploying the IOC
-        hostname : str
-            name of the host IOC server on which the IOC will run
-        ca_ip : str
-            Channel Access IP address
+    def validate(self):
         """
-
-        if os.path.exists(ioc_top + "/" + self.ioc_name +"/unique.cmd"):
-            print("Updating unique file based on configuration")
-            unique_path = ioc_top + "/" + self.ioc_name +"/unique.cmd"
-            unique_old_path = ioc_top +"/" + self.ioc_name +"/unique_OLD.cmd"
-            os.rename(unique_path, unique_old_path)
-
-            uq_old = open(unique_old_path, "r")
-            uq = open(unique_path, "w")
-            line = uq_old.readline()
-            while line:
-                if not line.startswith('#'):
-                    if "SUPPORT_DIR" in line:
-                        if bin_flat:
-                            uq.write('epicsEnvSet("SUPPORT_DIR", "{}")\n'.format(bin_loc))
-                        else:
-                            uq.write('epicsEnvSet("SUPPORT_DIR", "{}")\n'.format(bin_loc + "/support"))
-                    elif "ENGINEER" in line:
-                        uq.write('epicsEnvSet("ENGINEER", "{}")\n'.format(engineer))
-                    elif "CAM-CONNECT" in line:
-                        uq.write('epicsEnvSet("CAM-CONNECT", "{}")\n'.format(self.connection))
-                    elif "HOSTNAME" in line:
-                        uq.write('epicsEnvSet("HOSTNAME", "{}")\n'.format(hostname))
-                    elif "PREFIX" in line and "CTPREFIX" not in line:
-                        uq.write('epicsEnvSet("PREFIX", "{}")\n'.format(prefix + "{{{}}}".format(self.ioc_type[2:] +"-Cam:{}".format(self.ioc_num))))
-                    elif "CTPREFIX" in line:
-                        uq.write('epicsEnvSet("CTPREFIX", "{}")\n'.format(prefix + "{{{}}}".format(self.ioc_type[2:] +"-Cam:{}".format(self.ioc_num))))
-                    elif "IOCNAME" in line:
-                        uq.write('epicsEnvSet("IOCNAME", "{}")\n'.format(self.ioc_name))
-                    elif "EPICS_CA_ADDR_LIST" in line:
-                        uq.write('epicsEnvSet("EPICS_CA_ADDR_LIST", "{}")\n'.format(ca_ip))
-                    elif "IOC" in line and "IOCNAME" not in line:
-                        uq.write('epicsEnvSet("IOC", "{}")\n'.format("ioc"+self.ioc_type))
-                    elif "PORT" in line:
-                        uq.write('epicsEnvSet("PORT", "{}")\n'.format(self.ioc_type[2:]+"1"))
-                    else:
-                        uq.write(line)
-                else:
-                    uq.write(line)
-                line = uq_old.readline()
-
-            uq_old.close()
-            uq.close()
-        else:
-            print("No unique file found, proceeding to next step")
-
-
-    def update_config(self, ioc_top, hostname):
+        Function that checks every row with validate_iocs and flags the offending ones, only items
+        whose flag changed are updated. Listening ports are only checked when generating.
         """
-        Function that updates the config file with the correct IOC name, port, and hostname
 
-        Parameters
-        ----------
-        ioc_top : str
-            Path to the top directory to contain generated IOCs
-        hostname : str
-            name of the host IOC server on which the IOC will run
-        """
-
-        conf_path = ioc_top + "/" + self.ioc_name + "/config"
-        if os.path.exists(conf_path):
-            print("Updating config file for procServer connection")
-            conf_old_path = ioc_top + "/" + self.ioc_name + "/config_OLD"
-            os.rename(conf_path, conf_old_path)
-            cn_old = open(conf_old_path, "r")
-            cn = open(conf_path, "w")
-            line = cn_old.readline()
-            while line:
-                if "NAME" in line:
-                    cn.write("NAME={}\n".format(self.ioc_name))
-                elif "PORT" in line:
-                    cn.write("PORT={}\n".format(self.ioc_port))
-                elif "HOST" in line:
-                    cn.write("HOST={}\n".format(hostname))
-                else:
-                    cn.write(line)
-                line = cn_old.readline()
-            cn_old.close()
-            cn.close()
+        iids = dict([(id(row), iid) for iid, row in self.rows.items()])
+        issues = {}
+        self.setting_issues = []
+        for row, field, severity, message in validate_iocs(self.model.iocs, self.model.configuration(),
+                self.template_index, check_listening=False):
+            if row is None:
+                self.setting_issues.append((severity, message))
+            else:
+                issues.setdefault(iids[id(row)], []).append((severity, message))
+        for iid in set(self.issues) | set(issues):
+            if iid not in self.rows:
+                continue
+            severities = [severity for severity, message in issues.get(iid, [])]
+            tag = VALIDATION_ERROR if VALIDATION_ERROR in severities else VALIDATION_WARNING if severities else ""
+            if tuple(self.tree.item(iid, "tags")) != ((tag,) if tag else ()):
+                self.tree.item(iid, tags=(tag,) if tag else ())
+        self.issues = issues
+        self.show_issues()
+
+
+    def show_issues(self):
+        """ Function that shows the issues of the selected rows, or a count of all issues if none are selected """
+
+        messages = [message for severity, message in self.setting_issues]
+        selected = [iid for iid in self.tree.selection() if iid in self.issues]
+        if len(selected) > 0:
+            for iid in selected:
+                messages.extend(["{}: {}".format(self.rows[iid].ioc_name, message) for severity, message in self.issues[iid]])
+        elif len(self.issues) > 0:
+            messages.append("{} IOCs have problems, select one to see them".format(len(self.issues)))
+        self.status.configure(text="\n".join(messages))
+
+
+    def sort_key(self, row):
+        """ Function that returns the key a row is sorted by, ports are compared as numbers """
+
+        value = getattr(row, self.sort_field)
+        if self.sort_field == "ioc_port" and value.isdigit():
+            return (0, int(value), "")
+        return (1, 0, value.lower())
+
+
+    def matches(self, row):
+        """ Function that checks if a row passes the filter """
+
+        text = self.filter_text.get().strip().lower()
+        if text == "":
+            return True
+        field = self.filter_field.get()
+        if field == "All":
+            return any(text in getattr(row, name).lower() for name in self.FILTER_FIELDS[1:])
+        return text in getattr(row, field).lower()
+
+
+    def refresh(self):
+        """ Function that shows the rows passing the filter in sort order, hidden rows are only detached """
+
+        iids = list(self.rows)
+        if self.sort_field is not None:
+            iids.sort(key=lambda iid: self.sort_key(self.rows[iid]), reverse=self.sort_reverse)
         else:
-            print("No config file found moving to next step")
-
+            # model order
+            positions = dict((id(row), index) for index, row in enumerate(self.model.iocs))
+            iids.sort(key=lambda iid: positions[id(self.rows[iid])])
+        self.tree.set_children("", *[iid for iid in iids if self.matches(self.rows[iid])])
 
-    def fix_env_paths(self, ioc_top, bin_flat):
-        """
-        Function that fixes the envPaths file if binaries are not flat
-
-        Parameters
-        ----------
-        ioc_top : str
-            Path to the top directory to contain generated IOCs
-        bin_flat : bool
-            flag for deciding if binaries are flat or stacked
-        """
-
-        env_path = ioc_top + "/" + self.ioc_name + "/envPaths"
-        if os.path.exists(env_path):
-            env_old_path = ioc_top + "/" + self.ioc_name + "/envPaths_OLD"
-            os.rename(env_path, env_old_path)
-            env_old = open(env_old_path, "r")
-            env = open(env_path, "w")
-            line = env_old.readline()
-            while line:
-                if "EPICS_BASE" in line and not bin_flat:
-                    print("Fixing base location in envPaths")
-                    env.write('epicsEnvSet("EPICS_BASE", "$(SUPPORT)/../base")\n')
-                else:
-                    env.write(line)
-                line = env_old.readline()
-            env_old.close()
-            env.close()
 
+    def sort_by(self, field):
+        """ Function that sorts by a column, sorting by the same column again reverses the order """
 
-    def getIOCBin(self, bin_loc, bin_flat):
-        """
-        Function that identifies the IOC binary location based on its type and the binary structure
-
-        Parameters
-        ----------
-        bin_loc : str
-            path to top level of binary distribution
-        bin_flat : bool
-            flag for deciding if binaries are flat or stacked
-        
-        Return
-        ------
-        driver_path : str
-            Path to the IOC executable located in driverName/iocs/IOC/bin/OS/driverApp
-        """
-
-        if bin_flat:
-            # if flat, there is no support directory
-            driver_path = bin_loc + "/areaDetector/" + self.ioc_type
+        if self.sort_field == field:
+            self.sort_reverse = not self.sort_reverse
         else:
-            driver_path = bin_loc + "/support/areaDetector/" + self.ioc_type
-        # identify the IOCs folder
-        for name in os.listdir(driver_path):
-            if "ioc" == name or "iocs" == name:
-                driver_path = driver_path + "/" + name
-                break
-        # identify the IOC 
-        for name in os.listdir(driver_path):
-            if "IOC" in name or "ioc" in name:
-                driver_path = driver_path + "/" + name
-                break 
-        # Find the bin folder
-        driver_path = driver_path + "/bin"
-        # There should only be one architecture
-        for name in os.listdir(driver_path):
-            driver_path = driver_path + "/" + name
-            break
-        # We look for the executable that ends with App
-        for name in os.listdir(driver_path):
-            if 'App' in name:
-                driver_path = driver_path + "/" + name
-                break
-
-        return driver_path
-
-
-    def cleanup(self, ioc_top):
-        """ Function that runs the cleanup.sh/cleanup.bat script in ioc-template to remove unwanted files """
-
-        cleanup_completed = False
+            self.sort_field = field
+            self.sort_reverse = False
+        self.refresh()
 
-        if platform == "linux":
-            if(os.path.exists(ioc_top + "/" + self.ioc_name + "/cleanup.sh")):
-                print("Performing cleanup for {}".format(self.ioc_name))
-                out = subprocess.call(["bash", ioc_top + "/" + self.ioc_name + "/cleanup.sh"])
-                print()
-                cleanup_completed = True
-        elif platform == "win32":
-            if(os.path.exists(ioc_top + "/" + self.ioc_name + "/cleanup.bat")):
-                print("Performing cleanup for {}".format(self.ioc_name))
-                out = subprocess.call([ioc_top + "/" + self.ioc_name + "/cleanup.bat"])
-                print()
-                cleanup_completed = True
-        if os.path.exists(ioc_top +"/" + self.ioc_name + "/st.cmd"):
-            os.chmod(ioc_top +"/" + self.ioc_name + "/st.cmd", 0o755)
-        if not cleanup_completed:
-            print("No cleanup script found, using outdated version of IOC template")
 
+    def edit_cell(self, event):
+        """ Function that opens an entry over the double-clicked cell, Return applies the edit and Escape discards it """
 
-#-------------------------------------------------
-#----------------MAIN SCRIPT FUNCTIONS------------
-#-------------------------------------------------
-
-
-def read_ioc_config():
-    """
-    Function for reading the CONFIGURE file. Returns a dictionary of configure options,
-    a list of IOCAction instances, and a boolean representing if binaries are flat or not
-
-    Returns
-    -------
-    ioc_actions : List of IOCAction
-        list of IOC actions that need to be performed.
-    configuration : dict of str -> str
-        Dictionary containing all options read from configure
-    bin_flat : bool
-        toggle for flat or stacked binary directory structure
-    """
-
-    ioc_config_file = open("CONFIGURE.txt", "r+")
-    ioc_actions = []
-    configuration = {}
-    bin_flat = True
-    ioc_num_counter = 1
-
-    line = ioc_config_file.readline()
-    while line:
-        if "=" in line and not line.startswith('#') and "BINARIES_FLAT" not in line:
-            line = line.strip()
-            split = line.split('=')
-            configuration[split[0]] = split[1]
-        elif "BINARIES_FLAT" in line:
-            if "NO" in line:
-                bin_flat = False
-        elif not line.startswith('#') and len(line) > 1:
-            line = line.strip()
-            line = re.sub(' +', ' ', line)
-            temp = line.split(' ')
-            ioc_action = IOCAction(temp[0], temp[1], temp[2], temp[3], ioc_num_counter)
-            ioc_num_counter = ioc_num_counter + 1
-            ioc_actions.append(ioc_action)
-
-        line = ioc_config_file.readline()
-
-    ioc_config_file.close()
-    return ioc_actions, configuration, bin_flat
-
-
-def init_ioc_dir(ioc_top):
-    """
-    Function that creates ioc directory if it has not already been created.
-
-    Parameters
-    ----------
-    ioc_top : str
-        Path to the top directory to contain generated IOCs
-    """
-
-    if ioc_top == "":
-        print("Error: IOC top not initialized")
-        exit()
-    elif os.path.exists(ioc_top) and os.path.isdir(ioc_top):
-        print("IOC Dir already exits.")
-        print()
-    else:
-        os.mkdir(ioc_top)
-
-
-def print_start_message():
-    """
-    Function for printing initial message
-    """
-
-    print("+----------------------------------------------------------------+")
-    print("+ initIOCs, Version: " + version +"                                      +")
-    print("+ Author: Jakub Wlodek                                           +")
-    print("+ Copyright (c): Brookhaven National Laboratory 2018-2019        +")
-    print("+ This software comes with NO warranty!                          +")
-    print("+----------------------------------------------------------------+")
-    print()
-
-
-def init_iocs():
-    """
-    Main driver function. First calls read_ioc_config, then for each instance of IOCAction
-    perform the process, update_unique, update_config, fix_env_paths, and cleanup functions
-    """
-
-    print_start_message()
-    actions, configuration, bin_flat = read_ioc_config()
-    init_ioc_dir(configuration["IOC_DIR"])
-    for action in actions:
-        out = action.process(configuration["IOC_DIR"], configuration["TOP_BINARY_DIR"], bin_flat)
-        if out == 0:
-            action.update_unique(configuration["IOC_DIR"], configuration["TOP_BINARY_DIR"], bin_flat,
-                configuration["PREFIX"], configuration["ENGINEER"], configuration["HOSTNAME"], 
-                configuration["CA_ADDRESS"])
-            action.update_config(configuration["IOC_DIR"], configuration["HOSTNAME"])
-            action.fix_env_paths(configuration["IOC_DIR"], bin_flat)
-            action.cleanup(configuration["IOC_DIR"])
+        if self.editor is not None:
+            self.editor.destroy()
+            self.editor = None
+        iid = self.tree.identify_row(event.y)
+        column = self.tree.identify_column(event.x)
+        if iid == "" or column in ["", "#0"]:
+            return
+        bbox = self.tree.bbox(iid, column)
+        if bbox == "":
+            return
+        field = IOC_ROW_FIELDS[int(column[1:]) - 1]
+        x, y, width, height = bbox
+        editor = Entry(self.tree)
+        editor.insert(0, getattr(self.rows[iid], field))
+        editor.select_range(0, END)
+        editor.place(x=x, y=y, width=width, height=height)
+        editor.focus_set()
+        # events of an editor that was already replaced are ignored
+        editor.bind("<Return>", lambda event: self.apply_edit(editor, iid, field))
+        editor.bind("<FocusOut>", lambda event: self.apply_edit(editor, iid, field))
+        editor.bind("<Escape>", lambda event: self.close_editor())
+        self.editor = editor
 
-def init_iocs_GUI(actions, configuration, bin_flat):
-    for action in actions:
-        print("I am in here " +  configuration[0])
-        print(bin_flat)
-        out = action.process(configuration[0], configuration[1], bin_flat)
-        if out == 0:
-            action.update_unique(configuration[0], configuration[1], bin_flat,
-                configuration[3], configuration[4], configuration[5], 
-                configuration[6])
-            action.update_config(configuration[1], configuration[5])
-            action.fix_env_paths(configuration[1], bin_flat)
-            action.cleanup(configuration[1])
 
+    def close_editor(self):
+        """ Function that removes the cell editor """
 
+        if self.editor is not None:
+            editor = self.editor
+            self.editor = None
+            editor.destroy()
 
 
+    def apply_edit(self, editor, iid, field):
+        """ Function that validates the edited value and writes it to the row and the table """
 
+        if editor is not self.editor or iid not in self.rows:
+            return
+        value = editor.get().strip()
+        self.close_editor()
+        row = self.rows[iid]
+        if value == getattr(row, field):
+            return
+        values = row.fields()
+        index = IOC_ROW_FIELDS.index(field)
+        values[index] = value
+        errors = [message for column, message in check_ioc_values(values) if column == index]
+        # the host is the only optional column, empty means IOC_DIR on this machine
+        if (value == "" and field != "host") or len(value.split()) > 1:
+            errors.append("{} must be a single word".format(IOC_ROW_COLUMNS[index]))
+        if len(errors) > 0:
+            messagebox.showerror("Invalid IOC", "\n".join(errors))
+            return
+        setattr(row, field, value)
+        self.tree.set(iid, field, value)
+        self.changed()
 
 
+    def delete_selected(self):
+        """ Function that removes the selected rows from the model and the table """
 
+        selected = self.tree.selection()
+        if len(selected) == 0:
+            return
+        removed = set(id(self.rows[iid]) for iid in selected)
+        self.model.iocs = [row for row in self.model.iocs if id(row) not in removed]
+        self.tree.delete(*selected)
+        for iid in selected:
+            del self.rows[iid]
+        self.changed()
 
 
 class Window(Frame):
@@ -531,45 +350,37 @@ class Window(Frame):
         #reference to the master widget, which is the tk window                 
         self.master = master
 
+        # background generation state, the worker only talks to Tk through progress_queue
+        self.worker = None
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+
+        # pending autosave, edits only save CONFIGURE once they stop for AUTOSAVE_DELAY_MS
+        self.autosave_job = None
+
         #with that, we want to then run init_window, which doesn't yet exist
         self.init_window()
     
 
     #Creation of init_window
     def init_window(self):
-        check = False
-        check2 = False 
-        arr = []
-        iocActions = []
-        configfile = Text(wrap=WORD, width=100, height= 10)
-        with open("CONFIGURE.txt", 'r+') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("#------------MAIN"):
-                    check = True
-                if check == True and  line != "":
-                    arr.append(line)
-                if line.startswith("# IOC Type"):
-                    check = False
-                    configfile.insert(INSERT, line)
-                    configfile.pack(fill="none", expand=TRUE, side = RIGHT)
-                if line.startswith("AD"):
-                    configfile.insert(END, "\n")
-                    configfile.insert(END, line)
-                    configfile.pack(fill="none", expand=TRUE, side = RIGHT)
-                    iocActions.append(self.iocActionMaker(line))
-                if line.startswith("#------------ADDITIONAL"):
-                    check2 = True
-                if check2 == True and line != "":
-                    arr.append(line)
-        
-        commentArray = []
-        fillinArray = []
-        for i in range(len(arr)):
-            if arr[i].startswith("#"):
-                commentArray.append(arr[i])
-            if arr[i].startswith("#") != True:
-                fillinArray.append(arr[i])
+        try:
+            self.model = parse_configure()
+        except ConfigError as err:
+            print(err)
+            messagebox.showerror("Error reading CONFIGURE file", str(err))
+            exit()
+
+        # the table edits the model directly, IOCActions are created from it when generating
+        self.ioc_table = IOCTable(self.master, self.model, on_change=self.schedule_autosave,
+            template_index=load_template_index(self.model.configuration()))
+        self.ioc_table.pack(fill=BOTH, expand=TRUE, side = RIGHT)
+
+        # settings without an entry (template location etc.) are passed through as is
+        self.template_configuration = {}
+        for key, entry in self.model.entries.items():
+            if key not in GUI_CONFIGURATION_KEYS:
+                self.template_configuration[key] = entry.value
 
 
 
@@ -583,38 +394,35 @@ class Window(Frame):
         status7 = StringVar()
 
 
-        stringInfo = fillinArray[0]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("IOC_DIR")
+        strLable = entry.key
 
         ioc_Lable = Label(root, text = strLable)
         ioc_Lable.pack()
         ioc_Lable.place(x=0, y=0)
 
-        strEntry = str(r[1])
+        strEntry = entry.value
         ioc_dir = Entry(root, textvariable = status1)
         ioc_dir.pack()
         ioc_dir.place(x=50, y=0)
         ioc_dir.insert(0, strEntry)
         
-        stringInfo = fillinArray[1]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("TOP_BINARY_DIR")
+        strLable = entry.key
         top_Lable = Label(root, text=strLable)
         top_Lable.pack()
         top_Lable.place(x=1, y = 30)
 
-        CreateToolTip(ioc_dir, commentArray[1])
+        CreateToolTip(ioc_dir, self.model.get_entry("IOC_DIR").comment_text())
         
-        strEntry = str(r[1])
+        strEntry = entry.value
         top_binary = Entry(root, textvariable = status2)
         top_binary.pack()
         top_binary.place(x = 100, y = 30)
         top_binary.insert(0,strEntry)
 
-        stringInfo = fillinArray[2]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("BINARIES_FLAT")
+        strLable = entry.key
 
 
         
@@ -622,8 +430,8 @@ class Window(Frame):
         binary_Label.pack()
         binary_Label.place(x = 2, y = 60)
 
-        CreateToolTip(top_binary, commentArray[2])
-        strEntry = str(r[1])
+        CreateToolTip(top_binary, self.model.get_entry("TOP_BINARY_DIR").comment_text())
+        strEntry = entry.value
         binary_flat = Entry(root,textvariable=status3)
         binary_flat.pack()
         binary_flat.place(x = 90 , y = 60)
@@ -631,30 +439,28 @@ class Window(Frame):
         
 
         
-        stringInfo = fillinArray[3]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("PREFIX")
+        strLable = entry.key
 
-        CreateToolTip(binary_flat, commentArray[3])
+        CreateToolTip(binary_flat, self.model.get_entry("BINARIES_FLAT").comment_text())
         prefix_Label = Label(root, text=strLable)
         prefix_Label.pack()
         prefix_Label.place(x=3, y= 90)
 
-        strEntry = str(r[1])
+        strEntry = entry.value
         prefix = Entry(root, textvariable=status4)
         prefix.pack()
         prefix.insert(0,strEntry)
         prefix.place(x = 45 , y = 90)
 
-        doubleComment = commentArray[4] + "\n" +commentArray[5]
+        doubleComment = self.model.get_entry("PREFIX").comment_text()
 
         CreateToolTip(prefix, doubleComment)
 
         
         
-        stringInfo = fillinArray[4]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("ENGINEER")
+        strLable = entry.key
 
         engineer_label = Label(root, text=strLable)
         engineer_label.pack()
@@ -662,36 +468,34 @@ class Window(Frame):
 
         
 
-        strEntry = str(r[1])
+        strEntry = entry.value
         engineer = Entry(root, textvariable=status5)
         engineer.pack()
         engineer.insert(0,strEntry)
         engineer.place(x=65, y=110)
 
-        CreateToolTip(engineer, commentArray[12])
+        CreateToolTip(engineer, self.model.get_entry("ENGINEER").comment_text())
         
 
         
-        stringInfo = fillinArray[5]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("HOSTNAME")
+        strLable = entry.key
 
         hostname_label = Label(root, text=strLable)
         hostname_label.pack()
         hostname_label.place(x=5,y=140)
 
-        strEntry = str(r[1])
+        strEntry = entry.value
         hostname = Entry(root,textvariable=status6)
         hostname.pack()
         hostname.insert(0,strEntry)
         hostname.place(x = 75, y = 140)
         
-        CreateToolTip(hostname, commentArray[13])
+        CreateToolTip(hostname, self.model.get_entry("HOSTNAME").comment_text())
 
         
-        stringInfo = fillinArray[6]
-        r = stringInfo.split("=")
-        strLable = str(r[0])
+        entry = self.model.get_entry("CA_ADDRESS")
+        strLable = entry.key
 
         ca_address_label = Label(root, text=strLable)
         ca_address_label.pack()
@@ -699,13 +503,18 @@ class Window(Frame):
 
        
 
-        strEntry = str(r[1])
+        strEntry = entry.value
         ca_address = Entry(root,textvariable=status7)
         ca_address.pack()
         ca_address.insert(0,strEntry)
         ca_address .place(x=80, y=170)
 
-        CreateToolTip(ca_address, commentArray[14])
+        CreateToolTip(ca_address, self.model.get_entry("CA_ADDRESS").comment_text())
+
+        # traced only now, so filling in the entries above does not count as an edit
+        for key, status in zip(GUI_CONFIGURATION_KEYS, [status1, status2, status3, status4, status5, status6, status7]):
+            status.trace_add("write", lambda *args, key=key, status=status: self.setting_changed(key, status.get()))
+        self.master.protocol("WM_DELETE_WINDOW", self.client_exit)
    
         #v1 = StringVar()
         #v2 = StringVar()
@@ -718,19 +527,32 @@ class Window(Frame):
         self.pack(fill=BOTH, expand=1)
 
         # creating a button instance
-        saveButton = Button(self, text="Save",command=lambda: self.save(configfile)) 
-        runButton = Button(self, text="Run", command=lambda: self.exe(status1,status2,status3,status4,status5,status6,status7,iocActions))
-        addButton = Button(self, text = "Add IOC", command=lambda: iocActions.append(self.add_ioc(configfile,iocActions)))
+        saveButton = Button(self, text="Save",command=self.save)
+        runButton = Button(self, text="Run", command=lambda: self.run(status1,status2,status3,status4,status5,status6,status7))
+        addButton = Button(self, text = "Add IOC", command=lambda: self.add_ioc(self.ioc_table))
+        importButton = Button(self, text = "Import IOCs", command=lambda: self.import_iocs(self.ioc_table))
 
         # placing the button on my window
         addButton.place(x = 600, y = 150)
         addButton.pack()
+        importButton.pack()
         #saveButton.place(x=10, y=20)
         runButton.place(x=10, y=40)
         runButton.pack()
-        #saveButton.pack()
+        saveButton.pack()
         #advanceButton.place(x=200, y =2)
 
+    def run(self, *statuses):
+        """ Function that numbers the IOCs and fills in auto ports, then starts generating them """
+
+        try:
+            iocActions = self.model.make_actions()
+        except ConfigError as err:
+            messagebox.showerror("Error allocating IOC ports", str(err))
+            return
+        self.exe(*statuses, iocActions)
+
+
     def exe(self,status1,status2,status3,status4,status5,status6, status7, iocActions):
         bin_flats = False
         configurations = []
@@ -748,34 +570,183 @@ class Window(Frame):
         elif configurations[2] == "YES":
             bin_flats = True
 
-        init_iocs_GUI(iocActions,configurations,bin_flats)
+        if self.worker is not None and self.worker.is_alive():
+            print("IOC generation is already running")
+            return
 
+        self.cancel_event = threading.Event()
+        self.progress_queue = queue.Queue()
+        self.show_progress(iocActions)
+        self.worker = threading.Thread(target=self.run_generation, args=(list(iocActions), configurations, bin_flats), daemon=True)
+        self.worker.start()
+        self.after(100, self.poll_progress)
+
+
+    def run_generation(self, iocActions, configurations, bin_flats):
+        """ Runs on the worker thread, all updates are passed to the Tk thread through progress_queue """
+
+        def progress(action, stage):
+            self.progress_queue.put(("stage", action, stage, time.time()))
+
+        results = None
+        try:
+            results = init_iocs_GUI(iocActions, configurations, bin_flats, self.template_configuration,
+                progress=progress, cancel_event=self.cancel_event, config_path=self.model.path)
+        except ConfigError as err:
+            print(err)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            # always posted, otherwise the progress window would wait forever
+            self.progress_queue.put(("done", results, None, time.time()))
+
+
+    def show_progress(self, iocActions):
+        """ Opens the window with one row per IOC showing its current stage and elapsed time """
+
+        self.progress_window = Toplevel(self.master)
+        self.progress_window.wm_title("Generating IOCs")
+        self.progress_tree = ttk.Treeview(self.progress_window, columns=("stage", "elapsed"), height=15)
+        self.progress_tree.heading("#0", text="IOC")
+        self.progress_tree.heading("stage", text="Stage")
+        self.progress_tree.heading("elapsed", text="Elapsed")
+        self.progress_tree.pack(fill=BOTH, expand=TRUE)
+        self.progress_status = Label(self.progress_window, text="Running")
+        self.progress_status.pack()
+        self.cancel_button = Button(self.progress_window, text="Cancel", command=self.cancel_generation)
+        self.cancel_button.pack()
+
+        self.progress_started = {}
+        for action in iocActions:
+            self.progress_tree.insert("", END, iid=str(id(action)), text=action.ioc_name, values=("waiting", ""))
+
+
+    def cancel_generation(self):
+        """ IOCs and stages that already started finish, nothing new is started """
+
+        self.cancel_event.set()
+        self.progress_status.configure(text="Cancelling, waiting for running stages to finish")
+        self.cancel_button.configure(state=DISABLED)
+
+
+    def poll_progress(self):
+        """ Drains progress_queue on the Tk thread and reschedules itself until the worker is done """
+
+        done = False
+        now = time.time()
+        window_open = bool(self.progress_window.winfo_exists())
+        while True:
+            try:
+                kind, item, stage, timestamp = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "done":
+                done = True
+                if not window_open:
+                    continue
+                if item is None:
+                    self.progress_status.configure(text="Generation failed, see console output")
+                else:
+                    counts = ["{} {}".format(len([1 for action, status in item if status == s]), s) for s in IOC_STATUSES]
+                    self.progress_status.configure(text="Done: " + ", ".join(counts))
+                continue
+            iid = str(id(item))
+            if not window_open or not self.progress_tree.exists(iid):
+                continue
+            if iid not in self.progress_started:
+                self.progress_started[iid] = [timestamp, None]
+            if stage in IOC_STATUSES:
+                self.progress_started[iid][1] = timestamp
+            self.progress_tree.set(iid, "stage", stage)
+
+        if window_open:
+            for iid, (started, finished) in self.progress_started.items():
+                if self.progress_tree.exists(iid):
+                    self.progress_tree.set(iid, "elapsed", "{:.1f} s".format((finished or now) - started))
+            if done:
+                self.cancel_button.configure(state=DISABLED)
+
+        if not done:
+            self.after(100, self.poll_progress)
+
+
+    def iocActionMaker(self, line):
+        row, errors = parse_ioc_row(line)
+        if row is None:
+            messagebox.showerror("Invalid IOC", "\n".join([message for line_num, column, message in errors]))
+            return None
+        self.ioc_table.add_rows([row])
+        return row
+
+
+    def import_iocs(self, ioc_table):
+        """ Imports a CSV or YAML inventory, all rows are validated first and then added to the table at once """
+
+        path = filedialog.askopenfilename(title="Import IOC inventory",
+            filetypes=[("IOC inventories", "*.csv *.yaml *.yml"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            rows = import_inventory(path, [row.ioc_name for row in self.model.iocs])
+        except (ConfigError, OSError) as err:
+            messagebox.showerror("Error importing IOCs", str(err))
+            return
+        ioc_table.add_rows(rows)
+        print("Imported {} IOCs from {}".format(len(rows), path))
+
+
+    def setting_changed(self, key, value):
+        """ Copies an edited global setting into the model and schedules an autosave """
+
+        self.model.set_entry(key, value.strip())
+        self.ioc_table.validate()
+        self.schedule_autosave()
+
+
+    def schedule_autosave(self):
+        """ Restarts the autosave timer, so a burst of edits is saved once """
 
-    def iocActionMaker(self,line):
-        arr = []
-        line = line.strip()
-        while len(line) > 0:
-            line = line.strip()
-            info = line.split(" ")
-            arr.append(info[0])
-            print(info[0])
-            line = line.replace(info[0], "")
-        action = IOCAction(arr[0],arr[1], arr[3], arr[4], 10)
-        return action
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+        self.autosave_job = self.after(AUTOSAVE_DELAY_MS, self.autosave)
 
 
-    def save(self,configfile):
-        file = open("CONFIGURE.txt", 'r+')
-        if file != None:
-        # slice off the last character from get, as an extra return is added
-            data = configfile.get('1.0', END+'-1c')
-            file.write(data)
-            file.close()
+    def autosave(self):
+        """ Saves CONFIGURE without interrupting the user, invalid settings are only reported on the console """
+
+        self.autosave_job = None
+        try:
+            if save_configure(self.model):
+                print("Saved {}".format(self.model.path))
+        except ConfigError as err:
+            print("Not saving {} until it is valid:".format(self.model.path))
+            print(err)
+        except OSError as err:
+            print("Error saving {}: {}".format(self.model.path, err))
+
+
+    def save(self):
+        """ Saves CONFIGURE right away, problems are shown in a message box """
+
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+            self.autosave_job = None
+        try:
+            if save_configure(self.model):
+                print("Saved {}".format(self.model.path))
+            return True
+        except (ConfigError, OSError) as err:
+            messagebox.showerror("Error saving CONFIGURE file", str(err))
+            return False
 
     def client_exit(self):
+        # pending edits are saved before closing
+        if self.autosave_job is not None:
+            self.after_cancel(self.autosave_job)
+            self.autosave()
         exit()
 
-    def add_ioc(self, configfile,iocActions):
+    def add_ioc(self, ioc_table):
         newWindow = Toplevel(root)
 
         
@@ -840,13 +811,12 @@ class Window(Frame):
         w = Label(newWindow, text = "")
         w.pack()
 
-        submitButton = Button(newWindow,text="Submit", command=lambda: iocActions.append(self.submit(configfile, v1, v2, v3, v4, v5, newWindow,iocActions)))
+        submitButton = Button(newWindow,text="Submit", command=lambda: self.submit(v1, v2, v3, v4, v5, newWindow))
         submitButton.pack()
         submitButton.place(x=0, y=0)
         ##init_iocs()
-        return iocActions
 
-    def submit(self, configfile, v1,v2,v3,v4,v5,newWindow,iocActions):
+    def submit(self, v1,v2,v3,v4,v5,newWindow):
         camera_info = v1.get() + "   " + v2.get() + "         " + v3.get() + "         " + v4.get() + "         " + v5.get()
 
         if v1.get() ==  "" and v2.get() == "" and v3.get() == "" and v4.get() == "" and v5.get() == "":
@@ -862,20 +832,17 @@ class Window(Frame):
             new_display.pack()
         elif v1.get() !=  "" and v2.get() != "" and v3.get() != "" and v4.get() != "" and v5.get() != "":
 
-            ##configfile.delete("1.0", END)
-            ##configfile.update()
-            configfile.insert(INSERT, "\n")
-            configfile.insert(INSERT, camera_info)
+            row = self.iocActionMaker(camera_info)
+            if row is None:
+                return
             newWindow2 = Toplevel(root)
             l1 = Label(newWindow2, text="Would you like to add a new IOC again?")
             l1.pack()
-            iocActions.append(self.iocActionMaker(camera_info))
 
             yesButton = Button(newWindow2, text = "Yes")
             yesButton.pack()
             noButton = Button(newWindow2, text = "No", command=lambda: self.delete(newWindow,newWindow2))
             noButton.pack()
-            return iocActions
         else:
             popup = Tk()
             popup.wm_title("Error")
@@ -896,14 +863,21 @@ class Window(Frame):
         newWindow2.destroy()
 
 
-root = Tk()
-
-root.geometry("1080x1080")
-
-app = Window(root)
-root.mainloop()
+def main():
+    """ Opens the GUI on CONFIGURE.txt in the current directory """
 
+    global root
+    root = Tk()
 
+    root.geometry("1080x1080")
 
+    app = Window(root)
+    root.mainloop()
 
 
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print("gui.py only opens the GUI, use initiocs.py to generate, plan or validate IOCs from the command line")
+        print("see python3 initiocs.py --help")
+        sys.exit(2)
+    main()
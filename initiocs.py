@@ -0,0 +1,4959 @@
+#!/usr/bin/env python3
+import os
+import re
+import csv
+import io
+import json
+import stat
+import time
+import glob
+import fnmatch
+import socket
+import hashlib
+import shlex
+import shutil
+import signal
+import argparse
+import abc
+import tempfile
+import threading
+import subprocess
+import traceback
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+from sys import platform
+# asyncio (procServ control), difflib (plan) and ipaddress (validation) are imported by the
+# functions that use them, so commands that never call those do not pay for loading them
+
+# version number
+version = "v0.0.2"
+
+# upstream ioc-template repository, used when CONFIGURE does not set TEMPLATE_URL
+TEMPLATE_URL = "https://github.com/epicsNSLS2-deploy/ioc-template"
+
+# epicsEnvSet("KEY", "value") lines of unique.cmd and envPaths, group 1 is the key
+ENV_SET_PATTERN = re.compile(r'^\s*epicsEnvSet\s*\(\s*"?([^",\s()]+)"?\s*,')
+# KEY=value lines of the procServ config file, group 1 is the key
+ASSIGNMENT_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_\-]*)\s*=')
+
+# files at the template root rendered for every IOC, besides the startup script of its driver
+RENDERED_FILES = ["unique.cmd", "config", "envPaths"]
+# file in the TEMPLATE_OVERRIDES directory with KEY=value variables set for every IOC
+SITE_VARIABLES_FILE = "site.env"
+
+# prefix of the directories in IOC_DIR that IOCs are built in before being moved into place
+STAGING_PREFIX = ".staging-"
+# suffix of the previous generation of an IOC while it is moved aside in the staging directory
+PREVIOUS_SUFFIX = ".previous"
+
+# template files that are never part of a generated IOC, skipped when linking from a snapshot
+TEMPLATE_ONLY_FILES = [".git", ".gitignore", ".gitattributes", ".github", "startupScripts", "autosaveFiles",
+    "dependancyFiles", "cleanup.sh", "cleanup.bat"]
+# template file listing what to remove from generated IOCs, replaces running cleanup.sh
+CLEANUP_MANIFEST = "cleanup.manifest"
+# template snapshots are kept in <TEMPLATE_CACHE><suffix>/<revision>
+TEMPLATE_SNAPSHOTS_SUFFIX = ".snapshots"
+# snapshots of other revisions are only removed once no run used them for this many seconds,
+# so a concurrent run still linking from one keeps it
+TEMPLATE_SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+# name of the binary index cache file, kept in IOC_DIR
+BINARY_INDEX_CACHE = ".binary_index.json"
+
+# number of IOCs generated concurrently unless --jobs is given
+DEFAULT_JOBS = os.cpu_count() or 1
+
+# possible outcomes of generating a single IOC
+IOC_SUCCEEDED = "succeeded"
+IOC_FAILED = "failed"
+IOC_SKIPPED = "skipped"
+IOC_CANCELLED = "cancelled"
+IOC_UNCHANGED = "unchanged"
+IOC_UNDEPLOYED = "undeployed"
+# returned by run_ioc_action for an IOC that is ready to be installed, never a final status
+IOC_STAGED = "staged"
+IOC_STATUSES = [IOC_SUCCEEDED, IOC_UNCHANGED, IOC_FAILED, IOC_UNDEPLOYED, IOC_SKIPPED, IOC_CANCELLED]
+
+# how IOCs with a host are copied to it unless DEPLOY_TRANSPORT is set, see TRANSPORTS
+DEFAULT_TRANSPORT = "rsync"
+# IOCs copied to the same host at the same time unless DEPLOY_JOBS_PER_HOST is set
+DEFAULT_JOBS_PER_HOST = 4
+
+# procServ executable unless PROCSERV is set in CONFIGURE or --procserv is given, ex. a stub when testing
+PROCSERV_COMMAND = "procServ"
+# directory in IOC_DIR holding the pid and log file of every IOC started with initiocs start
+PROCSERV_STATE_DIR = ".procserv"
+# commands of the IOC launcher
+PROCSERV_COMMANDS = ["start", "stop", "status", "restart"]
+# seconds to wait for a started IOC to open its telnet port
+PROCSERV_READY_TIMEOUT = 10.0
+# seconds to wait for a stopped IOC to exit before it is killed
+PROCSERV_STOP_TIMEOUT = 5.0
+# seconds between two checks of a port or process
+PROCSERV_POLL_INTERVAL = 0.1
+# states of an IOC run by procServ
+PROCSERV_STARTED = "started"
+PROCSERV_RUNNING = "running"
+PROCSERV_NOT_READY = "not ready"
+PROCSERV_STOPPED = "stopped"
+PROCSERV_FAILED = "failed"
+
+# file written into every generated IOC recording the inputs it was generated from
+MANIFEST_FILE = ".initiocs_manifest.json"
+# global settings that end up in a generated IOC, a change in any of them regenerates all IOCs
+MANIFEST_SETTINGS = ["TOP_BINARY_DIR", "PREFIX", "ENGINEER", "HOSTNAME", "CA_ADDRESS", "TEMPLATE_MODE"]
+
+# JSON run report written by --profile unless --report gives another path
+PROFILE_REPORT = "initiocs_profile.json"
+
+# severities of validation issues, errors stop generation, warnings are only reported
+VALIDATION_ERROR = "error"
+VALIDATION_WARNING = "warning"
+# characters allowed in a PV prefix
+PREFIX_PATTERN = re.compile(r'^[A-Za-z0-9_:\-\[\]<>;{}.]+$')
+# host name in CA_ADDRESS
+HOST_NAME_PATTERN = re.compile(r'^[A-Za-z0-9]([A-Za-z0-9\-]*[A-Za-z0-9])?(\.[A-Za-z0-9]([A-Za-z0-9\-]*[A-Za-z0-9])?)*$')
+# seconds to wait when probing for a service listening on a remote HOSTNAME
+PORT_PROBE_TIMEOUT = 0.3
+
+# order of the global settings as they are passed from the GUI
+GUI_CONFIGURATION_KEYS = ["IOC_DIR", "TOP_BINARY_DIR", "BINARIES_FLAT", "PREFIX", "ENGINEER", "HOSTNAME", "CA_ADDRESS"]
+
+
+class IOCAction:
+
+
+    """
+    Helper class that stores information and functions for each IOC in the CONFIGURE file
+
+    Attributes
+    ----------
+    ioc_type : str
+        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
+    ioc_name : str
+        name of the IOC ex. cam-ps1
+    ioc_port : str
+        telnet port on which procserver will run the IOC
+    connection : str
+        Value used to connect to the device ex. IP, serial num. etc.
+    ioc_num : int
+        number of the IOC among those of its driver type, used in its PV prefix ex. {UVC-Cam:2}
+    asyn_port : str
+        asyn port name of the driver ex. PS1, None to derive it from the IOC type
+    linked : bool
+        True if process linked the IOC from a template snapshot instead of cloning it
+    output : OutputBatch
+        batch the generated files are written through, None to write every file right away
+    allocation : dict
+        number and auto port made by allocate_iocs, saved by save_allocations after generating
+    staging : str
+        staging directory holding the IOC once run_ioc_action built it, until it is installed
+    bytes_written : int
+        bytes initIOCs wrote for the IOC, files cloned or linked from the template are not counted
+    files_written : int
+        files initIOCs wrote for the IOC
+    log_lines : list of str
+        buffered log messages for the IOC, printed in one block once the IOC is done
+
+    Methods
+    -------
+    log(message : str)
+        buffers a log message prefixed with the IOC name
+    flush_log()
+        returns the buffered log and empties the buffer
+    run_command(command : list of str)
+        runs a subprocess with its output captured into the IOC log
+    process(ioc_top : str, bin_loc : str, bin_flat : bool, template_cache : str)
+        clones ioc-template instance from the local cache, sets up appropriate st.cmd.
+    unique_values(bin_loc : str, bin_flat : bool, prefix : str, engineer : str, hostname : str, ca_ip : str)
+        returns the unique.cmd variables and their new values
+    config_values(hostname : str)
+        returns the config file variables and their new values
+    env_path_values(bin_flat : bool)
+        returns the envPaths variables and their new values
+    render_file(path : str, template : str, values : dict, renderer : TemplateRenderer)
+        writes a file of the IOC from its compiled template
+    update_unique(ioc_top : str, bin_loc : str, bin_flat : bool, prefix : str, engineer : str, hostname : str, ca_ip : str, renderer : TemplateRenderer)
+        Updates unique.cmd file with all of the required configuration options
+    update_config(ioc_top : str, hostname : str, renderer : TemplateRenderer)
+        updates the config file with appropriate options
+    fix_env_paths(ioc_top: str, bin_flat : bool, renderer : TemplateRenderer)
+        fixes the existing envpaths with new locations
+    getIOCBin(bin_loc : str, bin_flat : bool, binary_index : BinaryIndex)
+        finds the path to the binary for the IOC based on binary top location
+    cleanup(ioc_top : str, cleanup_rules : CleanupRules)
+        applies the template cleanup manifest, or runs cleanup.sh, to remove unwanted files in generated IOC.
+    timed(stage : str)
+        context manager recording the duration of a stage in timings
+    """
+
+    def __init__(self, ioc_type, ioc_name, ioc_port, connection, ioc_num, asyn_port=None, host=""):
+        """
+        Constructor for the IOCAction class
+
+        Parameters
+        ----------
+        ioc_type : str
+        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
+        ioc_name : str
+            name of the IOC ex. cam-ps1
+        ioc_port : str
+            telnet port on which procserver will run the IOC
+        connection : str
+            Value used to connect to the device ex. IP, serial num. etc.
+        ioc_num : int
+            number of the IOC among those of its driver type, used in its PV prefix ex. {UVC-Cam:2}
+        asyn_port : str
+            asyn port name of the driver ex. PS1, None to derive it from the IOC type
+        host : str
+            IOC server the IOC is deployed to, empty if it runs on HOSTNAME from IOC_DIR
+        """
+
+        self.ioc_type = ioc_type
+        self.ioc_name = ioc_name
+        self.ioc_port = ioc_port
+        self.connection = connection
+        self.ioc_num = ioc_num
+        self.asyn_port = asyn_port
+        self.host = host
+        self.linked = False
+        self.log_lines = []
+        self.timings = []
+        self.commands = []
+        self.output = None
+        self.allocation = None
+        self.staging = None
+        self.bytes_written = 0
+        self.files_written = 0
+
+
+    def log(self, message=""):
+        """
+        Function that buffers a log message prefixed with the IOC name, so that output
+        of IOCs generated in parallel does not interleave
+
+        Parameters
+        ----------
+        message : str
+            message to log
+        """
+
+        self.log_lines.append("[{}] {}".format(self.ioc_name, message).rstrip())
+
+
+    def flush_log(self):
+        """
+        Function that empties the log buffer
+
+        Returns
+        -------
+        str
+            all buffered log messages, one per line
+        """
+
+        log = "\n".join(self.log_lines)
+        self.log_lines = []
+        return log
+
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        """
+        Context manager that records how long a stage of generating the IOC took
+
+        Parameters
+        ----------
+        stage : str
+            name of the stage, sub-stages of process are named process.<step>
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((stage, time.perf_counter() - start))
+
+
+    def run_command(self, command):
+        """
+        Function that runs a subprocess and captures its output into the IOC log
+
+        Parameters
+        ----------
+        command : list of str
+            command and arguments to run
+
+        Returns
+        -------
+        int
+            exit code of the command
+        """
+
+        start = time.perf_counter()
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        self.commands.append({"command": command, "returncode": result.returncode,
+            "duration": time.perf_counter() - start})
+        for line in result.stdout.splitlines():
+            self.log(line)
+        return result.returncode
+
+    def process(self, ioc_top, bin_loc, bin_flat, template_cache=None, binary_index=None, template_index=None,
+            template_snapshot=None, renderer=None):
+        """
+        Function that clones ioc-template, and pulls correct st.cmd from startupScripts folder
+        The binary for the IOC is also identified and inserted into st.cmd
+        If a template snapshot is given, only the files the IOC needs are hardlinked from it instead
+
+        Parameters
+        ----------
+        ioc_top : str
+            Path to the top directory to contain generated IOCs
+        bin_loc : str
+            path to top level of binary distribution
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        template_cache : str
+            path to the local ioc-template mirror created by init_template_cache.
+            If None, the template is cloned from TEMPLATE_URL directly
+        binary_index : BinaryIndex
+            index of the binary distribution shared by all IOCs. If None, one is built for this IOC
+        template_index : TemplateIndex
+            index of the template files shared by all IOCs. If None, the cloned template is scanned
+        template_snapshot : str
+            path to a template snapshot created by get_template_snapshot. If None, the template is cloned
+        renderer : TemplateRenderer
+            compiled templates shared by all IOCs. If None, the startup script is converted from the template
+
+        Returns
+        -------
+        int
+            -1 if error, 0 if success, 1 if the IOC type is not supported
+        """
+
+        self.log("-------------------------------------------")
+        self.log("Setup process for IOC " + self.ioc_name)
+        self.log("-------------------------------------------")
+        ioc_path = ioc_top + "/" + self.ioc_name
+        if template_snapshot is not None:
+            # files are shared with the snapshot, which is never modified
+            self.log("Linking IOC template files from {}".format(template_snapshot))
+            cleanup_rules = None
+            if template_index is not None:
+                cleanup_rules = template_index.cleanup_rules
+            with self.timed("process.link"):
+                link_template(template_snapshot, ioc_path, cleanup_rules)
+            template_path = template_snapshot
+            transfer = link_file
+            self.linked = True
+        else:
+            if template_cache is None:
+                template_cache = TEMPLATE_URL
+            # cloning from a local mirror hardlinks the objects, so no network access is needed
+            with self.timed("process.clone"):
+                out = self.run_command(["git", "clone", "--quiet", template_cache, ioc_path])
+            if out != 0:
+                self.log("Error failed to clone IOC template for ioc {}".format(self.ioc_name))
+                return -1
+            self.log("IOC template cloned, converting st.cmd")
+            os.remove(ioc_path+"/st.cmd")
+            template_path = ioc_path
+            transfer = os.rename
+            self.linked = False
+
+        with self.timed("process.lookup"):
+            if template_index is None:
+                template_index = TemplateIndex.from_directory(template_path)
+            driver = template_index.lookup(self.ioc_type)
+        if driver is None:
+            self.log('ERROR - {} is not yet supported by initIOCs, skipping'.format(self.ioc_type))
+            return 1
+
+        with self.timed("process.getIOCBin"):
+            ioc_bin = self.getIOCBin(bin_loc, bin_flat, binary_index)
+        if ioc_bin is None:
+            self.log("Error could not find an executable for {} in {}".format(self.ioc_type, bin_loc))
+            return -1
+
+        with self.timed("process.render_startup_script"):
+            if renderer is not None and renderer.has(driver.startup):
+                contents = renderer.render(driver.startup, {"BINARY": ioc_bin})
+            else:
+                with open(template_path + "/" + driver.startup, "r") as example_st:
+                    contents = "".join(convert_startup_script(example_st.readlines(), ioc_bin))
+            write_file(ioc_path + "/st.cmd", contents, self.output, 0o755)
+
+        with self.timed("process.copy_files"):
+            if driver.autosave is not None:
+                self.log("Generating auto_settings.req file for IOC {}.".format(self.ioc_name))
+                transfer(template_path + "/" + driver.autosave, ioc_path + "/auto_settings.req")
+            else:
+                self.log("Could not find supported auto_settings.req file for IOC {}.".format(self.ioc_name))
+
+            for file in driver.dependencies:
+                self.log('Copying dependency file {} for {}'.format(os.path.basename(file), self.ioc_type))
+                transfer(template_path + "/" + file, ioc_path + "/" + os.path.basename(file))
+
+        return 0
+
+
+    def unique_values(self, bin_loc, bin_flat, prefix, engineer, hostname, ca_ip):
+        """
+        Function that maps each unique.cmd variable to the value it should be set to
+
+        Parameters
+        ----------
+        bin_loc : str
+            path to top level of binary distribution
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        prefix : str
+            Prefix given to the IOC
+        engineer : str
+            Name of the engineer deploying the IOC
+        hostname : str
+            name of the host IOC server on which the IOC will run
+        ca_ip : str
+            Channel Access IP address
+
+        Returns
+        -------
+        dict of str -> str
+            epicsEnvSet variable name -> new value
+        """
+
+        if bin_flat:
+            support_dir = bin_loc
+        else:
+            support_dir = bin_loc + "/support"
+        ioc_prefix = prefix + "{{{}}}".format(self.ioc_type[2:] + "-Cam:{}".format(self.ioc_num))
+        asyn_port = self.asyn_port
+        if not asyn_port:
+            asyn_port = self.ioc_type[2:] + "1"
+        return {
+            "SUPPORT_DIR" : support_dir,
+            "ENGINEER" : engineer,
+            "CAM-CONNECT" : self.connection,
+            "HOSTNAME" : hostname,
+            "PREFIX" : ioc_prefix,
+            "CTPREFIX" : ioc_prefix,
+            "IOCNAME" : self.ioc_name,
+            "EPICS_CA_ADDR_LIST" : ca_ip,
+            "IOC" : "ioc" + self.ioc_type,
+            "PORT" : asyn_port,
+        }
+
+
+    def config_values(self, hostname):
+        """
+        Function that maps each procServ config variable to the value it should be set to
+
+        Parameters
+        ----------
+        hostname : str
+            name of the host IOC server on which the IOC will run
+
+        Returns
+        -------
+        dict of str -> str
+            config variable name -> new value
+        """
+
+        return {
+            "NAME" : self.ioc_name,
+            "PORT" : self.ioc_port,
+            "HOST" : hostname,
+        }
+
+
+    def env_path_values(self, bin_flat):
+        """
+        Function that maps each envPaths variable to the value it should be set to
+
+        Parameters
+        ----------
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+
+        Returns
+        -------
+        dict of str -> str
+            epicsEnvSet variable name -> new value, empty if nothing needs to change
+        """
+
+        if bin_flat:
+            return {}
+        return {"EPICS_BASE" : "$(SUPPORT)/../base"}
+
+
+    def render_file(self, path, template, values, renderer=None):
+        """
+        Function that writes a file of the IOC from its compiled template, or rewrites the copy
+        taken from the template if there is no renderer
+
+        Parameters
+        ----------
+        path : str
+            file in the IOC
+        template : str
+            template path of the file ex. unique.cmd
+        values : dict of str -> str
+            variable name -> new value
+        renderer : TemplateRenderer
+            compiled templates shared by all IOCs
+        """
+
+        if renderer is not None and renderer.has(template):
+            write_file(path, renderer.render(template, values), self.output)
+        else:
+            rewrite_file(path, values, self.output)
+
+
+    def update_unique(self, ioc_top, bin_loc, bin_flat, prefix, engineer, hostname, ca_ip, renderer=None):
+        """
+        Function that updates the unique.cmd file with all of the required configurations
+
+        Parameters
+        ----------
+        ioc_top : str
+            Path to the top directory to contain generated IOCs
+        bin_loc : str
+            path to top level of binary distribution
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        prefix : str
+            Prefix given to the IOC
+        engineer : str
+            Name of the engineer deploying the IOC
+        hostname : str
+            name of the host IOC server on which the IOC will run
+        ca_ip : str
+            Channel Access IP address
+        renderer : TemplateRenderer
+            compiled templates shared by all IOCs, None to rewrite the file in place
+        """
+
+        unique_path = ioc_top + "/" + self.ioc_name + "/unique.cmd"
+        if os.path.exists(unique_path):
+            self.log("Updating unique file based on configuration")
+            self.render_file(unique_path, "unique.cmd", self.unique_values(bin_loc, bin_flat, prefix, engineer, hostname, ca_ip),
+                renderer)
+        else:
+            self.log("No unique file found, proceeding to next step")
+
+
+    def update_config(self, ioc_top, hostname, renderer=None):
+        """
+        Function that updates the config file with the correct IOC name, port, and hostname
+
+        Parameters
+        ----------
+        ioc_top : str
+            Path to the top directory to contain generated IOCs
+        hostname : str
+            name of the host IOC server on which the IOC will run
+        renderer : TemplateRenderer
+            compiled templates shared by all IOCs, None to rewrite the file in place
+        """
+
+        conf_path = ioc_top + "/" + self.ioc_name + "/config"
+        if os.path.exists(conf_path):
+            self.log("Updating config file for procServer connection")
+            self.render_file(conf_path, "config", self.config_values(hostname), renderer)
+        else:
+            self.log("No config file found moving to next step")
+
+
+    def fix_env_paths(self, ioc_top, bin_flat, renderer=None):
+        """
+        Function that fixes the envPaths file if binaries are not flat
+
+        Parameters
+        ----------
+        ioc_top : str
+            Path to the top directory to contain generated IOCs
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        renderer : TemplateRenderer
+            compiled templates shared by all IOCs, None to rewrite the file in place
+        """
+
+        env_path = ioc_top + "/" + self.ioc_name + "/envPaths"
+        values = self.env_path_values(bin_flat)
+        # a site override or site variables may change envPaths even for flat binaries
+        changed = len(values) > 0 or (renderer is not None and (len(renderer.site_variables) > 0 or "envPaths" in renderer.overrides))
+        if os.path.exists(env_path) and changed:
+            self.log("Fixing base location in envPaths")
+            self.render_file(env_path, "envPaths", values, renderer)
+
+
+    def getIOCBin(self, bin_loc, bin_flat, binary_index=None):
+        """
+        Function that identifies the IOC binary location based on its type and the binary structure
+
+        Parameters
+        ----------
+        bin_loc : str
+            path to top level of binary distribution
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        binary_index : BinaryIndex
+            index of the binary distribution shared by all IOCs. If None, one is built for this IOC
+        
+        Return
+        ------
+        driver_path : str
+            Path to the IOC executable located in driverName/iocs/IOC/bin/OS/driverApp, None if not found
+        """
+
+        if binary_index is None:
+            binary_index = BinaryIndex(bin_loc, bin_flat)
+        return binary_index.get_binary(self.ioc_type)
+
+
+    def cleanup(self, ioc_top, cleanup_rules=None):
+        """
+        Function that removes unwanted files from the generated IOC. If the template has a cleanup
+        manifest, its rules are applied in-process, otherwise the cleanup.sh/cleanup.bat script
+        in ioc-template is run
+
+        Parameters
+        ----------
+        ioc_top : str
+            Path to the top directory to contain generated IOCs
+        cleanup_rules : CleanupRules
+            rules read from the template cleanup manifest. If None, the manifest in the IOC is used if present
+        """
+
+        cleanup_completed = False
+        ioc_path = ioc_top + "/" + self.ioc_name
+
+        if cleanup_rules is None and not self.linked:
+            cleanup_rules = CleanupRules.from_file(ioc_path + "/" + CLEANUP_MANIFEST)
+
+        if cleanup_rules is not None:
+            for line in cleanup_rules.rejected:
+                self.log("Ignoring cleanup manifest entry {}, it is outside the IOC directory".format(line))
+            removed = cleanup_rules.apply(ioc_path)
+            self.log("Performing cleanup for {}, removed {} files and directories".format(self.ioc_name, removed))
+            cleanup_completed = True
+        elif self.linked:
+            # only the files the IOC needs were linked, there is nothing to remove
+            cleanup_completed = True
+        elif platform == "linux":
+            if(os.path.exists(ioc_path + "/cleanup.sh")):
+                self.log("Performing cleanup for {}".format(self.ioc_name))
+                self.run_command(["bash", ioc_path + "/cleanup.sh"])
+                self.log()
+                cleanup_completed = True
+        elif platform == "win32":
+            if(os.path.exists(ioc_path + "/cleanup.bat")):
+                self.log("Performing cleanup for {}".format(self.ioc_name))
+                self.run_command([ioc_path + "/cleanup.bat"])
+                self.log()
+                cleanup_completed = True
+        if os.path.exists(ioc_path + "/st.cmd"):
+            os.chmod(ioc_path + "/st.cmd", 0o755)
+        if not cleanup_completed:
+            self.log("No cleanup script found, using outdated version of IOC template")
+
+
+class BinaryIndex:
+    """
+    Index of the IOC executables in an areaDetector binary distribution. The tree is walked
+    once with os.scandir and then shared by every IOCAction of a run. The result can be kept
+    in a JSON cache file, which stays valid as long as none of the scanned directories changed.
+
+    Attributes
+    ----------
+    ad_dir : str
+        path to the areaDetector directory of the binary distribution
+    binaries : dict of str -> dict of str -> str
+        driver name -> architecture -> path to the App executable
+    host_arch : str
+        preferred EPICS architecture, taken from EPICS_HOST_ARCH if it is set
+    cache_file : str
+        path to the JSON cache file, None to always scan
+    mtimes : dict of str -> int
+        modification time in ns of every directory the index depends on
+    from_cache : bool
+        True if the index was loaded from cache_file instead of being scanned
+
+    Methods
+    -------
+    build()
+        scans ad_dir and fills binaries
+    load_cache()
+        loads the index from cache_file if none of the scanned directories changed
+    save_cache()
+        writes the index to cache_file
+    choose_arch(archs : list of str)
+        picks the architecture to use when a driver was built for several
+    get_binary(ioc_type : str)
+        returns the path to the executable for a driver
+    """
+
+    def __init__(self, bin_loc, bin_flat, cache_file=None, rescan=False):
+        """
+        Constructor for the BinaryIndex class, loads the index from cache or scans the binary distribution
+
+        Parameters
+        ----------
+        bin_loc : str
+            path to top level of binary distribution
+        bin_flat : bool
+            flag for deciding if binaries are flat or stacked
+        cache_file : str
+            path to the JSON cache file, None to always scan
+        rescan : bool
+            flag for ignoring an existing cache file and scanning again
+        """
+
+        if bin_flat:
+            # if flat, there is no support directory
+            self.ad_dir = bin_loc + "/areaDetector"
+        else:
+            self.ad_dir = bin_loc + "/support/areaDetector"
+        self.host_arch = os.environ.get("EPICS_HOST_ARCH", "")
+        self.cache_file = cache_file
+        self.binaries = {}
+        self.mtimes = {}
+        self.from_cache = False
+        if cache_file is not None and not rescan:
+            self.from_cache = self.load_cache()
+        if not self.from_cache:
+            self.build()
+            if cache_file is not None:
+                self.save_cache()
+
+
+    def build(self):
+        """
+        Function that walks areaDetector/<driver>/iocs/<IOC>/bin/<arch>/ once and records every
+        App executable. Entries are visited in sorted order so the result does not depend on
+        the order the filesystem returns them in.
+        """
+
+        self.binaries = {}
+        self.mtimes = {}
+        for driver in sorted_subdirs(self.ad_dir, self.mtimes):
+            driver_path = self.ad_dir + "/" + driver
+            subdirs = sorted_subdirs(driver_path, self.mtimes)
+            # identify the IOCs folder
+            if "iocs" in subdirs:
+                iocs_path = driver_path + "/iocs"
+            elif "ioc" in subdirs:
+                iocs_path = driver_path + "/ioc"
+            else:
+                continue
+            archs = {}
+            # the first IOC providing an architecture wins
+            for ioc in sorted_subdirs(iocs_path, self.mtimes):
+                if "IOC" not in ioc and "ioc" not in ioc:
+                    continue
+                # the IOC directory itself changes when its bin directory is created
+                record_mtime(iocs_path + "/" + ioc, self.mtimes)
+                bin_path = iocs_path + "/" + ioc + "/bin"
+                for arch in sorted_subdirs(bin_path, self.mtimes):
+                    if arch in archs:
+                        continue
+                    executable = find_executable(bin_path + "/" + arch, self.mtimes)
+                    if executable is not None:
+                        archs[arch] = bin_path + "/" + arch + "/" + executable
+            if len(archs) > 0:
+                self.binaries[driver] = archs
+
+
+    def load_cache(self):
+        """
+        Function that loads the index from cache_file. The cache is only used if it was built for
+        the same areaDetector directory and every directory it depends on still has the same mtime,
+        which costs one stat per directory instead of a full walk.
+
+        Returns
+        -------
+        bool
+            True if the cache was valid and loaded
+        """
+
+        try:
+            with open(self.cache_file, "r") as cache:
+                data = json.load(cache)
+        except (OSError, ValueError):
+            return False
+        if data.get("ad_dir") != self.ad_dir or not isinstance(data.get("mtimes"), dict):
+            return False
+        for path, mtime in data["mtimes"].items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        self.mtimes = data["mtimes"]
+        self.binaries = data.get("binaries", {})
+        return True
+
+
+    def save_cache(self):
+        """
+        Function that writes the index to cache_file, through a temporary file so that an
+        interrupted write never leaves a truncated cache behind
+        """
+
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, "w") as cache:
+                json.dump({"ad_dir": self.ad_dir, "mtimes": self.mtimes, "binaries": self.binaries}, cache, indent=1)
+            os.replace(temp_file, self.cache_file)
+        except OSError as err:
+            print("Warning could not write binary index cache {}: {}".format(self.cache_file, err))
+
+
+    def choose_arch(self, archs):
+        """
+        Function that picks an architecture: EPICS_HOST_ARCH if present, otherwise the first
+        architecture matching the host OS, otherwise the first in sorted order.
+
+        Parameters
+        ----------
+        archs : list of str
+            architectures a driver was built for
+
+        Returns
+        -------
+        str
+            the chosen architecture
+        """
+
+        archs = sorted(archs)
+        if self.host_arch in archs:
+            return self.host_arch
+        if platform.startswith("win"):
+            host_prefixes = ("windows", "win32", "win64")
+        else:
+            host_prefixes = (platform.rstrip("0123456789"),)
+        for arch in archs:
+            if arch.startswith(host_prefixes):
+                return arch
+        return archs[0]
+
+
+    def get_binary(self, ioc_type):
+        """
+        Function that returns the executable for a driver
+
+        Parameters
+        ----------
+        ioc_type : str
+            name of areaDetector driver ex. ADProsilica
+
+        Returns
+        -------
+        str
+            path to the App executable, None if the driver has no built IOC
+        """
+
+        archs = self.binaries.get(ioc_type)
+        if not archs:
+            return None
+        return archs[self.choose_arch(archs.keys())]
+
+
+def record_mtime(path, mtimes):
+    """
+    Function that stores the modification time of path, if it exists, in mtimes
+
+    Parameters
+    ----------
+    path : str
+        file or directory to stat
+    mtimes : dict of str -> int
+        path -> modification time in ns
+    """
+
+    try:
+        mtimes[path] = os.stat(path).st_mtime_ns
+    except OSError:
+        pass
+
+
+def sorted_subdirs(path, mtimes=None):
+    """
+    Function that lists the subdirectories of path in sorted order with a single os.scandir call
+
+    Parameters
+    ----------
+    path : str
+        directory to list
+    mtimes : dict of str -> int
+        optional, the modification time of path is recorded here
+
+    Returns
+    -------
+    list of str
+        names of the subdirectories, empty if path does not exist
+    """
+
+    if mtimes is not None:
+        record_mtime(path, mtimes)
+    try:
+        with os.scandir(path) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir())
+    except OSError:
+        return []
+
+
+def find_executable(arch_path, mtimes=None):
+    """
+    Function that finds the App executable in a bin/<arch> directory. Names ending in App or
+    App.exe are preferred over other files containing App (ex. .pdb files on Windows)
+
+    Parameters
+    ----------
+    arch_path : str
+        path to the bin/<arch> directory
+    mtimes : dict of str -> int
+        optional, the modification time of arch_path is recorded here
+
+    Returns
+    -------
+    str
+        name of the executable, None if there is none
+    """
+
+    if mtimes is not None:
+        record_mtime(arch_path, mtimes)
+    try:
+        with os.scandir(arch_path) as entries:
+            names = sorted(entry.name for entry in entries if not entry.is_dir() and "App" in entry.name)
+    except OSError:
+        return None
+    for name in names:
+        if name.endswith("App") or name.endswith("App.exe"):
+            return name
+    if len(names) > 0:
+        return names[0]
+    return None
+
+
+class TemplateTree:
+    """
+    Read-only view of the ioc-template files at one revision of the local mirror. All files are
+    read with a single git cat-file call, nothing is checked out.
+
+    Attributes
+    ----------
+    template_cache : str
+        path to the local ioc-template mirror
+    revision : str
+        commit the files were read from
+    contents : dict of str -> bytes
+        path relative to the template root -> file contents
+    executables : set of str
+        paths of the files with the executable bit set
+
+    Methods
+    -------
+    exists(path : str)
+        checks if a file exists in the template
+    listdir(directory : str)
+        lists the files directly inside a template directory
+    read_lines(path : str)
+        returns the lines of a template file
+    """
+
+    def __init__(self, template_cache, revision="HEAD"):
+        """
+        Constructor for the TemplateTree class, reads every file of the template
+
+        Parameters
+        ----------
+        template_cache : str
+            path to the local ioc-template mirror
+        revision : str
+            commit, branch or tag to read
+        """
+
+        self.template_cache = template_cache
+        self.revision = revision
+        self.contents = {}
+        self.executables = set()
+
+        listing = subprocess.check_output(["git", "--git-dir", template_cache, "ls-tree", "-r", "-z", revision])
+        blobs = []
+        for item in listing.split(b"\0"):
+            if len(item) == 0:
+                continue
+            info, path = item.split(b"\t", 1)
+            mode, object_type, sha = info.split()
+            if object_type == b"blob":
+                blobs.append((path.decode("utf-8"), sha))
+                if mode == b"100755":
+                    self.executables.add(path.decode("utf-8"))
+
+        batch = subprocess.run(["git", "--git-dir", template_cache, "cat-file", "--batch"],
+            input=b"".join([sha + b"\n" for path, sha in blobs]), stdout=subprocess.PIPE, check=True).stdout
+        offset = 0
+        for path, sha in blobs:
+            header_end = batch.index(b"\n", offset)
+            size = int(batch[offset:header_end].split()[2])
+            self.contents[path] = batch[header_end + 1:header_end + 1 + size]
+            offset = header_end + 1 + size + 1
+
+
+    def exists(self, path):
+        """ Function that returns True if path is a file in the template """
+
+        return path in self.contents
+
+
+    def listdir(self, directory):
+        """
+        Function that lists the files directly inside a template directory
+
+        Parameters
+        ----------
+        directory : str
+            directory relative to the template root, empty for the root itself
+
+        Returns
+        -------
+        list of str
+            sorted file names
+        """
+
+        prefix = directory.rstrip("/") + "/" if directory else ""
+        return sorted([path[len(prefix):] for path in self.contents if path.startswith(prefix) and "/" not in path[len(prefix):]])
+
+
+    def read_lines(self, path):
+        """
+        Function that returns the lines of a template file
+
+        Parameters
+        ----------
+        path : str
+            file relative to the template root
+
+        Returns
+        -------
+        list of str
+            lines including line endings
+        """
+
+        return self.contents[path].decode("utf-8", errors="replace").splitlines(True)
+
+
+class TemplateDriver:
+    """
+    Template files used by one areaDetector driver, paths relative to the template root
+
+    Attributes
+    ----------
+    key : str
+        lowercase driver name without the AD prefix ex. prosilica
+    name : str
+        driver name as spelled in the startup script name ex. Prosilica
+    startup : str
+        example startup script ex. startupScripts/st_Prosilica.cmd
+    autosave : str
+        autosave request file, None if the template has none for the driver
+    dependencies : list of str
+        dependency files copied into the IOC
+    """
+
+    def __init__(self, key, name, startup):
+        self.key = key
+        self.name = name
+        self.startup = startup
+        self.autosave = None
+        self.dependencies = []
+
+
+class TemplateIndex:
+    """
+    Index of the ioc-template mapping every driver to its startup script, autosave request and
+    dependency files. The template is scanned once per run, every driver is resolved while the
+    index is built, and each IOC is then resolved with a read-only dictionary lookup.
+
+    A startup script belongs to a driver if its name, without the st and cmd parts, equals the
+    driver name ex. st_simDetector.cmd -> simdetector. Only if no script matches exactly, a
+    script whose first name part is the driver name is used, ex. st_prosilica_gige.cmd ->
+    prosilica, and only if there is exactly one such script. Autosave requests must be named <driver>_auto_settings.req and dependency files must start
+    with the driver name ex. simDetector_plugins.cmd.
+
+    Attributes
+    ----------
+    drivers : dict of str -> TemplateDriver
+        driver key -> template files of the driver
+    startup_scripts : list of str
+        names of all startup scripts
+    ambiguous : set of str
+        driver keys matched by several startup scripts, left out of drivers
+    partial : set of str
+        driver keys matched only by the first part of a startup script name
+    cleanup_rules : CleanupRules
+        files to remove from generated IOCs, None if the template has no cleanup manifest
+
+    Methods
+    -------
+    lookup(ioc_type : str)
+        returns the TemplateDriver for an IOC type
+    from_tree(template_tree : TemplateTree)
+        builds the index from the template mirror
+    from_directory(template_path : str)
+        builds the index from a template checkout
+    """
+
+    def __init__(self, startup_scripts, autosave_files, dependency_files, cleanup_rules=None):
+        """
+        Constructor for the TemplateIndex class
+
+        Parameters
+        ----------
+        startup_scripts : list of str
+            file names in startupScripts
+        autosave_files : list of str
+            file names in autosaveFiles
+        dependency_files : list of str
+            file names in dependancyFiles
+        cleanup_rules : CleanupRules
+            rules read from the template cleanup manifest, None if it has none
+        """
+
+        self.cleanup_rules = cleanup_rules
+        self.drivers = {}
+        self.startup_scripts = sorted(startup_scripts)
+        self.ambiguous = set()
+        for file in self.startup_scripts:
+            tokens = template_name_tokens(file)
+            key = "".join(tokens).lower()
+            if key in self.drivers:
+                # two scripts for one driver, refuse to guess
+                self.ambiguous.add(key)
+                continue
+            self.drivers[key] = TemplateDriver(key, "".join(tokens), "startupScripts/" + file)
+        for key in self.ambiguous:
+            del self.drivers[key]
+
+        # drivers without an exact script use the one script whose name starts with the driver name
+        partial_scripts = {}
+        for file in self.startup_scripts:
+            tokens = template_name_tokens(file)
+            key = tokens[0].lower() if len(tokens) > 1 else None
+            if key is not None and key not in self.drivers and key not in self.ambiguous:
+                partial_scripts.setdefault(key, []).append((tokens[0], file))
+        self.partial = set()
+        for key, scripts in partial_scripts.items():
+            if len(scripts) > 1:
+                self.ambiguous.add(key)
+                continue
+            name, file = scripts[0]
+            self.drivers[key] = TemplateDriver(key, name, "startupScripts/" + file)
+            self.partial.add(key)
+
+        autosave_by_key = {}
+        for file in autosave_files:
+            if file.lower().endswith("_auto_settings.req"):
+                autosave_by_key[file[:-len("_auto_settings.req")].lower()] = "autosaveFiles/" + file
+        dependencies_by_key = {}
+        for file in sorted(dependency_files):
+            tokens = template_name_tokens(file)
+            if len(tokens) > 0:
+                dependencies_by_key.setdefault(tokens[0].lower(), []).append("dependancyFiles/" + file)
+
+        for key, driver in self.drivers.items():
+            driver.autosave = autosave_by_key.get(key)
+            driver.dependencies = dependencies_by_key.get(key, [])
+
+
+    @classmethod
+    def from_tree(cls, template_tree):
+        """ Function that builds the index from a TemplateTree read from the mirror """
+
+        cleanup_rules = None
+        if template_tree.exists(CLEANUP_MANIFEST):
+            cleanup_rules = CleanupRules(template_tree.read_lines(CLEANUP_MANIFEST))
+        return cls(template_tree.listdir("startupScripts"), template_tree.listdir("autosaveFiles"),
+            template_tree.listdir("dependancyFiles"), cleanup_rules)
+
+
+    @classmethod
+    def from_directory(cls, template_path):
+        """ Function that builds the index from a checked out template """
+
+        listings = []
+        for directory in ["startupScripts", "autosaveFiles", "dependancyFiles"]:
+            try:
+                with os.scandir(template_path + "/" + directory) as entries:
+                    listings.append([entry.name for entry in entries if entry.is_file()])
+            except OSError:
+                listings.append([])
+        return cls(listings[0], listings[1], listings[2], CleanupRules.from_file(template_path + "/" + CLEANUP_MANIFEST))
+
+
+    def lookup(self, ioc_type):
+        """
+        Function that returns the template files for an IOC type
+
+        Parameters
+        ----------
+        ioc_type : str
+            name of areaDetector driver ex. ADProsilica
+
+        Returns
+        -------
+        TemplateDriver
+            the template files, None if the IOC type is not supported or ambiguous
+        """
+
+        return self.drivers.get(driver_key(ioc_type))
+
+
+# separators in template file names
+TEMPLATE_NAME_SEPARATORS = re.compile(r'[._\-]+')
+# parts of template file names that are not part of the driver name
+TEMPLATE_NAME_IGNORED = ["st", "cmd"]
+
+
+def template_name_tokens(file):
+    """
+    Function that splits a template file name into its parts, dropping the st and cmd parts
+
+    Parameters
+    ----------
+    file : str
+        file name ex. st_simDetector.cmd
+
+    Returns
+    -------
+    list of str
+        remaining parts ex. ["simDetector"]
+    """
+
+    return [token for token in TEMPLATE_NAME_SEPARATORS.split(file) if token != "" and token.lower() not in TEMPLATE_NAME_IGNORED]
+
+
+def driver_key(ioc_type):
+    """
+    Function that returns the template key of an IOC type ex. ADProsilica -> prosilica
+
+    Parameters
+    ----------
+    ioc_type : str
+        name of areaDetector driver ex. ADProsilica
+
+    Returns
+    -------
+    str
+        lowercase driver name without the AD prefix
+    """
+
+    if ioc_type.startswith("AD"):
+        ioc_type = ioc_type[2:]
+    return ioc_type.lower()
+
+
+class CleanupRules:
+    """
+    Files and directories to remove from every generated IOC, read once from the cleanup manifest
+    of the template. The manifest lists one path or glob pattern per line, relative to the IOC
+    directory, # starts a comment. Absolute patterns and patterns containing .. are rejected, and
+    nothing outside the IOC directory is ever removed.
+
+    The manifest itself and TEMPLATE_ONLY_FILES are always removed, even if the manifest does not
+    list them: they are the git metadata and the per-driver source directories of the template,
+    whose files process has already copied into place, and cleanup.sh removes them as well.
+
+    Attributes
+    ----------
+    patterns : list of str
+        paths or glob patterns to remove
+    rejected : list of str
+        manifest lines that were ignored because they could reach outside the IOC directory
+
+    Methods
+    -------
+    from_file(path : str)
+        reads the rules from a manifest file
+    excludes(name : str)
+        checks if a top level template entry is removed by the rules
+    apply(ioc_path : str)
+        removes every matching file and directory from an IOC
+    """
+
+    def __init__(self, lines):
+        """
+        Constructor for the CleanupRules class
+
+        Parameters
+        ----------
+        lines : list of str
+            lines of the cleanup manifest
+        """
+
+        self.patterns = [CLEANUP_MANIFEST] + TEMPLATE_ONLY_FILES
+        self.rejected = []
+        for line in lines:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            pattern = line.strip("/")
+            if (line.startswith(("/", "\\")) or os.path.isabs(line) or re.match(r'^[A-Za-z]:', line)
+                    or pattern == "" or ".." in re.split(r'[\\/]', pattern)):
+                self.rejected.append(line)
+                continue
+            self.patterns.append(pattern)
+
+
+    @classmethod
+    def from_file(cls, path):
+        """ Function that reads the rules from a manifest file, None if it does not exist """
+
+        try:
+            with open(path, "r") as manifest:
+                return cls(manifest.readlines())
+        except OSError:
+            return None
+
+
+    def excludes(self, name):
+        """
+        Function that checks if a top level template entry would be removed by the rules
+
+        Parameters
+        ----------
+        name : str
+            file or directory name in the template root
+
+        Returns
+        -------
+        bool
+            True if a top level pattern matches name
+        """
+
+        for pattern in self.patterns:
+            if "/" not in pattern and fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+
+    def apply(self, ioc_path):
+        """
+        Function that collects every path matching the rules and then removes them in one pass
+
+        Parameters
+        ----------
+        ioc_path : str
+            path to the generated IOC
+
+        Returns
+        -------
+        int
+            number of files and directories removed
+        """
+
+        matches = set()
+        root = os.path.realpath(ioc_path)
+        for pattern in self.patterns:
+            for path in glob.glob(ioc_path + "/" + pattern):
+                # a symlink is removed itself, so only the directory it is in has to be inside the IOC
+                real_path = os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path))
+                if real_path.startswith(root + os.sep) and os.path.basename(path) not in ["", ".", ".."]:
+                    matches.add(path)
+        # deepest paths first, so nothing is removed twice
+        for path in sorted(matches, key=len, reverse=True):
+            if os.path.isdir(path) and not os.path.islink(path):
+                remove_tree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+        return len(matches)
+
+
+def get_template_snapshot(template_tree, template_cache):
+    """
+    Function that writes the files of a template revision into a read-only snapshot directory
+    next to the mirror, which IOCs are then hardlinked from. Finished snapshots of other revisions
+    that no run used for TEMPLATE_SNAPSHOT_MAX_AGE are removed, IOCs linked from them keep their
+    files. Unfinished snapshots are only removed once the run writing them is gone.
+
+    Parameters
+    ----------
+    template_tree : TemplateTree
+        template files at the revision to snapshot
+    template_cache : str
+        path to the local ioc-template mirror
+
+    Returns
+    -------
+    str
+        path to the snapshot
+    """
+
+    snapshots_dir = template_cache.rstrip("/") + TEMPLATE_SNAPSHOTS_SUFFIX
+    snapshot = snapshots_dir + "/" + template_tree.revision
+    if not os.path.exists(snapshot):
+        print("Creating template snapshot {}".format(snapshot))
+        if not os.path.exists(snapshots_dir):
+            os.makedirs(snapshots_dir)
+        temp_snapshot = tempfile.mkdtemp(prefix=".tmp-{}-".format(os.getpid()), dir=snapshots_dir)
+        for path, contents in template_tree.contents.items():
+            file_path = temp_snapshot + "/" + path
+            if not os.path.exists(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            with open(file_path, "wb") as snapshot_file:
+                snapshot_file.write(contents)
+            # read-only, as every linked IOC shares the file
+            if path in template_tree.executables:
+                os.chmod(file_path, 0o555)
+            else:
+                os.chmod(file_path, 0o444)
+        # mkdtemp creates the directory private to this user, other users link from it as well
+        os.chmod(temp_snapshot, 0o755)
+        try:
+            os.rename(temp_snapshot, snapshot)
+        except OSError:
+            # created by a concurrent run in the meantime
+            remove_tree(temp_snapshot)
+    else:
+        # marks the snapshot as in use, so no other run prunes it
+        os.utime(snapshot)
+    prune_template_snapshots(snapshots_dir, template_tree.revision)
+    return snapshot
+
+
+def prune_template_snapshots(snapshots_dir, revision):
+    """
+    Function that removes template snapshots of other revisions that no run used for
+    TEMPLATE_SNAPSHOT_MAX_AGE, and unfinished snapshots of runs that were killed
+
+    Parameters
+    ----------
+    snapshots_dir : str
+        directory holding the snapshots
+    revision : str
+        revision of the snapshot used by this run, never removed
+    """
+
+    now = time.time()
+    snapshots = []
+    with os.scandir(snapshots_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.name != revision and entry.is_dir():
+                    snapshots.append((entry.name, entry.stat().st_mtime))
+            except OSError:
+                # removed by a concurrent run
+                continue
+    for name, modified in snapshots:
+        if name.startswith(".tmp-"):
+            try:
+                pid = int(name.split("-")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid == os.getpid() or process_running(pid):
+                continue
+        elif now - modified < TEMPLATE_SNAPSHOT_MAX_AGE:
+            continue
+        remove_tree(snapshots_dir + "/" + name)
+
+
+def link_template(template_path, ioc_path, cleanup_rules=None):
+    """
+    Function that creates an IOC directory holding links to every template file an IOC needs.
+    Template-only files (startup scripts, autosave and dependency folders, cleanup scripts,
+    git metadata, anything the cleanup manifest removes) and the generated st.cmd are left out.
+
+    Parameters
+    ----------
+    template_path : str
+        path to the template snapshot
+    ioc_path : str
+        path to the IOC directory to create
+    cleanup_rules : CleanupRules
+        rules from the template cleanup manifest, None if it has none
+    """
+
+    os.mkdir(ioc_path)
+    for name in os.listdir(template_path):
+        if name in TEMPLATE_ONLY_FILES or name == "st.cmd":
+            continue
+        if cleanup_rules is not None and cleanup_rules.excludes(name):
+            continue
+        source = template_path + "/" + name
+        if os.path.isdir(source):
+            shutil.copytree(source, ioc_path + "/" + name, copy_function=link_file)
+        else:
+            link_file(source, ioc_path + "/" + name)
+
+
+def link_file(source, destination):
+    """
+    Function that hardlinks a file, falling back to a copy if the two paths are on different
+    filesystems or the filesystem does not support links
+
+    Parameters
+    ----------
+    source : str
+        existing file
+    destination : str
+        path of the link to create
+    """
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def remove_tree(path):
+    """
+    Function that removes a directory tree, including read-only files linked from a template snapshot
+
+    Parameters
+    ----------
+    path : str
+        directory to remove
+    """
+
+    def make_writable(function, failed_path, exc_info):
+        try:
+            os.chmod(failed_path, 0o755)
+            function(failed_path)
+        except OSError:
+            pass
+
+    if os.path.exists(path):
+        shutil.rmtree(path, onerror=make_writable)
+
+
+def convert_startup_script(lines, ioc_bin):
+    """
+    Function that turns an example startup script into the st.cmd of an IOC, pointing the
+    shebang to the IOC binary and loading envPaths from the IOC directory
+
+    Parameters
+    ----------
+    lines : list of str
+        lines of the example startup script
+    ioc_bin : str
+        path to the IOC executable
+
+    Returns
+    -------
+    list of str
+        lines of st.cmd
+    """
+
+    return CompiledTemplate("", lines, startup=True).render({"BINARY": ioc_bin}).splitlines(True)
+
+
+def rewrite_lines(lines, values):
+    """
+    Function that replaces the value of every epicsEnvSet("KEY", ...) or KEY=... line whose key is
+    in values. Keys are matched exactly, comments and all other lines are kept as they are.
+
+    Parameters
+    ----------
+    lines : list of str
+        lines of the original file, including line endings
+    values : dict of str -> str
+        variable name -> new value
+
+    Returns
+    -------
+    list of str
+        lines of the rewritten file
+    """
+
+    return CompiledTemplate("", lines).render(values).splitlines(True)
+
+
+def rewrite_file(path, values, batch=None):
+    """
+    Function that rewrites a file with rewrite_lines in a single pass, for IOCs generated without
+    a TemplateRenderer. The result replaces the original with write_file.
+
+    Parameters
+    ----------
+    path : str
+        file to rewrite
+    values : dict of str -> str
+        variable name -> new value
+    batch : OutputBatch
+        batch of the IOC the file belongs to, None to write the file right away
+    """
+
+    with open(path, "r") as original:
+        lines = original.readlines()
+    write_file(path, CompiledTemplate(path, lines).render(values), batch)
+
+
+def template_slot(line, startup=False):
+    """
+    Function that finds the variable a template line sets
+
+    Parameters
+    ----------
+    line : str
+        line of the template, including its line ending
+    startup : bool
+        flag for startup scripts, whose shebang is the BINARY variable and whose envPaths line
+        always loads envPaths from the IOC directory
+
+    Returns
+    -------
+    (str, str, str)
+        variable name and the text before and after its value, None for a line kept as it is.
+        A startup script envPaths line is returned as its replacement text instead
+    """
+
+    if startup:
+        if "#!" in line:
+            return ("BINARY", "#!", "\n")
+        elif "envPaths" in line:
+            return "< envPaths\n"
+    if line.lstrip().startswith("#"):
+        return None
+    match = ENV_SET_PATTERN.match(line)
+    if match is not None:
+        return (match.group(1), 'epicsEnvSet("{}", "'.format(match.group(1)), '")\n')
+    match = ASSIGNMENT_PATTERN.match(line)
+    if match is not None:
+        return (match.group(1), match.group(1) + "=", "\n")
+    return None
+
+
+class CompiledTemplate:
+    """
+    Template file parsed once into runs of literal text and variable slots, so rendering an IOC
+    is a single join. A slot whose variable is not given renders as the original line.
+
+    Attributes
+    ----------
+    path : str
+        template file the lines were read from
+    lines : list of str
+        original lines of the template
+    parts : list of str or (str, str, str, str)
+        literal text, or variable name, text before and after the value and the original line
+
+    Methods
+    -------
+    render(variables : dict of str -> str)
+        returns the contents of the file for an IOC
+    """
+
+    def __init__(self, path, lines, startup=False):
+        self.path = path
+        self.lines = lines
+        self.parts = []
+        literal = []
+        for line in lines:
+            slot = template_slot(line, startup)
+            if slot is None:
+                literal.append(line)
+            elif isinstance(slot, str):
+                literal.append(slot)
+            else:
+                if len(literal) > 0:
+                    self.parts.append("".join(literal))
+                    literal = []
+                self.parts.append(slot + (line,))
+        if len(literal) > 0:
+            self.parts.append("".join(literal))
+
+
+    def render(self, variables):
+        """
+        Function that renders the template for one IOC
+
+        Parameters
+        ----------
+        variables : dict of str -> str
+            variable name -> value
+
+        Returns
+        -------
+        str
+            contents of the rendered file
+        """
+
+        return "".join([part if isinstance(part, str) else
+            part[1] + variables[part[0]] + part[2] if part[0] in variables else part[3] for part in self.parts])
+
+
+class TemplateRenderer:
+    """
+    Compiled startup scripts, unique.cmd, config and envPaths of one template revision, shared by
+    every IOC of a run. Each file is parsed once, after which IOCs are only rendered from it. The
+    startup scripts of the indexed drivers are compiled up front, any other file the first time
+    it is needed.
+
+    A site override directory (TEMPLATE_OVERRIDES) can replace any of these files with its own
+    version at the same path ex. startupScripts/st_UVC.cmd, and can give variable values for every
+    IOC in site.env, ex. QSIZE=50. The values initIOCs computes for an IOC take precedence.
+
+    Attributes
+    ----------
+    templates : dict of str -> CompiledTemplate
+        template path -> compiled template, None if the template has no such file
+    template_tree : TemplateTree
+        template files the templates are compiled from
+    override_lines : dict of str -> list of str
+        template path -> lines of the file replacing it in the override directory
+    lock : threading.Lock
+        guards templates, as worker threads compile files on demand
+    site_variables : dict of str -> str
+        variables read from site.env in the override directory
+    overrides : list of str
+        template paths replaced by the override directory
+    digest : str
+        hash of the override files, empty if there is no override directory
+
+    Methods
+    -------
+    get(path : str)
+        returns the compiled template file, compiling it on first use
+    has(path : str)
+        checks if a template file can be rendered
+    render(path : str, variables : dict of str -> str)
+        returns the contents of a file for one IOC
+    """
+
+    def __init__(self, template_tree, template_index, overrides_dir=""):
+        """
+        Constructor for the TemplateRenderer class, reads the override directory and compiles the
+        startup scripts of every indexed driver, unique.cmd, config and envPaths
+
+        Parameters
+        ----------
+        template_tree : TemplateTree
+            template files at the revision of the mirror
+        template_index : TemplateIndex
+            index of the template files built from template_tree
+        overrides_dir : str
+            site override directory, empty for none
+        """
+
+        self.templates = {}
+        self.template_tree = template_tree
+        self.override_lines = {}
+        self.lock = threading.Lock()
+        self.site_variables = {}
+        self.overrides = []
+        digest = hashlib.sha256()
+        if overrides_dir:
+            self.site_variables = read_assignments(overrides_dir + "/" + SITE_VARIABLES_FILE)
+            digest.update(json.dumps(self.site_variables, sort_keys=True).encode("utf-8"))
+            # every startup script is checked, so the digest also covers those compiled on demand
+            for path in ["startupScripts/" + file for file in template_index.startup_scripts] + RENDERED_FILES:
+                if os.path.isfile(overrides_dir + "/" + path):
+                    with open(overrides_dir + "/" + path, "r") as override:
+                        self.override_lines[path] = override.readlines()
+                    self.overrides.append(path)
+                    digest.update((path + "\0" + "".join(self.override_lines[path]) + "\0").encode("utf-8"))
+        self.digest = digest.hexdigest() if overrides_dir else ""
+        startup_scripts = set([driver.startup for driver in template_index.drivers.values()])
+        for path in sorted(startup_scripts) + RENDERED_FILES:
+            self.get(path)
+
+
+    def get(self, path):
+        """
+        Function that returns a compiled template file, compiling it the first time it is needed
+
+        Parameters
+        ----------
+        path : str
+            template path ex. unique.cmd or startupScripts/st_sim.cmd
+
+        Returns
+        -------
+        CompiledTemplate
+            the compiled file, None if neither the template nor the override directory has it
+        """
+
+        with self.lock:
+            if path not in self.templates:
+                lines = self.override_lines.get(path)
+                if lines is None and self.template_tree.exists(path):
+                    lines = self.template_tree.read_lines(path)
+                # every rendered file that is not unique.cmd, config or envPaths is a startup script
+                self.templates[path] = CompiledTemplate(path, lines, path not in RENDERED_FILES) if lines is not None else None
+            return self.templates[path]
+
+
+    def has(self, path):
+        """ Function that returns True if path can be rendered, compiling it if needed """
+
+        return self.get(path) is not None
+
+
+    def render(self, path, variables):
+        """
+        Function that renders a template file for one IOC
+
+        Parameters
+        ----------
+        path : str
+            template path ex. unique.cmd
+        variables : dict of str -> str
+            values computed for the IOC, added to the site variables
+
+        Returns
+        -------
+        str
+            contents of the rendered file
+        """
+
+        if len(self.site_variables) > 0:
+            variables = dict(self.site_variables, **variables)
+        return self.get(path).render(variables)
+
+
+class OutputBatch:
+    """
+    Files written for one IOC. Every file is built in memory and written with a single call.
+    Nothing is fsynced per file, generate_iocs makes every staged IOC durable with a single sync
+    before any of them is moved into place.
+
+    Attributes
+    ----------
+    files : int
+        number of files written
+    bytes : int
+        number of bytes written
+
+    Methods
+    -------
+    write(path : str, contents : str, mode : int)
+        writes a file, replacing an existing one in one step
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+
+
+    def write(self, path, contents, mode=None):
+        """
+        Function that writes a file in one call. An existing file is replaced through a temporary
+        file in the same directory, so files linked from a read-only template snapshot become
+        writable copies instead of being changed in place.
+
+        Parameters
+        ----------
+        path : str
+            file to write
+        contents : str
+            contents of the file
+        mode : int
+            permissions of the file, None to keep those of the replaced file
+        """
+
+        replaced = os.path.lexists(path)
+        target = path + ".tmp" if replaced else path
+        # large enough for the whole file, so it reaches the kernel in one write
+        with open(target, "w", buffering=max(io.DEFAULT_BUFFER_SIZE, 4 * len(contents) + 1)) as output:
+            output.write(contents)
+            output.flush()
+            written = output.tell()
+        if mode is None and replaced:
+            mode = os.stat(path).st_mode | stat.S_IWUSR
+        if mode is not None:
+            os.chmod(target, mode)
+        if replaced:
+            os.replace(target, path)
+        self.files = self.files + 1
+        self.bytes = self.bytes + written
+
+
+def sync_output():
+    """
+    Function that makes everything written so far durable with a single call, instead of one
+    fsync per file, which is a synchronous round trip each on NFS. Ignored on Windows.
+    """
+
+    if hasattr(os, "sync"):
+        os.sync()
+
+
+def sync_directory(directory):
+    """
+    Function that makes the new or renamed entries of a directory durable, ignored on Windows
+
+    Parameters
+    ----------
+    directory : str
+        directory to sync
+    """
+
+    if platform == "win32":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file(path, contents, batch=None, mode=None):
+    """
+    Function that writes a file in one call, replacing an existing one in one step
+
+    Parameters
+    ----------
+    path : str
+        file to write
+    contents : str
+        new contents of the file
+    batch : OutputBatch
+        batch of the IOC the file belongs to, counting the files and bytes it wrote, None for none
+    mode : int
+        permissions of the file, None to keep those of the replaced file
+    """
+
+    if batch is None:
+        batch = OutputBatch()
+    batch.write(path, contents, mode)
+
+
+#-------------------------------------------------
+#----------------MAIN SCRIPT FUNCTIONS------------
+#-------------------------------------------------
+
+
+class ConfigError(Exception):
+    """
+    Exception raised when the CONFIGURE file cannot be parsed
+
+    Attributes
+    ----------
+    path : str
+        path to the CONFIGURE file
+    errors : list of (int, int, str)
+        line number, column and message of every problem found, 1-based
+    """
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        super().__init__("\n".join(["{}:{}:{}: {}".format(path, line, column, message) for line, column, message in errors]))
+
+
+class ConfigEntry:
+    """
+    A KEY=VALUE global setting of the CONFIGURE file
+
+    Attributes
+    ----------
+    key : str
+        name of the setting ex. IOC_DIR
+    value : str
+        value of the setting
+    line : int
+        line number of the setting, 1-based, 0 if it is not in the file
+    comments : list of str
+        comment lines directly describing the setting, section headers excluded
+    """
+
+    def __init__(self, key, value, line=0, comments=None):
+        self.key = key
+        self.value = value
+        self.line = line
+        self.comments = comments if comments is not None else []
+
+
+    def comment_text(self):
+        """ Function that returns the describing comments joined into one string, used for tooltips """
+
+        return "\n".join(self.comments)
+
+
+class IOCRow:
+    """
+    A single IOC row of the CONFIGURE file
+
+    Attributes
+    ----------
+    ioc_type : str
+        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
+    ioc_name : str
+        name of the IOC ex. cam-ps1
+    asyn_port : str
+        asyn port name of the driver ex. PS1
+    ioc_port : str
+        telnet port on which procserver will run the IOC
+    connection : str
+        Value used to connect to the device ex. IP, serial num. etc.
+    line : int
+        line number of the row, 1-based, 0 if it is not in the file
+    host : str
+        IOC server the IOC is deployed to, empty if it runs on HOSTNAME from IOC_DIR
+    """
+
+    def __init__(self, ioc_type, ioc_name, asyn_port, ioc_port, connection, line=0, host=""):
+        self.ioc_type = ioc_type
+        self.ioc_name = ioc_name
+        self.asyn_port = asyn_port
+        self.ioc_port = ioc_port
+        self.connection = connection
+        self.line = line
+        self.host = host
+
+
+    def columns(self):
+        """ Function that returns the row as a list in CONFIGURE column order, the host only if it is set """
+
+        columns = [self.ioc_type, self.ioc_name, self.asyn_port, self.ioc_port, self.connection]
+        if self.host:
+            columns.append(self.host)
+        return columns
+
+
+    def fields(self):
+        """ Function that returns every field of the row in IOC_ROW_FIELDS order, an unset host is empty """
+
+        return [getattr(self, field) for field in IOC_ROW_FIELDS]
+
+
+    def make_action(self, ioc_num, ioc_port=None):
+        """
+        Function that creates the IOCAction for this row, an auto asyn port becomes the driver
+        name followed by ioc_num ex. UVC2
+
+        Parameters
+        ----------
+        ioc_num : int
+            number of the IOC among those of its driver type
+        ioc_port : str
+            telnet port assigned by allocate_iocs, None to use the one of the row
+
+        Returns
+        -------
+        IOCAction
+            the IOC to generate
+        """
+
+        asyn_port = self.ioc_type[2:] + str(ioc_num) if self.asyn_port == AUTO_VALUE else self.asyn_port
+        return IOCAction(self.ioc_type, self.ioc_name, ioc_port or self.ioc_port, self.connection, ioc_num, asyn_port, self.host)
+
+
+class ConfigModel:
+    """
+    Parsed contents of the CONFIGURE file, shared by the command line tool and the GUI
+
+    Attributes
+    ----------
+    path : str
+        path to the CONFIGURE file
+    entries : dict of str -> ConfigEntry
+        global settings in file order
+    iocs : list of IOCRow
+        IOC rows in file order
+    comments : list of (int, str)
+        line number and text of every comment line
+    lines : list of str
+        lines of the file as last read or saved, used to keep comments and formatting when saving
+    row_lines : set of int
+        line numbers of IOC rows in lines
+
+    Methods
+    -------
+    get_entry(key : str)
+        returns a global setting, or an empty one if it is not set
+    set_entry(key : str, value : str)
+        changes a global setting, adding it if it is not set
+    configuration()
+        returns the global settings as a dictionary
+    bin_flat()
+        returns True if BINARIES_FLAT is set to YES
+    make_actions()
+        creates one IOCAction per IOC row, filling in auto ports
+    add_rows(rows : list of IOCRow)
+        appends IOC rows
+    serialize()
+        returns the file contents for the current settings and rows
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.iocs = []
+        self.comments = []
+        self.lines = []
+        self.row_lines = set()
+
+
+    def get_entry(self, key):
+        """
+        Function that returns a global setting
+
+        Parameters
+        ----------
+        key : str
+            name of the setting
+
+        Returns
+        -------
+        ConfigEntry
+            the setting, an empty one with line 0 if it is not in the file
+        """
+
+        if key in self.entries:
+            return self.entries[key]
+        return ConfigEntry(key, "")
+
+
+    def set_entry(self, key, value):
+        """
+        Function that changes a global setting, settings that are not in the file yet are appended when saving
+
+        Parameters
+        ----------
+        key : str
+            name of the setting
+        value : str
+            new value
+        """
+
+        if key in self.entries:
+            self.entries[key].value = value
+        else:
+            self.entries[key] = ConfigEntry(key, value)
+
+
+    def configuration(self):
+        """ Function that returns the global settings as a dict of str -> str """
+
+        return dict([(key, entry.value) for key, entry in self.entries.items()])
+
+
+    def bin_flat(self):
+        """ Function that returns the BINARIES_FLAT setting as a bool, stacked if unset """
+
+        return self.get_entry("BINARIES_FLAT").value.upper() == "YES"
+
+
+    def make_actions(self):
+        """
+        Function that returns one IOCAction per IOC row, numbered per driver type and with auto
+        ports filled in by allocate_iocs
+
+        Raises
+        ------
+        ConfigError
+            if IOC_PORT_RANGE has no free port left for an auto port
+        """
+
+        actions = []
+        for row, (ioc_num, ioc_port, allocation) in zip(self.iocs, allocate_iocs(self.iocs, self.configuration(), self.path)):
+            action = row.make_action(ioc_num, ioc_port)
+            action.allocation = allocation
+            actions.append(action)
+        return actions
+
+
+    def add_rows(self, rows):
+        """
+        Function that appends IOC rows, they are numbered when the IOCs are made with make_actions
+
+        Parameters
+        ----------
+        rows : list of IOCRow
+            rows to append
+        """
+
+        self.iocs.extend(rows)
+
+
+    def serialize(self):
+        """
+        Function that returns the file contents for the current settings and rows. Comments, blank
+        lines and unchanged lines are kept as they are, changed values are replaced in place so the
+        column alignment is kept, deleted rows are dropped, new rows follow the last IOC row and new
+        settings are appended at the end.
+
+        Returns
+        -------
+        str
+            contents of the CONFIGURE file
+        """
+
+        entries_by_line = dict([(entry.line, entry) for entry in self.entries.values() if entry.line > 0])
+        rows_by_line = dict([(row.line, row) for row in self.iocs if row.line > 0])
+        new_rows = ["   ".join(row.columns()) + "\n" for row in self.iocs if row.line == 0]
+        new_entries = ["{}={}\n".format(entry.key, entry.value) for entry in self.entries.values()
+            if entry.line == 0 and entry.value != ""]
+        insert_after = max(self.row_lines) if len(self.row_lines) > 0 else len(self.lines)
+
+        lines = []
+        for line_num, text in enumerate(self.lines, 1):
+            if not text.endswith("\n"):
+                text = text + "\n"
+            if line_num in entries_by_line:
+                lines.append(format_entry_line(text, entries_by_line[line_num]))
+            elif line_num in rows_by_line:
+                lines.append(format_row_line(text, rows_by_line[line_num]))
+            elif line_num not in self.row_lines:
+                lines.append(text)
+            if line_num == insert_after:
+                lines.extend(new_rows)
+        if insert_after == 0:
+            lines.extend(new_rows)
+        lines.extend(new_entries)
+        return "".join(lines)
+
+
+# KEY=value global settings of the CONFIGURE file
+CONFIG_ENTRY_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=(.*)$')
+# whitespace separated columns of an IOC row
+CONFIG_COLUMN_PATTERN = re.compile(r'\S+')
+# column names of an IOC row, in file order, the last one is optional
+IOC_ROW_COLUMNS = ["IOC Type", "IOC Name", "Asyn Port", "IOC Port", "Cam Connection", "Host"]
+# field names of an IOC row in CSV and YAML inventories, in file order
+IOC_ROW_FIELDS = ["ioc_type", "ioc_name", "asyn_port", "ioc_port", "connection", "host"]
+# number of columns every IOC row must have
+IOC_ROW_REQUIRED = 5
+# other accepted inventory field names
+IOC_ROW_FIELD_ALIASES = {"type": "ioc_type", "name": "ioc_name", "asyn": "asyn_port", "port": "ioc_port",
+    "cam_connection": "connection"}
+# value of the Asyn Port or IOC Port column that lets allocate_iocs fill it in
+AUTO_VALUE = "auto"
+# columns that may be auto, in IOC_ROW_FIELDS order
+IOC_ROW_AUTO_FIELDS = ["asyn_port", "ioc_port"]
+# telnet ports handed out to auto IOC ports unless IOC_PORT_RANGE is set
+DEFAULT_PORT_RANGE = "4000-4999"
+# file next to CONFIGURE remembering the number and auto port of every IOC between runs
+ALLOCATION_FILE = "initiocs_allocations.json"
+
+
+def check_ioc_values(values):
+    """
+    Function that checks the values of an IOC row
+
+    Parameters
+    ----------
+    values : list of str
+        the columns of the row, in IOC_ROW_COLUMNS order
+
+    Returns
+    -------
+    list of (int, str)
+        index of the offending column and message of every problem found
+    """
+
+    errors = []
+    if not values[0].startswith("AD"):
+        errors.append((0, "IOC type {} must start with AD".format(values[0])))
+    if not values[3].isdigit() and values[3] != AUTO_VALUE:
+        errors.append((3, "IOC port {} is not a number or {}".format(values[3], AUTO_VALUE)))
+    return errors
+
+
+def parse_ioc_row(text, line_num=0):
+    """
+    Function that parses a single IOC row
+
+    Parameters
+    ----------
+    text : str
+        the row ex. ADProsilica  cam-ps1  PS1  4001  10.0.0.1  ioc-server2
+    line_num : int
+        line number of the row, used for IOCRow.line and error messages
+
+    Returns
+    -------
+    row : IOCRow
+        the parsed row, None if there were errors
+    errors : list of (int, int, str)
+        line number, column and message of every problem found
+    """
+
+    columns = [(match.start() + 1, match.group()) for match in CONFIG_COLUMN_PATTERN.finditer(text)]
+    errors = []
+    if len(columns) not in [IOC_ROW_REQUIRED, len(IOC_ROW_COLUMNS)]:
+        column = columns[-1][0] if len(columns) > 0 else 1
+        errors.append((line_num, column, "expected {} columns ({}) and an optional {}, found {}".format(
+            IOC_ROW_REQUIRED, ", ".join(IOC_ROW_COLUMNS[:IOC_ROW_REQUIRED]), IOC_ROW_COLUMNS[-1], len(columns))))
+        return None, errors
+    values = [value for column, value in columns]
+    for index, message in check_ioc_values(values):
+        errors.append((line_num, columns[index][0], message))
+    if len(errors) > 0:
+        return None, errors
+    host = values[5] if len(values) > IOC_ROW_REQUIRED else ""
+    return IOCRow(values[0], values[1], values[2], values[3], values[4], line_num, host), errors
+
+
+def inventory_field(name):
+    """ Function that maps an inventory column or key name ex. "IOC Port" to its IOC_ROW_FIELDS name, None if unknown """
+
+    field = re.sub(r'[\s\-]+', "_", str(name).strip().lower())
+    field = IOC_ROW_FIELD_ALIASES.get(field, field)
+    if field in IOC_ROW_FIELDS:
+        return field
+    return None
+
+
+def read_inventory_records(path):
+    """
+    Function that reads the records of a CSV or YAML detector inventory. CSV files either start
+    with a header naming the columns, or list the columns in CONFIGURE order. YAML files hold a
+    list of mappings, either at the top level or under an iocs key.
+
+    Parameters
+    ----------
+    path : str
+        path to the inventory, .yaml/.yml files are read as YAML, everything else as CSV
+
+    Returns
+    -------
+    records : list of (int, dict of str -> str)
+        line or record number and the values of each record by IOC_ROW_FIELDS name
+    errors : list of (int, int, str)
+        line number, column and message of every record that could not be read
+    """
+
+    records = []
+    errors = []
+    if path.lower().endswith((".yaml", ".yml")):
+        # PyYAML is optional and only imported when a YAML inventory is read
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigError(path, [(0, 0, "reading YAML inventories requires PyYAML, install it or use CSV")])
+        with open(path, "r") as inventory:
+            try:
+                data = yaml.safe_load(inventory)
+            except yaml.YAMLError as err:
+                mark = getattr(err, "problem_mark", None)
+                line, column = (mark.line + 1, mark.column + 1) if mark is not None else (0, 0)
+                raise ConfigError(path, [(line, column, "invalid YAML: {}".format(err))])
+        if isinstance(data, dict):
+            data = data.get("iocs")
+        if not isinstance(data, list):
+            raise ConfigError(path, [(0, 0, "expected a list of IOCs, optionally under an iocs key")])
+        for record_num, item in enumerate(data, 1):
+            if not isinstance(item, dict):
+                errors.append((record_num, 0, "IOC {} is not a mapping".format(record_num)))
+                continue
+            record = {}
+            for key, value in item.items():
+                field = inventory_field(key)
+                if field is None:
+                    errors.append((record_num, 0, "unknown field {}".format(key)))
+                elif value is not None:
+                    record[field] = str(value).strip()
+            records.append((record_num, record))
+        return records, errors
+
+    with open(path, "r", newline="") as inventory:
+        reader = csv.reader(inventory)
+        fields = None
+        for row in reader:
+            values = [value.strip() for value in row]
+            if len(values) == 0 or values[0].startswith("#") or all(value == "" for value in values):
+                continue
+            if fields is None:
+                header = [inventory_field(value) for value in values]
+                if None not in header:
+                    fields = header
+                    continue
+                fields = IOC_ROW_FIELDS
+            if len(values) > len(fields):
+                errors.append((reader.line_num, len(fields) + 1, "expected at most {} columns, found {}".format(
+                    len(fields), len(values))))
+                continue
+            records.append((reader.line_num, dict(zip(fields, values))))
+    return records, errors
+
+
+def import_inventory(path, existing_names=()):
+    """
+    Function that reads and validates a CSV or YAML detector inventory in one pass. Every record
+    is checked like a CONFIGURE row, and IOC names must be unique across the inventory and the
+    IOCs that already exist
+
+    Parameters
+    ----------
+    path : str
+        path to the inventory
+    existing_names : iterable of str
+        names of the IOCs already configured
+
+    Returns
+    -------
+    list of IOCRow
+        the imported rows, in inventory order
+
+    Raises
+    ------
+    ConfigError
+        listing every record that could not be imported, no rows are returned if there is any
+    """
+
+    records, errors = read_inventory_records(path)
+    names = set(existing_names)
+    rows = []
+    for line_num, record in records:
+        values = [record.get(field, "") or (AUTO_VALUE if field in IOC_ROW_AUTO_FIELDS else "") for field in IOC_ROW_FIELDS]
+        record_errors = []
+        for index, value in enumerate(values):
+            if value == "" and index < IOC_ROW_REQUIRED:
+                record_errors.append((line_num, index + 1, "missing {}".format(IOC_ROW_COLUMNS[index])))
+            elif value != "" and len(value.split()) != 1:
+                record_errors.append((line_num, index + 1, "{} {} must not contain whitespace".format(IOC_ROW_COLUMNS[index], value)))
+        if len(record_errors) == 0:
+            for index, message in check_ioc_values(values):
+                record_errors.append((line_num, index + 1, message))
+        if values[1] != "" and values[1] in names:
+            record_errors.append((line_num, 2, "IOC name {} is already used".format(values[1])))
+        names.add(values[1])
+        errors.extend(record_errors)
+        if len(record_errors) == 0:
+            rows.append(IOCRow(values[0], values[1], values[2], values[3], values[4], host=values[5]))
+    if len(errors) > 0:
+        raise ConfigError(path, sorted(errors))
+    return rows
+
+
+def format_entry_line(text, entry):
+    """ Function that returns a KEY=value line with the value of entry, the line is kept as is if the value did not change """
+
+    match = CONFIG_ENTRY_PATTERN.match(text.rstrip("\r\n"))
+    if match is None or match.group(2).strip() == entry.value:
+        return text
+    return text[:match.start(2)] + entry.value + "\n"
+
+
+def format_row_line(text, row):
+    """ Function that returns an IOC row line with the values of row, changed columns are replaced in place """
+
+    columns = list(CONFIG_COLUMN_PATTERN.finditer(text))
+    values = row.columns()
+    if [column.group() for column in columns] == values:
+        return text
+    if len(columns) != len(values):
+        return "   ".join(values) + "\n"
+    line = text[:columns[0].start()]
+    for index, (column, value) in enumerate(zip(columns, values)):
+        if index > 0:
+            separator = text[columns[index - 1].end():column.start()]
+            if separator.strip(" ") == "":
+                # keep the column where it was if the previous value still fits
+                separator = " " * max(1, column.start() - len(line))
+            line = line + separator
+        line = line + value
+    return line + text[columns[-1].end():]
+
+
+def parse_configure(path="CONFIGURE.txt"):
+    """
+    Function that parses the CONFIGURE file in a single pass. The block of comment lines directly
+    above a global setting is attached to it, section headers (#---) are not.
+
+    Parameters
+    ----------
+    path : str
+        path to the CONFIGURE file
+
+    Returns
+    -------
+    ConfigModel
+        the parsed file
+
+    Raises
+    ------
+    ConfigError
+        listing every line that could not be parsed
+    """
+
+    with open(path, "r") as config_file:
+        return parse_configure_lines(path, config_file.readlines())
+
+
+def parse_configure_lines(path, lines):
+    """
+    Function that parses the lines of a CONFIGURE file, see parse_configure
+
+    Parameters
+    ----------
+    path : str
+        path to the CONFIGURE file, used in error messages
+    lines : list of str
+        lines of the file
+
+    Returns
+    -------
+    ConfigModel
+        the parsed file
+
+    Raises
+    ------
+    ConfigError
+        listing every line that could not be parsed
+    """
+
+    model = ConfigModel(path)
+    model.lines = lines
+    errors = []
+    pending_comments = []
+    for line_num, line in enumerate(lines, 1):
+        text = line.rstrip("\r\n")
+        stripped = text.strip()
+        if stripped == "":
+            pending_comments = []
+            continue
+        if stripped.startswith("#"):
+            model.comments.append((line_num, stripped))
+            if not stripped.startswith("#---"):
+                pending_comments.append(stripped)
+            continue
+        match = CONFIG_ENTRY_PATTERN.match(text)
+        if match is not None:
+            key = match.group(1)
+            value = match.group(2).strip()
+            if key in model.entries:
+                errors.append((line_num, match.start(1) + 1, "{} is already set on line {}".format(key, model.entries[key].line)))
+            elif key == "BINARIES_FLAT" and value.upper() not in ["YES", "NO"]:
+                errors.append((line_num, match.start(2) + 1, "BINARIES_FLAT must be YES or NO"))
+            elif key == "TEMPLATE_MODE" and value not in ["clone", "link"]:
+                errors.append((line_num, match.start(2) + 1, "TEMPLATE_MODE must be clone or link"))
+            elif key == "DEPLOY_TRANSPORT" and value not in [""] + sorted(TRANSPORTS):
+                errors.append((line_num, match.start(2) + 1, "DEPLOY_TRANSPORT must be one of {}".format(", ".join(sorted(TRANSPORTS)))))
+            elif key == "IOC_PORT_RANGE" and value != "" and parse_port_range(value) is None:
+                errors.append((line_num, match.start(2) + 1, "IOC_PORT_RANGE must be first-last ex. {}".format(DEFAULT_PORT_RANGE)))
+            elif key == "DEPLOY_JOBS_PER_HOST" and not (value == "" or value.isdigit() and int(value) > 0):
+                errors.append((line_num, match.start(2) + 1, "DEPLOY_JOBS_PER_HOST must be a positive number"))
+            else:
+                model.entries[key] = ConfigEntry(key, value, line_num, pending_comments)
+        else:
+            row, row_errors = parse_ioc_row(text, line_num)
+            errors.extend(row_errors)
+            model.row_lines.add(line_num)
+            if row is not None:
+                model.iocs.append(row)
+        pending_comments = []
+
+    # copy writes into DEPLOY_DIR on this machine, IOC_DIR would be compared with itself and copy nothing
+    transport = model.entries.get("DEPLOY_TRANSPORT")
+    deploy_dir = model.entries.get("DEPLOY_DIR")
+    if transport is not None and transport.value == "copy":
+        hosts = set(row.host for row in model.iocs if row.host != "")
+        if deploy_dir is None or deploy_dir.value == "":
+            errors.append((transport.line, lines[transport.line - 1].index("=") + 2, "DEPLOY_TRANSPORT=copy needs a DEPLOY_DIR"))
+        elif len(hosts) > 1 and "{host}" not in deploy_dir.value:
+            errors.append((deploy_dir.line, lines[deploy_dir.line - 1].index("=") + 2,
+                "DEPLOY_DIR must contain {host} to copy IOCs to several hosts"))
+
+    if len(errors) > 0:
+        errors.sort(key=lambda error: error[:2])
+        raise ConfigError(path, errors)
+    return model
+
+
+def save_configure(model):
+    """
+    Function that writes the model back to its CONFIGURE file. Nothing is written if the contents
+    did not change. The new contents are parsed first, so an invalid model never replaces a valid
+    file, and written through a temporary file that is moved over the old one in one rename.
+
+    Parameters
+    ----------
+    model : ConfigModel
+        the model to save, its line numbers are updated to the saved file
+
+    Returns
+    -------
+    bool
+        True if the file was written, False if it did not change
+
+    Raises
+    ------
+    ConfigError
+        listing every problem with the contents, the file is left unchanged
+    """
+
+    text = model.serialize()
+    if text == "".join(model.lines):
+        return False
+    lines = text.splitlines(True)
+    saved = parse_configure_lines(model.path, lines)
+
+    directory = os.path.dirname(os.path.abspath(model.path))
+    handle, temp_path = tempfile.mkstemp(prefix=".CONFIGURE-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(handle, "w") as config_file:
+            config_file.write(text)
+        if os.path.exists(model.path):
+            shutil.copymode(model.path, temp_path)
+        os.replace(temp_path, model.path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # rows and settings are saved in model order, so the new line numbers can be copied over
+    for row, saved_row in zip(model.iocs, saved.iocs):
+        row.line = saved_row.line
+    for key, saved_entry in saved.entries.items():
+        model.entries[key].line = saved_entry.line
+    model.lines = lines
+    model.row_lines = saved.row_lines
+    model.comments = saved.comments
+    return True
+
+
+def validate_iocs(iocs, configuration, template_index=None, check_listening=True):
+    """
+    Function that checks the IOCs and global settings before generating. Every IOC is added to
+    hash indexes of names, telnet ports and asyn ports in a single pass, after which every group
+    with more than one IOC is a conflict, so all problems are found at once.
+
+    Parameters
+    ----------
+    iocs : list of IOCRow or IOCAction
+        the IOCs to check
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    template_index : TemplateIndex
+        index of the template, used to find IOC types without a startup script. None to skip this check
+    check_listening : bool
+        flag for checking if a service is already listening on the telnet port of an IOC on its host
+
+    Returns
+    -------
+    list of (IOCRow or IOCAction, str, str, str)
+        IOC (None for a global setting), field or setting name, severity and message of every issue
+    """
+
+    issues = []
+    hostname = configuration.get("HOSTNAME", "")
+    names = {}
+    ports = {}
+    host_ports = {}
+    asyn_ports = {}
+    for ioc in iocs:
+        names.setdefault(ioc.ioc_name, []).append(ioc)
+        # auto values of rows are only known once allocate_iocs ran, and never collide
+        if ioc.asyn_port != AUTO_VALUE:
+            asyn_ports.setdefault(ioc.asyn_port or ioc.ioc_type[2:] + "1", []).append(ioc)
+        host = getattr(ioc, "host", "") or hostname
+        if getattr(ioc, "host", "") and (":" in ioc.host or not valid_ca_address(ioc.host)):
+            issues.append((ioc, "host", VALIDATION_ERROR, "host {!r} is not a host name or IP address".format(ioc.host)))
+        if ioc.ioc_port == AUTO_VALUE:
+            pass
+        elif not ioc.ioc_port.isdigit() or not 0 < int(ioc.ioc_port) < 65536:
+            issues.append((ioc, "ioc_port", VALIDATION_ERROR, "IOC port {} is not between 1 and 65535".format(ioc.ioc_port)))
+        else:
+            # telnet ports only have to be unique per IOC server
+            ports.setdefault("{} on {}".format(int(ioc.ioc_port), host) if host else ioc.ioc_port, []).append(ioc)
+            host_ports.setdefault(host, {}).setdefault(int(ioc.ioc_port), []).append(ioc)
+        if template_index is not None and template_index.lookup(ioc.ioc_type) is None:
+            issues.append((ioc, "ioc_type", VALIDATION_WARNING, "{} has no startup script in the template".format(ioc.ioc_type)))
+
+    for index, field, severity, description in [(names, "ioc_name", VALIDATION_ERROR, "IOC name"),
+            (ports, "ioc_port", VALIDATION_ERROR, "IOC port"), (asyn_ports, "asyn_port", VALIDATION_WARNING, "asyn port")]:
+        for value, group in index.items():
+            if len(group) > 1:
+                for ioc in group:
+                    others = ", ".join([ioc_label(other) for other in group if other is not ioc])
+                    issues.append((ioc, field, severity, "{} {} is also used by {}".format(description, value, others)))
+
+    prefix = configuration.get("PREFIX", "")
+    if PREFIX_PATTERN.match(prefix) is None:
+        issues.append((None, "PREFIX", VALIDATION_ERROR, "PREFIX {!r} is not a valid PV prefix".format(prefix)))
+    for address in configuration.get("CA_ADDRESS", "").split():
+        if not valid_ca_address(address):
+            issues.append((None, "CA_ADDRESS", VALIDATION_ERROR, "CA_ADDRESS entry {!r} is not a host or IP address".format(address)))
+
+    for host in sorted(host_ports):
+        if not check_listening or host == "":
+            continue
+        listening = listening_ports(host, sorted(host_ports[host]))
+        if listening is None:
+            issues.append((None, "HOSTNAME", VALIDATION_WARNING, "could not resolve host {}".format(host)))
+            continue
+        for port in sorted(listening):
+            for ioc in host_ports[host][port]:
+                issues.append((ioc, "ioc_port", VALIDATION_WARNING, "a service is already listening on {}:{}".format(host, port)))
+    return issues
+
+
+def ioc_label(ioc):
+    """ Function that names an IOCRow by its line or an IOCAction by its camera number, names alone may be duplicated """
+
+    if getattr(ioc, "line", 0) > 0:
+        return "{} (line {})".format(ioc.ioc_name, ioc.line)
+    if getattr(ioc, "ioc_num", 0) > 0:
+        return "{} ({}-Cam:{})".format(ioc.ioc_name, ioc.ioc_type[2:], ioc.ioc_num)
+    return ioc.ioc_name
+
+
+def valid_ca_address(address):
+    """ Function that checks a single CA_ADDRESS entry, an IPv4 address or host name with an optional port """
+
+    import ipaddress
+
+    host, separator, port = address.rpartition(":")
+    if separator == "":
+        host = port
+    elif not port.isdigit() or not 0 < int(port) < 65536:
+        return False
+    try:
+        ipaddress.IPv4Address(host)
+        return True
+    except ValueError:
+        pass
+    # dotted numbers that are not a valid IPv4 address, ex. 127.0.0.256
+    if re.match(r'^[0-9.]+$', host):
+        return False
+    return HOST_NAME_PATTERN.match(host) is not None
+
+
+def local_address(address):
+    """
+    Function that checks if a resolved address belongs to this machine
+
+    Parameters
+    ----------
+    address : str
+        IPv4 address of a host
+
+    Returns
+    -------
+    bool
+        True for loopback addresses and the address of this machine
+    """
+
+    if address.startswith("127."):
+        return True
+    try:
+        return address == socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return False
+
+
+def listening_ports(hostname, ports):
+    """
+    Function that finds which of the given ports have a service listening on HOSTNAME. For the
+    local host the listening sockets are read from /proc/net in one go, other hosts are probed
+    with short parallel connection attempts
+
+    Parameters
+    ----------
+    hostname : str
+        name of the host IOC server
+    ports : list of int
+        ports to check
+
+    Returns
+    -------
+    set of int
+        ports something is listening on, None if the host name could not be resolved
+    """
+
+    try:
+        address = socket.gethostbyname(hostname)
+    except OSError:
+        return None
+    wanted = set(ports)
+    if local_address(address) and os.path.exists("/proc/net/tcp"):
+        listening = set()
+        for table in ["/proc/net/tcp", "/proc/net/tcp6"]:
+            try:
+                with open(table, "r") as sockets:
+                    next(sockets)
+                    for line in sockets:
+                        fields = line.split()
+                        # state 0A is LISTEN
+                        if len(fields) > 3 and fields[3] == "0A":
+                            listening.add(int(fields[1].rsplit(":", 1)[1], 16))
+            except OSError:
+                continue
+        return listening & wanted
+
+    def probe(port):
+        try:
+            with socket.create_connection((address, port), timeout=PORT_PROBE_TIMEOUT):
+                return port
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(64, len(wanted))) as executor:
+        return set([port for port in executor.map(probe, sorted(wanted)) if port is not None])
+
+
+def print_validation(issues):
+    """
+    Function that prints every validation issue
+
+    Parameters
+    ----------
+    issues : list of (IOCRow or IOCAction, str, str, str)
+        issues returned by validate_iocs
+
+    Returns
+    -------
+    int
+        number of errors
+    """
+
+    errors = 0
+    for ioc, field, severity, message in issues:
+        if severity == VALIDATION_ERROR:
+            errors = errors + 1
+        print("{}: {}: {}".format(severity.capitalize(), ioc_label(ioc) if ioc is not None else field, message))
+    if len(issues) > 0:
+        print()
+    return errors
+
+
+def load_template_index(configuration):
+    """
+    Function that reads the template index from an existing mirror, without creating or fetching it
+
+    Parameters
+    ----------
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+
+    Returns
+    -------
+    TemplateIndex
+        index of the mirror, None if there is no mirror yet
+    """
+
+    template_cache = configuration.get("TEMPLATE_CACHE", "") or configuration.get("IOC_DIR", "") + "/.ioc-template.git"
+    if not os.path.isdir(template_cache):
+        return None
+    try:
+        return TemplateIndex.from_tree(TemplateTree(template_cache, get_template_revision(template_cache) or "HEAD"))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class FreeSet:
+    """
+    Integers in [first, last] that can still be handed out. Checking and taking a value are O(1)
+    set operations, and allocate returns the lowest free value in amortized O(1) since values are
+    never given back within a run, so the cursor only moves forward.
+
+    Attributes
+    ----------
+    first : int
+        lowest value of the range
+    last : int
+        highest value of the range
+    used : set of int
+        values that are taken
+    cursor : int
+        every value below it is taken
+    """
+
+    def __init__(self, first, last):
+        self.first = first
+        self.last = last
+        self.used = set()
+        self.cursor = first
+
+
+    def __contains__(self, value):
+        return isinstance(value, int) and self.first <= value <= self.last and value not in self.used
+
+
+    def take(self, value):
+        """ Function that marks value as used, returns False if it was taken or out of range """
+
+        if value not in self:
+            return False
+        self.used.add(value)
+        return True
+
+
+    def allocate(self):
+        """ Function that takes and returns the lowest free value, None if the range is exhausted """
+
+        while self.cursor in self.used:
+            self.cursor = self.cursor + 1
+        if self.cursor > self.last:
+            return None
+        self.used.add(self.cursor)
+        return self.cursor
+
+
+def parse_port_range(text):
+    """
+    Function that parses an IOC_PORT_RANGE value ex. 4000-4999
+
+    Returns
+    -------
+    (int, int)
+        first and last port, None if text is not a valid range
+    """
+
+    match = re.match(r'^\s*(\d+)\s*-\s*(\d+)\s*$', text)
+    if match is None:
+        return None
+    first, last = int(match.group(1)), int(match.group(2))
+    if not 0 < first <= last < 65536:
+        return None
+    return first, last
+
+
+def allocation_path(config_path):
+    """ Function that returns the path of the allocation file kept next to a CONFIGURE file """
+
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), ALLOCATION_FILE)
+
+
+def read_allocations(path):
+    """
+    Function that reads the allocations saved by a previous run
+
+    Parameters
+    ----------
+    path : str
+        allocation file
+
+    Returns
+    -------
+    dict of str -> dict
+        IOC name -> type, number and auto port, empty if the file does not exist yet
+
+    Raises
+    ------
+    ConfigError
+        if the file cannot be read or is not a valid allocation file, numbering from scratch
+        would shift the PV names of existing IOCs
+    """
+
+    try:
+        with open(path, "r") as allocation_file:
+            allocations = json.load(allocation_file).get("iocs")
+    except FileNotFoundError:
+        return {}
+    except OSError as err:
+        raise ConfigError(path, [(0, 0, "cannot read allocation file: {}".format(err))])
+    except (ValueError, AttributeError) as err:
+        raise ConfigError(path, [(0, 0, "invalid allocation file: {}".format(err))])
+    if not isinstance(allocations, dict):
+        raise ConfigError(path, [(0, 0, "invalid allocation file: expected an iocs mapping")])
+    return allocations
+
+
+def write_allocations(path, allocations):
+    """
+    Function that replaces the allocation file in one step, through a temporary file that keeps
+    the permissions of the old file, or is readable by everyone sharing the directory
+
+    Parameters
+    ----------
+    path : str
+        allocation file
+    allocations : dict of str -> dict
+        IOC name -> type, number and auto port
+    """
+
+    handle, temp_path = tempfile.mkstemp(prefix="." + ALLOCATION_FILE + ".", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, "w") as allocation_file:
+            json.dump({"iocs": allocations}, allocation_file, indent=4, sort_keys=True)
+            allocation_file.write("\n")
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def save_allocations(path, actions):
+    """
+    Function that saves the numbers and auto ports of the generated IOCs, so the next run assigns
+    them again. Only called after a successful generation, planning or validating saves nothing.
+
+    Parameters
+    ----------
+    path : str
+        allocation file
+    actions : list of IOCAction
+        every IOC of the CONFIGURE file, with the allocation made by allocate_iocs
+
+    Returns
+    -------
+    bool
+        True if the file was written, False if nothing changed
+    """
+
+    allocations = dict([(action.ioc_name, action.allocation) for action in actions if action.allocation is not None])
+    if allocations == read_allocations(path):
+        return False
+    write_allocations(path, allocations)
+    return True
+
+
+def allocate_iocs(rows, configuration, config_path):
+    """
+    Function that numbers every IOC per driver type and assigns a telnet port from IOC_PORT_RANGE
+    to every IOC whose port is auto. Assignments are read from the allocation file, so an IOC keeps
+    its number, and with it its PV prefix, and its port when rows are added, removed or reordered.
+    Nothing is written, save_allocations stores the new assignments once the IOCs were generated.
+    Explicit ports are taken first so auto ports never collide with them, then the remembered
+    assignments, then the remaining IOCs get the lowest free values in file order. Ports are only
+    unique per host.
+
+    Parameters
+    ----------
+    rows : list of IOCRow
+        IOC rows in file order
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    config_path : str
+        path to the CONFIGURE file, the allocation file is read from next to it
+
+    Returns
+    -------
+    list of (int, str, dict)
+        IOC number, telnet port and allocation to save of every row
+
+    Raises
+    ------
+    ConfigError
+        if IOC_PORT_RANGE has no free port left for an auto port, or the allocation file is invalid
+    """
+
+    first, last = parse_port_range(configuration.get("IOC_PORT_RANGE", "") or DEFAULT_PORT_RANGE)
+    hostname = configuration.get("HOSTNAME", "")
+    path = allocation_path(config_path)
+    previous = read_allocations(path)
+    port_pools = {}
+    number_pools = {}
+
+    def port_pool(row):
+        return port_pools.setdefault(row.host or hostname, FreeSet(first, last))
+
+    def number_pool(row):
+        return number_pools.setdefault(row.ioc_type[2:], FreeSet(1, sys.maxsize))
+
+    numbers = [None] * len(rows)
+    ports = [None] * len(rows)
+    for index, row in enumerate(rows):
+        if row.ioc_port != AUTO_VALUE:
+            port_pool(row).take(int(row.ioc_port) if row.ioc_port.isdigit() else None)
+            ports[index] = row.ioc_port
+    for index, row in enumerate(rows):
+        kept = previous.get(row.ioc_name)
+        if not isinstance(kept, dict) or kept.get("type") != row.ioc_type:
+            continue
+        if number_pool(row).take(kept.get("number")):
+            numbers[index] = kept["number"]
+        if ports[index] is None and port_pool(row).take(kept.get("ioc_port")):
+            ports[index] = str(kept["ioc_port"])
+    errors = []
+    for index, row in enumerate(rows):
+        if numbers[index] is None:
+            numbers[index] = number_pool(row).allocate()
+        if ports[index] is None:
+            port = port_pool(row).allocate()
+            if port is None:
+                errors.append((row.line, 0, "no free port left in IOC_PORT_RANGE {}-{} for {}".format(first, last, row.ioc_name)))
+            ports[index] = str(port)
+    if len(errors) > 0:
+        raise ConfigError(config_path, errors)
+
+    allocations = []
+    for row, number, port in zip(rows, numbers, ports):
+        allocation = {"type": row.ioc_type, "number": number}
+        if row.ioc_port == AUTO_VALUE:
+            allocation["ioc_port"] = int(port)
+        allocations.append(allocation)
+    return list(zip(numbers, ports, allocations))
+
+
+def read_ioc_config(path="CONFIGURE.txt"):
+    """
+    Function for reading the CONFIGURE file. Returns a dictionary of configure options,
+    a list of IOCAction instances, and a boolean representing if binaries are flat or not
+
+    Parameters
+    ----------
+    path : str
+        path to the CONFIGURE file
+
+    Returns
+    -------
+    ioc_actions : List of IOCAction
+        list of IOC actions that need to be performed.
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        toggle for flat or stacked binary directory structure
+    """
+
+    model = parse_configure(path)
+    return model.make_actions(), model.configuration(), model.bin_flat()
+
+
+def init_ioc_dir(ioc_top):
+    """
+    Function that creates ioc directory if it has not already been created.
+
+    Parameters
+    ----------
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+
+    Raises
+    ------
+    ConfigError
+        if IOC_DIR is not set
+    """
+
+    if ioc_top == "":
+        raise ConfigError("CONFIGURE", [(0, 0, "IOC_DIR is not set, IOC top not initialized")])
+    elif os.path.exists(ioc_top) and os.path.isdir(ioc_top):
+        print("IOC Dir already exits.")
+        print()
+    else:
+        os.mkdir(ioc_top)
+
+
+def init_template_cache(cache_dir, template_url, refresh=False):
+    """
+    Function that creates the local ioc-template mirror if it does not exist yet.
+    The mirror is only fetched from the upstream again if a refresh is requested,
+    so repeated runs and air-gapped hosts never touch the network.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Path to the bare ioc-template mirror
+    template_url : str
+        Upstream ioc-template repository, may also be a local path or bundle
+    refresh : bool
+        flag for fetching new upstream commits into an existing mirror
+
+    Returns
+    -------
+    int
+        -1 if error, 0 if success
+    """
+
+    if not os.path.exists(cache_dir):
+        print("Creating ioc-template mirror from {} in {}".format(template_url, cache_dir))
+        out = subprocess.call(["git", "clone", "--quiet", "--mirror", template_url, cache_dir])
+        if out != 0:
+            print("Error failed to mirror IOC template from {}".format(template_url))
+            return -1
+    elif refresh:
+        print("Refreshing ioc-template mirror in {}".format(cache_dir))
+        out = subprocess.call(["git", "--git-dir", cache_dir, "remote", "set-url", "origin", template_url])
+        if out == 0:
+            out = subprocess.call(["git", "--git-dir", cache_dir, "fetch", "--quiet", "--prune", "origin"])
+        if out != 0:
+            print("Error failed to refresh IOC template mirror, using cached version")
+    else:
+        print("Using cached ioc-template mirror in {}".format(cache_dir))
+    print()
+    return 0
+
+
+def get_template_revision(template_cache):
+    """
+    Function that returns the commit the ioc-template mirror currently points to
+
+    Parameters
+    ----------
+    template_cache : str
+        path to the local ioc-template mirror
+
+    Returns
+    -------
+    str
+        commit hash, empty if it could not be determined
+    """
+
+    try:
+        return subprocess.check_output(["git", "--git-dir", template_cache, "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def get_template_cache(configuration, ioc_top, refresh=False):
+    """
+    Function that reads the template options from the configuration and prepares the mirror
+
+    Parameters
+    ----------
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+    refresh : bool
+        flag for fetching new upstream commits into an existing mirror
+
+    Returns
+    -------
+    template_cache : str
+        path to the local mirror, or None if it could not be created
+    """
+
+    template_url = configuration.get("TEMPLATE_URL", "") or TEMPLATE_URL
+    template_cache = configuration.get("TEMPLATE_CACHE", "") or ioc_top + "/.ioc-template.git"
+    if init_template_cache(template_cache, template_url, refresh) != 0:
+        return None
+    return template_cache
+
+
+def print_start_message():
+    """
+    Function for printing initial message
+    """
+
+    print("+----------------------------------------------------------------+")
+    print("+ initIOCs, Version: " + version +"                                      +")
+    print("+ Author: Jakub Wlodek                                           +")
+    print("+ Copyright (c): Brookhaven National Laboratory 2018-2019        +")
+    print("+ This software comes with NO warranty!                          +")
+    print("+----------------------------------------------------------------+")
+    print()
+
+
+def plan_ioc_action(action, configuration, bin_flat, template_tree, template_index, binary_index, renderer):
+    """
+    Function that works out everything generating an IOC would do, without cloning or writing
+    anything: the startup script, autosave request and dependency files taken from the template,
+    the binary, and the contents of st.cmd, unique.cmd, config and envPaths. Changed files are
+    shown as a diff against the existing IOC, or against the template for a new IOC.
+
+    Parameters
+    ----------
+    action : IOCAction
+        the IOC to plan
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    template_tree : TemplateTree
+        template files at the revision of the mirror
+    template_index : TemplateIndex
+        index of the template files built from template_tree
+    binary_index : BinaryIndex
+        index of the binary distribution shared by all IOCs
+    renderer : TemplateRenderer
+        compiled templates built from template_tree
+
+    Returns
+    -------
+    status : str
+        create, update, unchanged, skip or error
+    lines : list of str
+        description of the planned changes, including the diffs
+    """
+
+    import difflib
+
+    ioc_top = configuration["IOC_DIR"]
+    ioc_path = ioc_top + "/" + action.ioc_name
+    lines = []
+    exists = os.path.exists(ioc_path)
+    if exists:
+        manifest = build_manifest(action, configuration, bin_flat, template_tree.revision, binary_index, renderer)
+        old_manifest = read_manifest(ioc_path)
+        if old_manifest is None:
+            return "error", ["IOC directory {} exists and was not generated by initIOCs".format(ioc_path)]
+        elif old_manifest.get("hash") == manifest["hash"]:
+            return "unchanged", []
+
+    driver = template_index.lookup(action.ioc_type)
+    if driver is None:
+        return "skip", ["{} is not yet supported by initIOCs".format(action.ioc_type)]
+    ioc_bin = binary_index.get_binary(action.ioc_type)
+    if ioc_bin is None:
+        return "error", ["could not find an executable for {}".format(action.ioc_type)]
+    lines.append("startup script: {}".format(driver.startup))
+    lines.append("binary: {}".format(ioc_bin))
+    lines.append("autosave request: {}".format(driver.autosave))
+    for file in driver.dependencies:
+        lines.append("dependency file: {}".format(file))
+
+    planned = [
+        ("st.cmd", driver.startup, {"BINARY": ioc_bin}),
+        ("unique.cmd", "unique.cmd", action.unique_values(configuration["TOP_BINARY_DIR"], bin_flat, configuration["PREFIX"],
+            configuration["ENGINEER"], action.host or configuration["HOSTNAME"], configuration["CA_ADDRESS"])),
+        ("config", "config", action.config_values(action.host or configuration["HOSTNAME"])),
+        ("envPaths", "envPaths", action.env_path_values(bin_flat)),
+    ]
+    for file, template_file, values in planned:
+        template = renderer.get(template_file)
+        if template is None:
+            continue
+        template_lines = template.lines
+        new_lines = renderer.render(template_file, values).splitlines(True)
+        if exists and os.path.exists(ioc_path + "/" + file):
+            with open(ioc_path + "/" + file, "r") as old_file:
+                old_lines = old_file.readlines()
+            from_file = ioc_path + "/" + file
+        else:
+            old_lines = template_lines
+            from_file = "ioc-template/" + template_file
+        for diff_line in difflib.unified_diff(old_lines, new_lines, from_file, ioc_path + "/" + file):
+            lines.append(diff_line.rstrip("\n"))
+
+    if exists:
+        return "update", lines
+    return "create", lines
+
+
+def plan_iocs(actions, configuration, bin_flat, refresh_template=False, rescan=False):
+    """
+    Function that prints the plan of every IOC without generating anything. Only the template
+    mirror and binary index caches may be created or refreshed.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        list of IOC actions that would be performed.
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    refresh_template : bool
+        flag for fetching the latest ioc-template into the local mirror before planning
+    rescan : bool
+        flag for rebuilding the binary index even if its cache is still valid
+
+    Returns
+    -------
+    results : list of (IOCAction, str)
+        each IOC with its planned status, None if the template could not be prepared
+    """
+
+    ioc_top = configuration["IOC_DIR"]
+    template_cache = get_template_cache(configuration, ioc_top, refresh_template)
+    if template_cache is None:
+        return None
+    template_tree = TemplateTree(template_cache, get_template_revision(template_cache) or "HEAD")
+    template_index = TemplateIndex.from_tree(template_tree)
+    renderer = TemplateRenderer(template_tree, template_index, configuration.get("TEMPLATE_OVERRIDES", ""))
+    cache_file = None
+    if os.path.isdir(ioc_top):
+        cache_file = ioc_top + "/" + BINARY_INDEX_CACHE
+    binary_index = BinaryIndex(configuration["TOP_BINARY_DIR"], bin_flat, cache_file, rescan)
+
+    results = []
+    for action in actions:
+        status, lines = plan_ioc_action(action, configuration, bin_flat, template_tree, template_index, binary_index, renderer)
+        print("{} {} ({})".format(status, action.ioc_name, action.ioc_type))
+        for line in lines:
+            print("    " + line)
+        results.append((action, status))
+    print()
+    for status in ["create", "update", "unchanged", "skip", "error"]:
+        names = [action.ioc_name for action, result in results if result == status]
+        print("{} ({}): {}".format(status.capitalize(), len(names), ", ".join(names)))
+    return results
+
+
+def list_drivers(configuration, bin_flat, refresh_template=False, rescan=False):
+    """
+    Function that prints every driver supported by the template, its template files and
+    the binary it would use
+
+    Parameters
+    ----------
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    refresh_template : bool
+        flag for fetching the latest ioc-template into the local mirror first
+    rescan : bool
+        flag for rebuilding the binary index even if its cache is still valid
+
+    Returns
+    -------
+    TemplateIndex
+        the index that was listed, None if the template could not be prepared
+    """
+
+    ioc_top = configuration["IOC_DIR"]
+    template_cache = get_template_cache(configuration, ioc_top, refresh_template)
+    if template_cache is None:
+        return None
+    template_index = TemplateIndex.from_tree(TemplateTree(template_cache, get_template_revision(template_cache) or "HEAD"))
+    cache_file = None
+    if os.path.isdir(ioc_top):
+        cache_file = ioc_top + "/" + BINARY_INDEX_CACHE
+    binary_index = BinaryIndex(configuration["TOP_BINARY_DIR"], bin_flat, cache_file, rescan)
+    binary_types = dict([(driver_key(ioc_type), ioc_type) for ioc_type in binary_index.binaries])
+
+    for key in sorted(template_index.drivers):
+        driver = template_index.drivers[key]
+        ioc_type = binary_types.get(key, "AD" + driver.name)
+        print(ioc_type)
+        if key in template_index.partial:
+            print("    startup script: {} (no exact match, matched by the first part of its name)".format(driver.startup))
+        else:
+            print("    startup script: {}".format(driver.startup))
+        print("    autosave request: {}".format(driver.autosave))
+        for file in driver.dependencies:
+            print("    dependency file: {}".format(file))
+        print("    binary: {}".format(binary_index.get_binary(ioc_type)))
+    for key in sorted(template_index.ambiguous):
+        print("{}: ambiguous, several startup scripts match".format(key))
+    return template_index
+
+
+def validate_config(actions, configuration, refresh_template=False):
+    """
+    Function that prints every problem validate_iocs finds, checking IOC types against the template
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        list of IOC actions that need to be performed.
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    refresh_template : bool
+        flag for fetching the latest ioc-template into the local mirror first
+
+    Returns
+    -------
+    int
+        number of errors found, -1 if the template could not be prepared
+    """
+
+    template_cache = get_template_cache(configuration, configuration["IOC_DIR"], refresh_template)
+    if template_cache is None:
+        return -1
+    template_index = TemplateIndex.from_tree(TemplateTree(template_cache, get_template_revision(template_cache) or "HEAD"))
+    issues = validate_iocs(actions, configuration, template_index)
+    errors = print_validation(issues)
+    print("{} IOCs checked: {} errors, {} warnings".format(len(actions), errors, len(issues) - errors))
+    return errors
+
+
+def run_ioc_action(action, configuration, bin_flat, template_cache, binary_index, progress=None, cancel_event=None,
+        template_revision="", force=False, template_index=None, template_snapshot=None, renderer=None):
+    """
+    Function that runs the process, update_unique, update_config, fix_env_paths, and cleanup
+    functions for a single IOC. Each IOC only writes to its own directory, so several of these
+    can safely run at the same time. The IOC is built in a staging directory inside IOC_DIR,
+    kept in action.staging once every stage succeeded, for generate_iocs to install it after one
+    sync for all IOCs. Otherwise the staging directory is removed again. An existing IOC is left
+    alone if its manifest shows it was generated from the same inputs.
+
+    Parameters
+    ----------
+    action : IOCAction
+        the IOC to generate
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    template_cache : str
+        path to the local ioc-template mirror
+    binary_index : BinaryIndex
+        index of the binary distribution shared by all IOCs
+    progress : callable(IOCAction, str)
+        optional callback, called with the name of each stage before it starts
+    cancel_event : threading.Event
+        optional event, once set no further stage is started
+    template_revision : str
+        commit of the ioc-template mirror the IOC is generated from
+    force : bool
+        flag for regenerating the IOC even if its inputs did not change
+    template_index : TemplateIndex
+        index of the template files shared by all IOCs
+    template_snapshot : str
+        template snapshot to link the IOC from, None to clone it
+    renderer : TemplateRenderer
+        compiled templates shared by all IOCs
+
+    Returns
+    -------
+    str
+        IOC_STAGED, IOC_UNCHANGED, IOC_FAILED, IOC_SKIPPED or IOC_CANCELLED
+    """
+
+    ioc_top = configuration["IOC_DIR"]
+    bin_loc = configuration["TOP_BINARY_DIR"]
+    staging_top = None
+    action.staging = None
+    action.output = OutputBatch()
+    try:
+        with action.timed("check"):
+            manifest = build_manifest(action, configuration, bin_flat, template_revision, binary_index, renderer)
+            old_manifest = None
+            if os.path.exists(ioc_top + "/" + action.ioc_name):
+                old_manifest = read_manifest(ioc_top + "/" + action.ioc_name)
+        if os.path.exists(ioc_top + "/" + action.ioc_name):
+            if old_manifest is None and not force:
+                action.log("Error IOC directory {} already exists and was not generated by initIOCs, "
+                    "use --force to replace it".format(ioc_top + "/" + action.ioc_name))
+                return IOC_FAILED
+            elif old_manifest is not None and old_manifest.get("hash") == manifest["hash"] and not force:
+                action.log("Inputs unchanged, keeping existing IOC {}".format(action.ioc_name))
+                return IOC_UNCHANGED
+            action.log("Inputs changed, regenerating IOC {}".format(action.ioc_name))
+
+        # same filesystem as IOC_DIR, so the finished IOC can be moved into place with one rename
+        staging_top = tempfile.mkdtemp(prefix="{}{}-".format(STAGING_PREFIX, os.getpid()), dir=ioc_top)
+        stages = [
+            ("process", lambda: action.process(staging_top, bin_loc, bin_flat, template_cache, binary_index, template_index,
+                template_snapshot, renderer)),
+            ("update_unique", lambda: action.update_unique(staging_top, bin_loc, bin_flat, configuration["PREFIX"],
+                configuration["ENGINEER"], action.host or configuration["HOSTNAME"], configuration["CA_ADDRESS"], renderer)),
+            ("update_config", lambda: action.update_config(staging_top, action.host or configuration["HOSTNAME"], renderer)),
+            ("fix_env_paths", lambda: action.fix_env_paths(staging_top, bin_flat, renderer)),
+            ("cleanup", lambda: action.cleanup(staging_top, template_index.cleanup_rules if template_index is not None else None)),
+            ("manifest", lambda: write_manifest(staging_top + "/" + action.ioc_name, manifest, action.output)),
+        ]
+        for stage, function in stages:
+            if cancel_event is not None and cancel_event.is_set():
+                action.log("Generation cancelled before {}".format(stage))
+                return IOC_CANCELLED
+            if progress is not None:
+                progress(action, stage)
+            with action.timed(stage):
+                out = function()
+            if stage == "process" and out == 1:
+                return IOC_SKIPPED
+            elif stage == "process" and out != 0:
+                return IOC_FAILED
+        action.staging = staging_top
+        return IOC_STAGED
+    except Exception:
+        action.log("Error generating IOC {}".format(action.ioc_name))
+        for line in traceback.format_exc().splitlines():
+            action.log(line)
+        return IOC_FAILED
+    finally:
+        action.bytes_written = action.output.bytes
+        action.files_written = action.output.files
+        action.output = None
+        if staging_top is not None and action.staging is None:
+            remove_tree(staging_top)
+
+
+def install_staged_iocs(actions, ioc_top, progress=None, cancel_event=None):
+    """
+    Function that installs every IOC run_ioc_action staged, after a single sync made all of them
+    durable, then syncs IOC_DIR once for all renames. Staging directories are removed afterwards.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        staged IOCs, in CONFIGURE order
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+    progress : callable(IOCAction, str)
+        optional callback, called with each IOC before it is installed
+    cancel_event : threading.Event
+        optional event, once set no further IOC is installed
+
+    Returns
+    -------
+    dict of IOCAction -> str
+        IOC_SUCCEEDED, IOC_FAILED or IOC_CANCELLED for every IOC
+    """
+
+    statuses = {}
+    try:
+        sync_output()
+    except OSError as err:
+        print("Error syncing the staged IOCs: {}".format(err))
+    for action in actions:
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                action.log("Generation cancelled before install")
+                statuses[action] = IOC_CANCELLED
+                continue
+            if progress is not None:
+                progress(action, "install")
+            with action.timed("install"):
+                install_ioc(action.staging, ioc_top, action.ioc_name)
+            statuses[action] = IOC_SUCCEEDED
+        except OSError as err:
+            action.log("Error installing IOC {}: {}".format(action.ioc_name, err))
+            statuses[action] = IOC_FAILED
+        finally:
+            # after a successful install this only removes the empty staging directory
+            remove_tree(action.staging)
+            action.staging = None
+    if any(status == IOC_SUCCEEDED for status in statuses.values()):
+        try:
+            sync_directory(ioc_top)
+        except OSError as err:
+            print("Error syncing {}: {}".format(ioc_top, err))
+    return statuses
+
+
+def install_ioc(staging_top, ioc_top, ioc_name):
+    """
+    Function that moves a finished IOC from its staging directory into IOC_DIR with one rename.
+    generate_iocs synced every staged IOC before, so an IOC that was moved into place is complete
+    even after a crash, and syncs IOC_DIR once all IOCs were moved. A previous generation of the
+    IOC is moved into the staging directory first, so it is removed together with it, and restored
+    if the new IOC cannot be moved in, or by remove_stale_staging if the run is killed in between.
+
+    Parameters
+    ----------
+    staging_top : str
+        staging directory the IOC was built in
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+    ioc_name : str
+        name of the IOC
+    """
+
+    target = ioc_top + "/" + ioc_name
+    previous = staging_top + "/" + ioc_name + PREVIOUS_SUFFIX
+    replaced = os.path.exists(target)
+    if replaced:
+        os.rename(target, previous)
+    try:
+        os.rename(staging_top + "/" + ioc_name, target)
+    except OSError:
+        if replaced:
+            os.rename(previous, target)
+        raise
+
+
+def build_manifest(action, configuration, bin_flat, template_revision, binary_index, renderer=None):
+    """
+    Function that collects everything a generated IOC depends on: its CONFIGURE row, the global
+    settings, the template revision and the resolved binary, together with a hash over all of them
+
+    Parameters
+    ----------
+    action : IOCAction
+        the IOC to generate
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    template_revision : str
+        commit of the ioc-template mirror
+    binary_index : BinaryIndex
+        index of the binary distribution shared by all IOCs
+    renderer : TemplateRenderer
+        compiled templates, whose site overrides are part of the inputs
+
+    Returns
+    -------
+    dict
+        the manifest, its "hash" entry identifies the inputs
+    """
+
+    inputs = {
+        "version" : version,
+        "ioc" : [action.ioc_type, action.ioc_name, action.asyn_port, action.ioc_port, action.connection, action.ioc_num],
+        "settings" : dict([(key, configuration.get(key, "")) for key in MANIFEST_SETTINGS] + [("BINARIES_FLAT", bin_flat)]),
+        "template_revision" : template_revision,
+        "binary" : binary_index.get_binary(action.ioc_type),
+    }
+    if action.host:
+        # only added when set, so IOCs without a host keep their hash
+        inputs["host"] = action.host
+    if renderer is not None and renderer.digest:
+        inputs["overrides"] = renderer.digest
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+    return {"inputs" : inputs, "hash" : digest}
+
+
+def write_manifest(ioc_path, manifest, batch=None):
+    """
+    Function that writes the manifest of a generated IOC, the last file written before it is installed
+
+    Parameters
+    ----------
+    ioc_path : str
+        path to the generated IOC
+    manifest : dict
+        manifest returned by build_manifest
+    batch : OutputBatch
+        batch of the IOC, None for none
+    """
+
+    write_file(ioc_path + "/" + MANIFEST_FILE, json.dumps(manifest, indent=1, sort_keys=True), batch)
+
+
+def read_manifest(ioc_path):
+    """
+    Function that reads the manifest of a generated IOC
+
+    Parameters
+    ----------
+    ioc_path : str
+        path to the generated IOC
+
+    Returns
+    -------
+    dict
+        the manifest, None if the IOC has none or it is not a valid manifest
+    """
+
+    try:
+        with open(ioc_path + "/" + MANIFEST_FILE, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def remove_stale_staging(ioc_top):
+    """
+    Function that removes staging directories left behind by runs that were killed.
+    Staging directories of processes that are still running are left alone. A run killed while
+    installing an IOC can leave its previous generation as <name>.previous in the staging
+    directory, with nothing in IOC_DIR yet, it is moved back into IOC_DIR before the removal.
+
+    Parameters
+    ----------
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+    """
+
+    try:
+        with os.scandir(ioc_top) as entries:
+            staging_dirs = [entry.name for entry in entries if entry.name.startswith(STAGING_PREFIX) and entry.is_dir()]
+    except OSError:
+        return
+    for name in staging_dirs:
+        try:
+            pid = int(name[len(STAGING_PREFIX):].split("-")[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or process_running(pid):
+            continue
+        restore_previous_iocs(ioc_top, ioc_top + "/" + name)
+        print("Removing staging directory {} left by an interrupted run".format(name))
+        remove_tree(ioc_top + "/" + name)
+
+
+def restore_previous_iocs(ioc_top, staging_path):
+    """
+    Function that moves the previous generation of IOCs back into IOC_DIR, for IOCs a killed run
+    had moved aside but not yet replaced
+
+    Parameters
+    ----------
+    ioc_top : str
+        Path to the top directory to contain generated IOCs
+    staging_path : str
+        staging directory of the killed run
+    """
+
+    try:
+        names = [name for name in os.listdir(staging_path) if name.endswith(PREVIOUS_SUFFIX)]
+    except OSError:
+        return
+    for name in names:
+        target = ioc_top + "/" + name[:-len(PREVIOUS_SUFFIX)]
+        if os.path.lexists(target):
+            # the new IOC was moved into place, the previous one is no longer needed
+            continue
+        print("Restoring IOC {} left aside by an interrupted run".format(name[:-len(PREVIOUS_SUFFIX)]))
+        try:
+            os.rename(staging_path + "/" + name, target)
+        except OSError as err:
+            print("Error restoring {}: {}".format(target, err))
+
+
+def process_running(pid):
+    """
+    Function that checks if a process is still running
+
+    Parameters
+    ----------
+    pid : int
+        process id to check
+
+    Returns
+    -------
+    bool
+        True if the process exists. Always True on Windows, where this cannot be checked safely
+    """
+
+    if platform == "win32":
+        # os.kill terminates the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def print_summary(results):
+    """
+    Function that prints which IOCs succeeded, failed or were skipped
+
+    Parameters
+    ----------
+    results : list of (IOCAction, str)
+        each IOC with the status returned by run_ioc_action
+    """
+
+    print("+----------------------------------------------------------------+")
+    print("+ Summary                                                        +")
+    print("+----------------------------------------------------------------+")
+    for status in IOC_STATUSES:
+        names = [action.ioc_name for action, result in results if result == status]
+        print("{} ({}): {}".format(status.capitalize(), len(names), ", ".join(names)))
+    print()
+
+
+class RunProfile:
+    """
+    Timing data of one generation run: how long each run-level stage took, and the stage
+    timings, subprocesses and bytes written recorded by every IOCAction
+
+    Attributes
+    ----------
+    stages : list of (str, float)
+        run-level stages and their duration in seconds, in the order they ran
+    results : list of (IOCAction, str)
+        each IOC with its status, set once the run is done
+    jobs : int
+        number of worker threads used
+    template_revision : str
+        commit of the ioc-template mirror IOCs were generated from
+
+    Methods
+    -------
+    stage(name : str)
+        context manager recording the duration of a run-level stage
+    ioc_report(action : IOCAction, status : str)
+        collects the timing data of a single IOC
+    report()
+        returns the whole profile as a JSON serializable dict
+    print_table()
+        prints the per-stage and per-IOC timing tables
+    write_report(path : str)
+        writes the profile as JSON
+    """
+
+    def __init__(self):
+        """ Constructor for the RunProfile class """
+
+        self.stages = []
+        self.results = []
+        self.jobs = 0
+        self.template_revision = ""
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.wall_time = 0.0
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Context manager recording the duration of a run-level stage """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+
+    def finish(self, results):
+        """ Function that records the results and the total wall time of the run """
+
+        self.results = results
+        self.wall_time = time.perf_counter() - self.wall_start
+
+
+    def ioc_report(self, action, status):
+        """
+        Function that collects the timing data of a single IOC
+
+        Parameters
+        ----------
+        action : IOCAction
+            the generated IOC
+        status : str
+            status returned by run_ioc_action
+
+        Returns
+        -------
+        dict
+            name, type, status, total duration, stage durations, bytes and files written and subprocesses of the IOC
+        """
+
+        stages = {}
+        for stage, duration in action.timings:
+            stages[stage] = stages.get(stage, 0.0) + duration
+        return {
+            "name": action.ioc_name,
+            "type": action.ioc_type,
+            "status": status,
+            # sub-stages of process are already part of its duration
+            "duration": sum(duration for stage, duration in action.timings if "." not in stage),
+            "stages": stages,
+            "bytes_written": action.bytes_written,
+            "files_written": action.files_written,
+            "subprocesses": len(action.commands),
+            "commands": action.commands,
+        }
+
+
+    def report(self):
+        """ Function that returns the whole profile as a JSON serializable dict """
+
+        iocs = [self.ioc_report(action, status) for action, status in self.results]
+        return {
+            "version": version,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "template_revision": self.template_revision,
+            "jobs": self.jobs,
+            "wall_time": self.wall_time,
+            "stages": [{"name": name, "duration": duration} for name, duration in self.stages],
+            "bytes_written": sum(ioc["bytes_written"] for ioc in iocs),
+            "files_written": sum(ioc["files_written"] for ioc in iocs),
+            "subprocesses": sum(ioc["subprocesses"] for ioc in iocs),
+            "iocs": iocs,
+        }
+
+
+    def print_table(self):
+        """ Function that prints the run-level stages, the IOC stages summed over all IOCs, and every IOC """
+
+        report = self.report()
+        print("+----------------------------------------------------------------+")
+        print("+ Profile                                                        +")
+        print("+----------------------------------------------------------------+")
+        print("{:<32}{:>12}".format("Run stage", "Seconds"))
+        for stage in report["stages"]:
+            print("{:<32}{:>12.3f}".format(stage["name"], stage["duration"]))
+        print("{:<32}{:>12.3f}".format("total (wall)", report["wall_time"]))
+        print()
+
+        totals = {}
+        counts = {}
+        for ioc in report["iocs"]:
+            for stage, duration in ioc["stages"].items():
+                totals[stage] = totals.get(stage, 0.0) + duration
+                counts[stage] = counts.get(stage, 0) + 1
+        print("{:<32}{:>12}{:>8}{:>12}".format("IOC stage", "Seconds", "IOCs", "Mean"))
+        for stage in sorted(totals, key=totals.get, reverse=True):
+            print("{:<32}{:>12.3f}{:>8}{:>12.3f}".format(stage, totals[stage], counts[stage], totals[stage] / counts[stage]))
+        print()
+
+        print("{:<20}{:<12}{:>10}{:>12}{:>8}{:>8}{:>8}".format("IOC", "Status", "Seconds", "Bytes", "Files", "Procs", "Failed"))
+        for ioc in report["iocs"]:
+            failed = len([command for command in ioc["commands"] if command["returncode"] != 0])
+            print("{:<20}{:<12}{:>10.3f}{:>12}{:>8}{:>8}{:>8}".format(ioc["name"], ioc["status"], ioc["duration"],
+                ioc["bytes_written"], ioc["files_written"], ioc["subprocesses"], failed))
+        print()
+
+
+    def write_report(self, path):
+        """ Function that writes the profile as JSON """
+
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=1)
+        print("Wrote profile report to {}".format(path))
+
+
+class Transport(abc.ABC):
+    """
+    Base class of the ways a generated IOC is copied from IOC_DIR to the IOC server it runs on.
+    The destination is DEPLOY_DIR, or IOC_DIR if it is not set, where {host} is replaced by the host.
+    CopyTransport always has a DEPLOY_DIR, parse_configure_lines rejects copy without one.
+
+    Attributes
+    ----------
+    destination : str
+        IOC directory on the hosts, may contain {host}
+
+    Methods
+    -------
+    target(host : str, ioc_name : str)
+        returns the directory of an IOC on a host
+    sync(ioc_path : str, host : str, ioc_name : str)
+        copies the changes of an IOC to a host
+    """
+
+    def __init__(self, configuration):
+        self.destination = configuration.get("DEPLOY_DIR", "") or configuration["IOC_DIR"]
+
+
+    def target(self, host, ioc_name):
+        """ Function that returns the directory of an IOC on a host """
+
+        return self.destination.replace("{host}", host) + "/" + ioc_name
+
+
+    @abc.abstractmethod
+    def sync(self, ioc_path, host, ioc_name):
+        """
+        Function that makes the IOC directory on the host identical to the generated one,
+        only transferring what changed
+
+        Parameters
+        ----------
+        ioc_path : str
+            generated IOC in IOC_DIR
+        host : str
+            IOC server to copy it to
+        ioc_name : str
+            name of the IOC
+
+        Returns
+        -------
+        transferred : int
+            number of files copied or removed
+        log : list of str
+            output of the transfer
+
+        Raises
+        ------
+        OSError
+            if the transfer failed
+        """
+
+
+class CopyTransport(Transport):
+    """
+    Transport that copies IOCs to a directory on this machine, usually a mounted file system or,
+    with {host} in DEPLOY_DIR, a stand-in for the hosts when testing. Files whose size and
+    modification time match are skipped and files no longer generated are removed.
+    """
+
+    def sync(self, ioc_path, host, ioc_name):
+        target = self.target(host, ioc_name)
+        transferred = 0
+        for dir_path, dir_names, file_names in os.walk(ioc_path):
+            relative = os.path.relpath(dir_path, ioc_path)
+            target_dir = os.path.normpath(target + "/" + relative)
+            os.makedirs(target_dir, exist_ok=True)
+            for name in file_names:
+                source = dir_path + "/" + name
+                destination = target_dir + "/" + name
+                source_info = os.lstat(source)
+                try:
+                    target_info = os.lstat(destination)
+                    if (target_info.st_size == source_info.st_size and target_info.st_mtime_ns == source_info.st_mtime_ns
+                            and stat.S_IFMT(target_info.st_mode) == stat.S_IFMT(source_info.st_mode)):
+                        continue
+                except OSError:
+                    pass
+                # copied next to the old file and renamed over it, so the IOC never sees a partial file
+                temp_path = target_dir + "/." + name + ".tmp"
+                if os.path.lexists(temp_path):
+                    os.remove(temp_path)
+                if stat.S_ISLNK(source_info.st_mode):
+                    os.symlink(os.readlink(source), temp_path)
+                else:
+                    shutil.copy2(source, temp_path)
+                os.replace(temp_path, destination)
+                transferred = transferred + 1
+
+        # remove what is no longer generated, deepest paths first
+        for dir_path, dir_names, file_names in os.walk(target, topdown=False):
+            relative = os.path.relpath(dir_path, target)
+            source_dir = os.path.normpath(ioc_path + "/" + relative)
+            for name in file_names:
+                if not os.path.lexists(source_dir + "/" + name):
+                    os.remove(dir_path + "/" + name)
+                    transferred = transferred + 1
+            for name in dir_names:
+                if not os.path.isdir(source_dir + "/" + name):
+                    remove_tree(dir_path + "/" + name)
+                    transferred = transferred + 1
+        return transferred, []
+
+
+class RsyncTransport(Transport):
+    """
+    Transport that runs rsync over ssh, which only sends the changed parts of changed files.
+    DEPLOY_RSH replaces the remote shell command, ex. ssh -l softioc.
+    """
+
+    def __init__(self, configuration):
+        Transport.__init__(self, configuration)
+        self.rsh = configuration.get("DEPLOY_RSH", "") or "ssh"
+
+
+    def sync(self, ioc_path, host, ioc_name):
+        target = self.target(host, ioc_name)
+        command = ["rsync", "--archive", "--delete", "--out-format=%n", "-e", self.rsh,
+            # older rsync versions cannot create missing parent directories themselves
+            "--rsync-path", "mkdir -p {} && rsync".format(shlex.quote(os.path.dirname(target))),
+            ioc_path + "/", "{}:{}/".format(host, target)]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        log = result.stdout.splitlines()
+        if result.returncode != 0:
+            raise OSError("rsync exited with {}: {}".format(result.returncode, " ".join(log[-3:])))
+        return len([line for line in log if line != "" and not line.endswith("/")]), log
+
+
+# transports selected by DEPLOY_TRANSPORT
+TRANSPORTS = {"rsync": RsyncTransport, "copy": CopyTransport}
+
+
+def deploy_iocs(actions, configuration, jobs=DEFAULT_JOBS, transport=None):
+    """
+    Function that copies every IOC with a host from IOC_DIR to that host. Transfers to different
+    hosts run at the same time, up to jobs in total and DEPLOY_JOBS_PER_HOST per host, so one
+    slow server does not hold up the others.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        generated IOCs, those without a host are left alone
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    jobs : int
+        maximum number of transfers running at the same time
+    transport : Transport
+        transport to use, None for the one selected by DEPLOY_TRANSPORT
+
+    Returns
+    -------
+    dict of IOCAction -> bool
+        True for every IOC that was deployed, False if its transfer failed
+    """
+
+    if transport is None:
+        transport = TRANSPORTS[configuration.get("DEPLOY_TRANSPORT", "") or DEFAULT_TRANSPORT](configuration)
+    per_host = int(configuration.get("DEPLOY_JOBS_PER_HOST", "") or DEFAULT_JOBS_PER_HOST)
+    by_host = {}
+    for action in actions:
+        if action.host:
+            by_host.setdefault(action.host, []).append(action)
+    if len(by_host) == 0:
+        return {}
+    # hosts take turns, so the first host in CONFIGURE does not get all workers at first
+    queue = []
+    for position in range(max([len(host_actions) for host_actions in by_host.values()])):
+        for host in sorted(by_host):
+            if position < len(by_host[host]):
+                queue.append(by_host[host][position])
+    host_slots = dict([(host, threading.Semaphore(per_host)) for host in by_host])
+
+    def sync(action):
+        with host_slots[action.host]:
+            return transport.sync(configuration["IOC_DIR"] + "/" + action.ioc_name, action.host, action.ioc_name)
+
+    print("Deploying {} IOCs to {} hosts".format(len(queue), len(by_host)))
+    deployed = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(queue)))) as executor:
+        futures = dict([(executor.submit(sync, action), action) for action in queue])
+        for future in as_completed(futures):
+            action = futures[future]
+            try:
+                transferred, log = future.result()
+                print("[{}] Deployed to {}:{}, {} files changed".format(action.ioc_name, action.host,
+                    transport.target(action.host, action.ioc_name), transferred))
+                deployed[action] = True
+            except OSError as err:
+                print("[{}] Error deploying to {}: {}".format(action.ioc_name, action.host, err))
+                deployed[action] = False
+    for host in sorted(by_host):
+        failed = [action.ioc_name for action in by_host[host] if not deployed[action]]
+        print("{}: {} deployed, {} failed {}".format(host, len(by_host[host]) - len(failed), len(failed),
+            ", ".join(failed)).rstrip())
+    print()
+    return deployed
+
+
+def generate_iocs(actions, configuration, bin_flat, jobs=DEFAULT_JOBS, refresh_template=False, progress=None, cancel_event=None,
+        rescan=False, force=False, profile=None, deploy=True, allocation_file=None):
+    """
+    Function that generates all IOCs on a pool of worker threads. The log of each IOC is
+    buffered and printed in one block once it is done, followed by a summary.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        list of IOC actions that need to be performed.
+    configuration : dict of str -> str
+        Dictionary containing all options read from configure
+    bin_flat : bool
+        flag for deciding if binaries are flat or stacked
+    jobs : int
+        maximum number of IOCs generated at the same time
+    refresh_template : bool
+        flag for fetching the latest ioc-template into the local mirror before generating
+    progress : callable(IOCAction, str)
+        optional callback, called from the worker threads with each stage an IOC enters
+        and finally with its status
+    cancel_event : threading.Event
+        optional event, once set no further IOC or stage is started
+    rescan : bool
+        flag for rebuilding the binary index even if its cache is still valid
+    force : bool
+        flag for regenerating every IOC, even those whose inputs did not change
+    profile : RunProfile
+        optional profile that the stage timings of the run and of every IOC are recorded in
+    deploy : bool
+        flag for copying IOCs with a host to it once they are generated
+    allocation_file : str
+        optional allocation file the IOC numbers and auto ports are saved to, unless an IOC failed or was cancelled
+
+    Returns
+    -------
+    results : list of (IOCAction, str)
+        each IOC with its status, in CONFIGURE order. None if the template could not be prepared
+        or validation found errors
+
+    Raises
+    ------
+    ConfigError
+        if IOC_DIR is not set
+    """
+
+    if profile is None:
+        profile = RunProfile()
+    with profile.stage("init_ioc_dir"):
+        init_ioc_dir(configuration["IOC_DIR"])
+        remove_stale_staging(configuration["IOC_DIR"])
+    with profile.stage("template_cache"):
+        template_cache = get_template_cache(configuration, configuration["IOC_DIR"], refresh_template)
+    if template_cache is None:
+        return None
+    with profile.stage("template_index"):
+        template_revision = get_template_revision(template_cache)
+        template_tree = TemplateTree(template_cache, template_revision or "HEAD")
+        template_index = TemplateIndex.from_tree(template_tree)
+    profile.template_revision = template_revision
+    with profile.stage("template_compile"):
+        renderer = TemplateRenderer(template_tree, template_index, configuration.get("TEMPLATE_OVERRIDES", ""))
+    if len(renderer.overrides) > 0:
+        print("Using site overrides for {}".format(", ".join(renderer.overrides)))
+    with profile.stage("validate"):
+        issues = validate_iocs(actions, configuration, template_index)
+    if print_validation(issues) > 0:
+        print("Error CONFIGURE has problems, no IOC was generated")
+        return None
+    template_snapshot = None
+    if configuration.get("TEMPLATE_MODE", "clone") == "link" and template_revision != "":
+        with profile.stage("template_snapshot"):
+            template_snapshot = get_template_snapshot(template_tree, template_cache)
+    with profile.stage("binary_index"):
+        binary_index = BinaryIndex(configuration["TOP_BINARY_DIR"], bin_flat,
+            configuration["IOC_DIR"] + "/" + BINARY_INDEX_CACHE, rescan)
+    if binary_index.from_cache:
+        print("Using cached binary index for {}".format(binary_index.ad_dir))
+    else:
+        print("Scanned {} for IOC binaries".format(binary_index.ad_dir))
+    print()
+
+    statuses = {}
+    workers = max(1, min(jobs, len(actions)))
+    profile.jobs = workers
+    with profile.stage("generate"), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for action in actions:
+            future = executor.submit(run_ioc_action, action, configuration, bin_flat, template_cache, binary_index,
+                progress, cancel_event, template_revision, force, template_index, template_snapshot, renderer)
+            futures[future] = action
+        for future in as_completed(futures):
+            action = futures[future]
+            statuses[action] = future.result()
+            # staged IOCs are reported once they were installed
+            if statuses[action] != IOC_STAGED:
+                report_ioc(action, statuses[action], progress)
+
+    staged = [action for action in actions if statuses[action] == IOC_STAGED]
+    if len(staged) > 0:
+        with profile.stage("install"):
+            installed = install_staged_iocs(staged, configuration["IOC_DIR"], progress, cancel_event)
+        for action in staged:
+            statuses[action] = installed[action]
+            report_ioc(action, statuses[action], progress)
+
+    generated = [action for action in actions if statuses[action] in [IOC_SUCCEEDED, IOC_UNCHANGED]]
+    if deploy and any(action.host for action in generated):
+        with profile.stage("deploy"):
+            deployed = deploy_iocs(generated, configuration, jobs)
+        for action, ok in deployed.items():
+            if not ok:
+                statuses[action] = IOC_UNDEPLOYED
+                if progress is not None:
+                    progress(action, IOC_UNDEPLOYED)
+
+    if allocation_file is not None and not any(statuses[action] in [IOC_FAILED, IOC_CANCELLED] for action in actions):
+        try:
+            save_allocations(allocation_file, actions)
+        except (OSError, ConfigError) as err:
+            print("Error saving IOC allocations to {}: {}".format(allocation_file, err))
+
+    results = [(action, statuses[action]) for action in actions]
+    profile.finish(results)
+    print_summary(results)
+    return results
+
+
+def report_ioc(action, status, progress=None):
+    """ Function that prints the buffered log of a finished IOC and reports its status to progress """
+
+    print(action.flush_log())
+    print()
+    if progress is not None:
+        progress(action, status)
+
+
+class ProcServIOC:
+    """
+    Generated IOC as run by procServ. The telnet port and host are read from the config file
+    written by update_config, the pid and log file of the procServ process are kept in
+    IOC_DIR/.procserv so they survive the IOC directory being regenerated.
+
+    Attributes
+    ----------
+    ioc_name : str
+        name of the IOC
+    ioc_path : str
+        generated IOC directory
+    host : str
+        host the IOC runs on
+    port : int
+        procServ telnet port
+    local : bool
+        True if the IOC runs on this machine
+    pid_file : str
+        file holding the pid of the procServ process
+    log_file : str
+        file procServ and the IOC write their output to
+
+    Methods
+    -------
+    pid()
+        returns the pid of the running procServ process, or None
+    owns(pid : int)
+        checks if a process is the procServ process of this IOC
+    command(procserv : str)
+        returns the command line that starts the IOC
+    launch(procserv : str)
+        starts procServ in its own session and records its pid
+    terminate(force : bool)
+        sends the procServ process and the IOC a termination signal
+    """
+
+    def __init__(self, action, configuration):
+        self.ioc_name = action.ioc_name
+        # procServ changes into the IOC directory, so relative paths would no longer resolve
+        self.ioc_path = os.path.abspath(configuration["IOC_DIR"] + "/" + action.ioc_name)
+        config = read_assignments(self.ioc_path + "/config")
+        self.host = config.get("HOST", "") or action.host or configuration["HOSTNAME"]
+        port = config.get("PORT", "")
+        self.port = int(port if port.isdigit() else action.ioc_port)
+        try:
+            self.local = local_address(socket.gethostbyname(self.host))
+        except OSError:
+            self.local = False
+        state_dir = os.path.abspath(configuration["IOC_DIR"] + "/" + PROCSERV_STATE_DIR)
+        self.pid_file = state_dir + "/" + self.ioc_name + ".pid"
+        self.log_file = state_dir + "/" + self.ioc_name + ".log"
+
+
+    def pid(self):
+        """
+        Function that returns the pid of the running procServ process of this IOC, None if it is not
+        running. A pid file whose process has exited, or whose pid now belongs to another process
+        after a crash or reboot, is stale and removed, so that process is never signalled.
+        """
+
+        try:
+            with open(self.pid_file, "r") as pid_file:
+                pid = int(pid_file.read().strip())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            pid = None
+        if pid is not None and not reap_process(pid) and process_running(pid) and self.owns(pid):
+            return pid
+        try:
+            os.remove(self.pid_file)
+        except OSError:
+            pass
+        return None
+
+
+    def owns(self, pid):
+        """
+        Function that checks if a process is the procServ started for this IOC, by finding the log
+        file and telnet port of the IOC on its command line. Without /proc this cannot be checked
+        and the process is assumed to be the IOC.
+
+        Parameters
+        ----------
+        pid : int
+            process id read from the pid file
+
+        Returns
+        -------
+        bool
+            True if the process runs this IOC
+        """
+
+        if not os.path.isdir("/proc/self"):
+            return True
+        try:
+            with open("/proc/{}/cmdline".format(pid), "rb") as cmdline:
+                arguments = cmdline.read().decode("utf-8", errors="replace").split("\0")
+        except OSError:
+            return False
+        return self.log_file in arguments and str(self.port) in arguments
+
+
+    def command(self, procserv=PROCSERV_COMMAND):
+        """
+        Function that returns the command line that starts the IOC. procServ is kept in the
+        foreground so its pid is the one recorded, ^D and ^C are ignored on the console.
+
+        Parameters
+        ----------
+        procserv : str
+            procServ executable, may include extra options
+
+        Returns
+        -------
+        list of str
+            the command line
+        """
+
+        return shlex.split(procserv) + ["-f", "-n", self.ioc_name, "-L", self.log_file, "-i", "^D^C",
+            "-c", self.ioc_path, str(self.port), "./st.cmd"]
+
+
+    def launch(self, procserv=PROCSERV_COMMAND):
+        """
+        Function that starts procServ in its own session, so it keeps running after initIOCs exits
+
+        Parameters
+        ----------
+        procserv : str
+            procServ executable, may include extra options
+
+        Returns
+        -------
+        subprocess.Popen
+            the started procServ process
+
+        Raises
+        ------
+        OSError
+            if procServ could not be started
+        """
+
+        os.makedirs(os.path.dirname(self.pid_file), exist_ok=True)
+        with open(self.log_file, "a") as log:
+            process = subprocess.Popen(self.command(procserv), cwd=self.ioc_path, stdin=subprocess.DEVNULL,
+                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        with open(self.pid_file, "w") as pid_file:
+            pid_file.write(str(process.pid) + "\n")
+        return process
+
+
+    def terminate(self, force=False):
+        """
+        Function that signals the procServ process and, through its process group, the IOC
+
+        Parameters
+        ----------
+        force : bool
+            flag for killing instead of asking the processes to exit
+        """
+
+        pid = self.pid()
+        if pid is None:
+            return
+        sig = signal.SIGKILL if force and hasattr(signal, "SIGKILL") else signal.SIGTERM
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(pid, sig)
+            else:
+                os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+def read_assignments(path):
+    """
+    Function that reads the KEY=value lines of a procServ config or site.env file
+
+    Parameters
+    ----------
+    path : str
+        path to the config file
+
+    Returns
+    -------
+    dict of str -> str
+        config variable name -> value, empty if the file does not exist
+    """
+
+    values = {}
+    try:
+        with open(path, "r") as config:
+            for line in config:
+                match = ASSIGNMENT_PATTERN.match(line)
+                if match is not None:
+                    values[match.group(1)] = line[match.end():].strip().strip('"\'')
+    except OSError:
+        pass
+    return values
+
+
+def reap_process(pid):
+    """
+    Function that checks if a process has exited but not been collected yet, such a zombie
+    still looks like it is running to process_running. Children of this run are collected here.
+
+    Parameters
+    ----------
+    pid : int
+        process id
+
+    Returns
+    -------
+    bool
+        True if the process has exited
+    """
+
+    if platform == "win32":
+        return False
+    try:
+        reaped, status = os.waitpid(pid, os.WNOHANG)
+        return reaped == pid
+    except ChildProcessError:
+        pass
+    try:
+        with open("/proc/{}/stat".format(pid), "r") as stat_file:
+            # the state follows the executable name, which is in parentheses and may contain spaces
+            return stat_file.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except (OSError, IndexError):
+        return False
+
+
+async def wait_for_port(host, port, timeout, process=None):
+    """
+    Function that waits for a telnet port to accept connections
+
+    Parameters
+    ----------
+    host : str
+        host to connect to
+    port : int
+        telnet port
+    timeout : float
+        seconds to wait, 0 to only try once
+    process : subprocess.Popen
+        process expected to open the port, waiting stops early if it exits
+
+    Returns
+    -------
+    float
+        seconds until the port accepted a connection, None if it did not within timeout
+    """
+
+    import asyncio
+
+    start = time.monotonic()
+    while True:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), PORT_PROBE_TIMEOUT)
+            writer.close()
+            return time.monotonic() - start
+        except (OSError, asyncio.TimeoutError):
+            pass
+        if process is not None and process.poll() is not None:
+            return None
+        if time.monotonic() - start >= timeout:
+            return None
+        await asyncio.sleep(PROCSERV_POLL_INTERVAL)
+
+
+async def start_ioc(ioc, procserv, timeout, slots):
+    """
+    Function that starts one IOC under procServ and waits for its telnet port
+
+    Returns
+    -------
+    (str, float)
+        state of the IOC and seconds until it was ready
+    """
+
+    async with slots:
+        if ioc.pid() is not None:
+            ready = await wait_for_port("localhost", ioc.port, 0)
+            return (PROCSERV_RUNNING if ready is not None else PROCSERV_NOT_READY), ready
+        try:
+            process = ioc.launch(procserv)
+        except OSError as err:
+            print("[{}] Error starting procServ: {}".format(ioc.ioc_name, err))
+            return PROCSERV_FAILED, None
+        ready = await wait_for_port("localhost", ioc.port, timeout, process)
+        if ready is not None:
+            return PROCSERV_STARTED, ready
+        if process.poll() is not None:
+            print("[{}] procServ exited with {}, see {}".format(ioc.ioc_name, process.returncode, ioc.log_file))
+            return PROCSERV_FAILED, None
+        return PROCSERV_NOT_READY, None
+
+
+async def stop_ioc(ioc, timeout, slots):
+    """
+    Function that stops one IOC, killing it if it does not exit within timeout
+
+    Returns
+    -------
+    (str, float)
+        state of the IOC and seconds it took to exit
+    """
+
+    import asyncio
+
+    async with slots:
+        if ioc.pid() is None:
+            return PROCSERV_STOPPED, None
+        start = time.monotonic()
+        ioc.terminate()
+        while ioc.pid() is not None:
+            if time.monotonic() - start >= timeout:
+                print("[{}] Did not exit within {} s, killing it".format(ioc.ioc_name, timeout))
+                ioc.terminate(force=True)
+                await asyncio.sleep(PROCSERV_POLL_INTERVAL)
+                break
+            await asyncio.sleep(PROCSERV_POLL_INTERVAL)
+        if ioc.pid() is not None:
+            return PROCSERV_FAILED, None
+        try:
+            os.remove(ioc.pid_file)
+        except OSError:
+            pass
+        return PROCSERV_STOPPED, time.monotonic() - start
+
+
+async def check_ioc(ioc, slots):
+    """
+    Function that checks if one IOC is running and its telnet port accepts connections.
+    IOCs on other hosts are only checked through their port.
+
+    Returns
+    -------
+    (str, float)
+        state of the IOC and seconds the port took to answer
+    """
+
+    async with slots:
+        pid = ioc.pid() if ioc.local else None
+        ready = await wait_for_port("localhost" if ioc.local else ioc.host, ioc.port, 0)
+        if ready is not None:
+            return PROCSERV_RUNNING, ready
+        if pid is not None:
+            return PROCSERV_NOT_READY, None
+        return PROCSERV_STOPPED, None
+
+
+async def run_procserv_command(command, iocs, procserv, jobs, timeout):
+    """
+    Function that runs start, stop or status on every IOC at the same time, at most jobs at once
+
+    Returns
+    -------
+    list of (ProcServIOC, str, float)
+        every IOC with its state and the seconds the command took for it
+    """
+
+    import asyncio
+
+    slots = asyncio.Semaphore(max(1, jobs))
+    if command == "start":
+        tasks = [start_ioc(ioc, procserv, timeout, slots) for ioc in iocs]
+    elif command == "stop":
+        tasks = [stop_ioc(ioc, PROCSERV_STOP_TIMEOUT, slots) for ioc in iocs]
+    else:
+        tasks = [check_ioc(ioc, slots) for ioc in iocs]
+    results = await asyncio.gather(*tasks)
+    return [(ioc, state, seconds) for ioc, (state, seconds) in zip(iocs, results)]
+
+
+def print_procserv_results(results):
+    """
+    Function that prints the state of every IOC and how long it took to become ready or to stop
+
+    Parameters
+    ----------
+    results : list of (ProcServIOC, str, float)
+        every IOC with its state and the seconds the command took for it
+    """
+
+    name_width = max([len("IOC")] + [len(ioc.ioc_name) for ioc, state, seconds in results])
+    address_width = max([len("Address")] + [len("{}:{}".format(ioc.host, ioc.port)) for ioc, state, seconds in results])
+    print("{:<{}}  {:<{}}  {:>7}  {:<11}  {:>8}".format("IOC", name_width, "Address", address_width, "PID", "State", "Time (s)"))
+    for ioc, state, seconds in results:
+        pid = ioc.pid() if ioc.local else None
+        print("{:<{}}  {:<{}}  {:>7}  {:<11}  {:>8}".format(ioc.ioc_name, name_width, "{}:{}".format(ioc.host, ioc.port),
+            address_width, pid if pid is not None else "-", state, "{:.2f}".format(seconds) if seconds is not None else "-"))
+    ready = [(seconds, ioc.ioc_name) for ioc, state, seconds in results if state == PROCSERV_STARTED]
+    if len(ready) > 0:
+        slowest = max(ready)
+        print("{} IOCs ready, mean {:.2f} s, slowest {} after {:.2f} s".format(len(ready),
+            sum([seconds for seconds, name in ready]) / len(ready), slowest[1], slowest[0]))
+    print()
+
+
+def control_iocs(command, names=None, config_path="CONFIGURE.txt", jobs=DEFAULT_JOBS, timeout=PROCSERV_READY_TIMEOUT,
+        procserv=None):
+    """
+    Function that starts, stops, restarts or checks the generated IOCs under procServ. Starting
+    returns once every telnet port accepts connections, or timeout passed. IOCs on other hosts
+    can only be checked with status, start and stop them on their host.
+
+    Parameters
+    ----------
+    command : str
+        one of PROCSERV_COMMANDS
+    names : list of str
+        IOCs to act on, None or empty for every IOC in CONFIGURE
+    config_path : str
+        path to the CONFIGURE file
+    jobs : int
+        maximum number of IOCs started or stopped at the same time
+    timeout : float
+        seconds to wait for a started IOC to open its telnet port
+    procserv : str
+        procServ executable, None for PROCSERV in CONFIGURE or PROCSERV_COMMAND
+
+    Returns
+    -------
+    int
+        exit code, 0 if every IOC ended up in the requested state
+    """
+
+    import asyncio
+
+    try:
+        actions, configuration, bin_flat = read_ioc_config(config_path)
+    except ConfigError as err:
+        print("Error reading CONFIGURE file:")
+        print(err)
+        return 1
+    except OSError as err:
+        print("Error reading CONFIGURE file: {}".format(err))
+        return 1
+    if procserv is None:
+        procserv = configuration.get("PROCSERV", "") or PROCSERV_COMMAND
+    if names:
+        unknown = sorted(set(names) - set([action.ioc_name for action in actions]))
+        if len(unknown) > 0:
+            print("Error: {} not in {}".format(", ".join(unknown), config_path))
+            return 1
+        actions = [action for action in actions if action.ioc_name in names]
+
+    iocs = []
+    missing = 0
+    for action in actions:
+        if not os.path.exists(configuration["IOC_DIR"] + "/" + action.ioc_name + "/st.cmd"):
+            print("[{}] Not generated, skipping".format(action.ioc_name))
+            missing = missing + 1
+            continue
+        ioc = ProcServIOC(action, configuration)
+        if command != "status" and not ioc.local:
+            print("[{}] Runs on {}, {} it there".format(ioc.ioc_name, ioc.host, command))
+            continue
+        iocs.append(ioc)
+    if len(iocs) == 0:
+        return 0 if missing == 0 else 1
+
+    if command == "restart":
+        stopped = asyncio.run(run_procserv_command("stop", iocs, procserv, jobs, timeout))
+        iocs = [ioc for ioc, state, seconds in stopped if state == PROCSERV_STOPPED]
+        command = "start"
+    results = asyncio.run(run_procserv_command(command, iocs, procserv, jobs, timeout))
+    print_procserv_results(results)
+    wanted = [PROCSERV_STOPPED] if command == "stop" else [PROCSERV_STARTED, PROCSERV_RUNNING]
+    return 0 if missing == 0 and all(state in wanted for ioc, state, seconds in results) else 1
+
+
+def init_iocs(jobs=DEFAULT_JOBS, refresh_template=False, rescan=False, force=False, plan=False, drivers=False,
+        profile=False, report=PROFILE_REPORT, validate=False, config_path="CONFIGURE.txt", deploy=True, deploy_only=False):
+    """
+    Main driver function. First calls read_ioc_config, then for each instance of IOCAction
+    perform the process, update_unique, update_config, fix_env_paths, and cleanup functions
+
+    Parameters
+    ----------
+    jobs : int
+        maximum number of IOCs generated at the same time
+    refresh_template : bool
+        flag for fetching the latest ioc-template into the local mirror before generating
+    rescan : bool
+        flag for rebuilding the binary index even if its cache is still valid
+    force : bool
+        flag for regenerating every IOC, even those whose inputs did not change
+    plan : bool
+        flag for only printing what would be generated, without cloning or writing any IOC
+    drivers : bool
+        flag for only listing the drivers supported by the template
+    profile : bool
+        flag for printing stage timings of the run and writing them to a JSON report
+    report : str
+        path of the JSON report written when profiling
+    validate : bool
+        flag for only checking CONFIGURE for problems
+    config_path : str
+        path to the CONFIGURE file
+    deploy : bool
+        flag for copying IOCs with a host to it once they are generated
+    deploy_only : bool
+        flag for only copying the already generated IOCs with a host to it
+
+    Returns
+    -------
+    int
+        exit code, 0 if everything succeeded
+    """
+
+    print_start_message()
+    try:
+        actions, configuration, bin_flat = read_ioc_config(config_path)
+    except ConfigError as err:
+        print("Error reading CONFIGURE file:")
+        print(err)
+        return 1
+    except OSError as err:
+        print("Error reading CONFIGURE file: {}".format(err))
+        return 1
+    if drivers:
+        return 0 if list_drivers(configuration, bin_flat, refresh_template, rescan) is not None else 1
+    if validate:
+        return 0 if validate_config(actions, configuration, refresh_template) == 0 else 1
+    if plan:
+        return 0 if plan_iocs(actions, configuration, bin_flat, refresh_template, rescan) is not None else 1
+    if deploy_only:
+        generated = [action for action in actions if os.path.isdir(configuration["IOC_DIR"] + "/" + action.ioc_name)]
+        return 0 if all(deploy_iocs(generated, configuration, jobs).values()) else 1
+    run_profile = RunProfile()
+    try:
+        results = generate_iocs(actions, configuration, bin_flat, jobs, refresh_template, rescan=rescan, force=force,
+            profile=run_profile, deploy=deploy, allocation_file=allocation_path(config_path))
+    except ConfigError as err:
+        print("Error in CONFIGURE file:")
+        print(err)
+        return 1
+    if results is None:
+        return 1
+    if profile:
+        run_profile.print_table()
+        run_profile.write_report(report)
+    return 1 if any(status in [IOC_FAILED, IOC_UNDEPLOYED, IOC_CANCELLED] for action, status in results) else 0
+
+
+def init_iocs_GUI(actions, configuration, bin_flat, template_configuration=None, refresh_template=False, jobs=DEFAULT_JOBS,
+        progress=None, cancel_event=None, config_path=None):
+    """
+    Driver function used by the GUI, configuration is the list of global settings
+    in the order of GUI_CONFIGURATION_KEYS. Runs on a background thread, so progress
+    must not touch any widgets directly. The allocations are saved next to config_path
+    """
+
+    gui_configuration = {}
+    if template_configuration is not None:
+        gui_configuration.update(template_configuration)
+    for key, value in zip(GUI_CONFIGURATION_KEYS, configuration):
+        gui_configuration[key] = value
+    allocation_file = allocation_path(config_path) if config_path is not None else None
+    return generate_iocs(actions, gui_configuration, bin_flat, jobs, refresh_template, progress, cancel_event,
+        allocation_file=allocation_file)
+
+
+def parse_args(argv=None):
+    """
+    Function that parses the command line arguments
+
+    Parameters
+    ----------
+    argv : list of str
+        arguments to parse, None for sys.argv
+
+    Returns
+    -------
+    argparse.Namespace
+        parsed command line options, command is the chosen sub-command
+    """
+
+    parser = argparse.ArgumentParser(prog="initiocs", description="initIOCs - generate areaDetector IOCs from CONFIGURE.txt")
+    parser.add_argument("--version", action="version", version="initIOCs {}".format(version))
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    config = argparse.ArgumentParser(add_help=False)
+    config.add_argument("-c", "--config", default="CONFIGURE.txt", help="path to the CONFIGURE file (default: %(default)s)")
+    common = argparse.ArgumentParser(add_help=False, parents=[config])
+    common.add_argument("--refresh-template", action="store_true", help="fetch the latest ioc-template into the local mirror")
+    binaries = argparse.ArgumentParser(add_help=False)
+    binaries.add_argument("--rescan", action="store_true", help="rebuild the binary index instead of using its cache")
+
+    generate = commands.add_parser("generate", parents=[common, binaries], help="generate the IOCs in CONFIGURE")
+    generate.add_argument("--force", action="store_true", help="regenerate all IOCs, even those whose inputs did not change")
+    generate.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help="number of IOCs to generate in parallel (default: %(default)s)")
+    generate.add_argument("--no-deploy", action="store_true", help="only generate, do not copy IOCs with a host to it")
+    generate.add_argument("--profile", action="store_true", help="print how long each stage and IOC took and write a JSON run report")
+    generate.add_argument("--report", default=PROFILE_REPORT, help="path of the JSON report written by --profile (default: %(default)s)")
+    commands.add_parser("plan", parents=[common, binaries], help="print what would be generated without writing any IOC")
+    commands.add_parser("validate", parents=[common], help="check CONFIGURE for conflicts and invalid settings")
+    commands.add_parser("list-drivers", parents=[common, binaries], help="list the drivers supported by the template")
+    deploy = commands.add_parser("deploy", parents=[common], help="copy the generated IOCs with a host to it")
+    deploy.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help="number of transfers to run in parallel (default: %(default)s)")
+    control_help = {"start": "start the generated IOCs under procServ and wait for their telnet ports",
+        "stop": "stop the IOCs started with start", "status": "show which IOCs are running and answer on their telnet port",
+        "restart": "stop and start the IOCs again"}
+    for command in PROCSERV_COMMANDS:
+        control = commands.add_parser(command, parents=[config], help=control_help[command])
+        control.add_argument("iocs", nargs="*", metavar="ioc", help="IOCs to {} (default: all in CONFIGURE)".format(command))
+        control.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help="number of IOCs handled in parallel (default: %(default)s)")
+        control.add_argument("--timeout", type=float, default=PROCSERV_READY_TIMEOUT,
+            help="seconds to wait for a started IOC to open its telnet port (default: %(default)s)")
+        control.add_argument("--procserv", default=None, help="procServ command to run (default: PROCSERV in CONFIGURE or procServ)")
+    commands.add_parser("gui", help="open the graphical editor")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command line entry point. The GUI module, and with it tkinter, is only imported for the gui command
+
+    Parameters
+    ----------
+    argv : list of str
+        arguments to parse, None for sys.argv
+
+    Returns
+    -------
+    int
+        exit code
+    """
+
+    args = parse_args(argv)
+    if args.command == "gui":
+        import gui
+        gui.main()
+        return 0
+    if args.command in PROCSERV_COMMANDS:
+        return control_iocs(args.command, args.iocs, args.config, args.jobs, args.timeout, args.procserv)
+    return init_iocs(jobs=getattr(args, "jobs", DEFAULT_JOBS), refresh_template=args.refresh_template,
+        rescan=getattr(args, "rescan", False), force=getattr(args, "force", False), plan=args.command == "plan",
+        drivers=args.command == "list-drivers", profile=getattr(args, "profile", False),
+        report=getattr(args, "report", PROFILE_REPORT), validate=args.command == "validate", config_path=args.config,
+        deploy=not getattr(args, "no_deploy", False), deploy_only=args.command == "deploy")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+# initiocs is a top level module next to the tests package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import initiocs
+
+
+CONFIGURE = """# test configuration
+IOC_DIR={ioc_dir}
+TOP_BINARY_DIR={bin_dir}
+BINARIES_FLAT=NO
+PREFIX=XF:10ID:
+
+# IOC Type    IOC Name    Asyn Port    IOC Port    Cam Connection
+{rows}
+ENGINEER=J. Doe
+HOSTNAME=localhost
+CA_ADDRESS=127.0.0.255
+"""
+
+
+@pytest.fixture
+def write_configure(tmp_path):
+    """ Fixture returning a function that writes a CONFIGURE file with the given IOC rows into tmp_path """
+
+    def write(rows, extra=""):
+        path = tmp_path / "CONFIGURE.txt"
+        path.write_text(CONFIGURE.format(ioc_dir=tmp_path / "iocs", bin_dir=tmp_path / "epics", rows="\n".join(rows)) + extra)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def template(tmp_path):
+    """ Synthetic ioc-template repository and binary tree built like benchmark.py does, for the drivers Sim and Cam """
+
+    if shutil.which("git") is None:
+        pytest.skip("generating IOCs needs git")
+    import benchmark
+
+    template_path = str(tmp_path / "ioc-template")
+    benchmark.build_template(template_path, ["Sim", "Cam"])
+    benchmark.build_binaries(str(tmp_path / "epics"), ["Sim", "Cam"])
+    return template_path
+
+
+@pytest.fixture
+def generate(write_configure, template):
+    """
+    Fixture returning a function that writes a CONFIGURE file with the given rows and settings for
+    the synthetic template and generates it, returning the status of every IOC by name
+    """
+
+    def run(rows, mode="clone", settings=None, **options):
+        config_path = write_configure(rows, "TEMPLATE_URL={}\nTEMPLATE_MODE={}\n".format(template, mode))
+        if settings is not None:
+            model = initiocs.parse_configure(config_path)
+            for key, value in settings.items():
+                model.set_entry(key, value)
+            initiocs.save_configure(model)
+        actions, configuration, bin_flat = initiocs.read_ioc_config(config_path)
+        results = initiocs.generate_iocs(actions, configuration, bin_flat, jobs=2, deploy=False, **options)
+        return dict([(action.ioc_name, status) for action, status in results])
+
+    return run
@@ -0,0 +1,57 @@
+import json
+import os
+import stat
+
+import pytest
+
+import initiocs
+
+
+ROWS = ["ADSimDetector  cam-sim1  SIM1  auto  NA", "ADSimDetector  cam-sim2  SIM2  auto  NA"]
+
+
+def actions_by_name(config_path):
+    return dict([(action.ioc_name, action) for action in initiocs.parse_configure(config_path).make_actions()])
+
+
+def test_make_actions_writes_nothing(write_configure):
+    config_path = write_configure(ROWS)
+    actions_by_name(config_path)
+    assert not os.path.exists(initiocs.allocation_path(config_path))
+
+
+def test_saved_allocations_survive_reordering(write_configure):
+    config_path = write_configure(ROWS)
+    before = actions_by_name(config_path)
+    assert initiocs.save_allocations(initiocs.allocation_path(config_path), list(before.values()))
+    assert not initiocs.save_allocations(initiocs.allocation_path(config_path), list(before.values()))
+
+    write_configure(["ADSimDetector  cam-sim0  SIM0  auto  NA"] + ROWS[::-1])
+    after = actions_by_name(config_path)
+    for name in before:
+        assert (after[name].ioc_num, after[name].ioc_port) == (before[name].ioc_num, before[name].ioc_port)
+    assert after["cam-sim0"].ioc_num not in [action.ioc_num for action in before.values()]
+
+
+def test_allocation_file_is_world_readable(write_configure):
+    config_path = write_configure(ROWS)
+    path = initiocs.allocation_path(config_path)
+    initiocs.save_allocations(path, list(actions_by_name(config_path).values()))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert [name for name in os.listdir(os.path.dirname(path)) if name.startswith(".")] == []
+
+
+def test_corrupt_allocation_file_is_an_error(write_configure):
+    config_path = write_configure(ROWS)
+    with open(initiocs.allocation_path(config_path), "w") as allocation_file:
+        allocation_file.write("{not json")
+    with pytest.raises(initiocs.ConfigError):
+        initiocs.parse_configure(config_path).make_actions()
+
+
+def test_allocation_file_without_iocs_is_an_error(write_configure):
+    config_path = write_configure(ROWS)
+    with open(initiocs.allocation_path(config_path), "w") as allocation_file:
+        json.dump({"iocs": []}, allocation_file)
+    with pytest.raises(initiocs.ConfigError):
+        initiocs.parse_configure(config_path).make_actions()
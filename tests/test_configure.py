@@ -0,0 +1,68 @@
+import pytest
+
+import initiocs
+
+
+ROWS = [
+    "ADSimDetector     cam-sim1     SIM1     4000     NA",
+    "# ADSimDetector  cam-old      OLD1     4001     NA",
+    "ADProsilica       cam-ps1      PS1      4002     10.0.0.5",
+]
+
+
+def test_unchanged_model_is_not_written(write_configure):
+    config_path = write_configure(ROWS)
+    with open(config_path) as config_file:
+        original = config_file.read()
+    model = initiocs.parse_configure(config_path)
+    assert model.serialize() == original
+    assert not initiocs.save_configure(model)
+
+
+def test_changes_keep_comments_and_alignment(write_configure):
+    config_path = write_configure(ROWS)
+    with open(config_path) as config_file:
+        original = config_file.read().splitlines(True)
+    model = initiocs.parse_configure(config_path)
+    model.set_entry("ENGINEER", "A. Smith")
+    model.set_entry("IOC_PORT_RANGE", "5000-5100")
+    model.iocs[0].asyn_port = "SIM9"
+    model.add_rows([initiocs.IOCRow("ADSimDetector", "cam-sim2", "SIM2", "auto", "NA")])
+    assert initiocs.save_configure(model)
+
+    with open(config_path) as config_file:
+        saved = config_file.read().splitlines(True)
+    assert [line for line in saved if line.startswith("#")] == [line for line in original if line.startswith("#")]
+    assert "ADSimDetector     cam-sim1     SIM9     4000     NA\n" in saved
+    assert saved[saved.index(ROWS[2] + "\n") + 1].split() == ["ADSimDetector", "cam-sim2", "SIM2", "auto", "NA"]
+    assert "ENGINEER=A. Smith\n" in saved
+    assert saved[-1] == "IOC_PORT_RANGE=5000-5100\n"
+
+    reread = initiocs.parse_configure(config_path)
+    assert reread.serialize() == "".join(saved)
+    assert [row.ioc_name for row in reread.iocs] == ["cam-sim1", "cam-ps1", "cam-sim2"]
+    assert reread.get_entry("ENGINEER").value == "A. Smith"
+
+
+def test_deleted_rows_are_dropped(write_configure):
+    config_path = write_configure(ROWS)
+    model = initiocs.parse_configure(config_path)
+    del model.iocs[0]
+    assert initiocs.save_configure(model)
+    assert [row.ioc_name for row in initiocs.parse_configure(config_path).iocs] == ["cam-ps1"]
+    with open(config_path) as config_file:
+        assert ROWS[1] + "\n" in config_file.read().splitlines(True)
+
+
+def test_copy_transport_needs_a_deploy_dir(write_configure):
+    rows = ["ADSimDetector  cam-sim1  SIM1  4000  NA  ioc-server1", "ADSimDetector  cam-sim2  SIM2  4001  NA  ioc-server2"]
+    with pytest.raises(initiocs.ConfigError) as err:
+        initiocs.parse_configure(write_configure(rows, "DEPLOY_TRANSPORT=copy\n"))
+    assert "needs a DEPLOY_DIR" in str(err.value)
+    with pytest.raises(initiocs.ConfigError) as err:
+        initiocs.parse_configure(write_configure(rows, "DEPLOY_TRANSPORT=copy\nDEPLOY_DIR=/mnt/iocs\n"))
+    assert "{host}" in str(err.value)
+    model = initiocs.parse_configure(write_configure(rows, "DEPLOY_TRANSPORT=copy\nDEPLOY_DIR=/mnt/{host}/iocs\n"))
+    assert model.get_entry("DEPLOY_DIR").value == "/mnt/{host}/iocs"
+    # one host needs no {host}
+    initiocs.parse_configure(write_configure(rows[:1], "DEPLOY_TRANSPORT=copy\nDEPLOY_DIR=/mnt/iocs\n"))
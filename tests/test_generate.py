@@ -0,0 +1,40 @@
+import subprocess
+
+import initiocs
+
+
+ROWS = ["ADSim  cam-sim1  SIM1  auto  NA", "ADCam  cam-cam1  CAM1  auto  NA"]
+SUCCEEDED = {"cam-sim1": initiocs.IOC_SUCCEEDED, "cam-cam1": initiocs.IOC_SUCCEEDED}
+UNCHANGED = {"cam-sim1": initiocs.IOC_UNCHANGED, "cam-cam1": initiocs.IOC_UNCHANGED}
+
+
+def test_unchanged_inputs_are_skipped(generate):
+    assert generate(ROWS) == SUCCEEDED
+    assert generate(ROWS) == UNCHANGED
+
+
+def test_changed_row_regenerates_only_that_ioc(generate, tmp_path):
+    generate(ROWS)
+    assert generate(["ADSim  cam-sim1  SIM9  auto  NA", ROWS[1]]) == {
+        "cam-sim1": initiocs.IOC_SUCCEEDED, "cam-cam1": initiocs.IOC_UNCHANGED}
+    assert 'epicsEnvSet("PORT", "SIM9")' in (tmp_path / "iocs" / "cam-sim1" / "unique.cmd").read_text()
+
+
+def test_changed_setting_regenerates_every_ioc(generate):
+    generate(ROWS)
+    assert generate(ROWS, settings={"ENGINEER": "A. Smith"}) == SUCCEEDED
+
+
+def test_new_template_revision_regenerates_every_ioc(generate, template):
+    generate(ROWS)
+    with open(template + "/config", "a") as config:
+        config.write("LOGFILE=ioc.log\n")
+    git = ["git", "-C", template, "-c", "user.name=test", "-c", "user.email=test@localhost"]
+    subprocess.check_call(git + ["commit", "--quiet", "-am", "new revision"])
+    assert generate(ROWS) == UNCHANGED
+    assert generate(ROWS, refresh_template=True) == SUCCEEDED
+
+
+def test_force_regenerates_unchanged_iocs(generate):
+    generate(ROWS)
+    assert generate(ROWS, force=True) == SUCCEEDED
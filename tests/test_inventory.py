@@ -0,0 +1,64 @@
+import pytest
+
+import initiocs
+
+
+def test_parse_ioc_row():
+    row, errors = initiocs.parse_ioc_row("ADProsilica  cam-ps1  PS1  4001  10.0.0.1  ioc-server2", 12)
+    assert errors == []
+    assert row.fields() == ["ADProsilica", "cam-ps1", "PS1", "4001", "10.0.0.1", "ioc-server2"]
+    assert row.line == 12
+
+
+@pytest.mark.parametrize("text, column", [
+    ("ADProsilica  cam-ps1  PS1  4001", 28),
+    ("ADProsilica  cam-ps1  PS1  4001  10.0.0.1  ioc-server2  extra", 57),
+    ("Prosilica  cam-ps1  PS1  4001  10.0.0.1", 1),
+    ("ADProsilica  cam-ps1  PS1  telnet  10.0.0.1", 28),
+])
+def test_parse_ioc_row_rejects_malformed_rows(text, column):
+    row, errors = initiocs.parse_ioc_row(text, 3)
+    assert row is None
+    assert [(line, error_column) for line, error_column, message in errors] == [(3, column)]
+
+
+def write_inventory(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_import_csv_with_header(tmp_path):
+    path = write_inventory(tmp_path, "inventory.csv", "IOC Name,IOC Type,Cam Connection\ncam-sim1,ADSimDetector,NA\n")
+    rows = initiocs.import_inventory(path)
+    assert [row.fields() for row in rows] == [["ADSimDetector", "cam-sim1", "auto", "auto", "NA", ""]]
+
+
+def test_import_rejects_every_malformed_record(tmp_path):
+    path = write_inventory(tmp_path, "inventory.csv", "\n".join([
+        "ADSimDetector,cam-sim1,SIM1,4000,NA",
+        "ADSimDetector,cam-sim2,SIM2,4001,NA,host,extra",
+        "SimDetector,cam-sim3,SIM3,4002,NA",
+        "ADSimDetector,,SIM4,4003,NA",
+        "ADSimDetector,cam sim5,SIM5,4004,NA",
+        "ADSimDetector,cam-sim1,SIM6,4005,NA",
+        "ADSimDetector,cam-sim7,SIM7,4006,NA",
+    ]) + "\n")
+    with pytest.raises(initiocs.ConfigError) as err:
+        initiocs.import_inventory(path, existing_names=["cam-sim7"])
+    assert [line for line, column, message in err.value.errors] == [2, 3, 4, 5, 6, 7]
+
+
+def test_import_yaml_rejects_unknown_fields(tmp_path):
+    pytest.importorskip("yaml")
+    path = write_inventory(tmp_path, "inventory.yaml", "iocs:\n  - type: ADSimDetector\n    name: cam-sim1\n    color: red\n")
+    with pytest.raises(initiocs.ConfigError) as err:
+        initiocs.import_inventory(path)
+    assert "unknown field color" in str(err.value)
+
+
+def test_import_yaml_requires_a_list(tmp_path):
+    pytest.importorskip("yaml")
+    path = write_inventory(tmp_path, "inventory.yaml", "iocs: cam-sim1\n")
+    with pytest.raises(initiocs.ConfigError):
+        initiocs.import_inventory(path)
@@ -0,0 +1,58 @@
+import os
+import stat
+import time
+
+import initiocs
+
+
+ROWS = ["ADSim  cam-sim1  SIM1  auto  NA", "ADSim  cam-sim2  SIM2  auto  NA"]
+# copied from the snapshot as they are
+LINKED = ["iocBoot/README", "auto_settings.req", "Sim_plugins.cmd"]
+# rendered for each IOC
+RENDERED = ["st.cmd", "unique.cmd", "config", "envPaths"]
+
+
+def snapshots_dir(tmp_path):
+    return str(tmp_path / "iocs" / ".ioc-template.git") + initiocs.TEMPLATE_SNAPSHOTS_SUFFIX
+
+
+def test_link_mode_shares_only_unchanged_files(generate, tmp_path):
+    assert set(generate(ROWS, mode="link").values()) == {initiocs.IOC_SUCCEEDED}
+    snapshots = os.listdir(snapshots_dir(tmp_path))
+    assert len(snapshots) == 1
+    snapshot = snapshots_dir(tmp_path) + "/" + snapshots[0]
+    assert stat.S_IMODE(os.stat(snapshot).st_mode) == 0o755
+
+    first, second = [tmp_path / "iocs" / name for name in ["cam-sim1", "cam-sim2"]]
+    for file in LINKED:
+        assert os.stat(first / file).st_ino == os.stat(second / file).st_ino
+        assert stat.S_IMODE(os.stat(first / file).st_mode) & 0o222 == 0
+    assert os.stat(first / "iocBoot/README").st_ino == os.stat(snapshot + "/iocBoot/README").st_ino
+    for file in RENDERED:
+        assert os.stat(first / file).st_ino != os.stat(second / file).st_ino
+        assert os.stat(first / file).st_nlink == 1
+
+    # editing the rendered files of one IOC leaves the other IOC and the snapshot alone
+    unique = (second / "unique.cmd").read_text()
+    (first / "unique.cmd").write_text("changed\n")
+    assert (second / "unique.cmd").read_text() == unique
+    assert "changed" not in open(snapshot + "/unique.cmd").read()
+
+
+def test_regenerating_replaces_linked_files_without_touching_the_snapshot(generate, tmp_path):
+    generate(ROWS, mode="link")
+    snapshot = snapshots_dir(tmp_path) + "/" + os.listdir(snapshots_dir(tmp_path))[0]
+    readme = open(snapshot + "/iocBoot/README").read()
+    assert set(generate(ROWS, mode="link", force=True).values()) == {initiocs.IOC_SUCCEEDED}
+    assert open(snapshot + "/iocBoot/README").read() == readme
+    assert os.stat(tmp_path / "iocs" / "cam-sim1" / "iocBoot/README").st_ino == os.stat(snapshot + "/iocBoot/README").st_ino
+
+
+def test_prune_keeps_snapshots_in_use(tmp_path):
+    for name in ["current", "recent", "old", ".tmp-{}-abc".format(os.getpid())]:
+        (tmp_path / name).mkdir()
+    old = time.time() - initiocs.TEMPLATE_SNAPSHOT_MAX_AGE - 60
+    os.utime(tmp_path / "old", (old, old))
+    os.utime(tmp_path / "current", (old, old))
+    initiocs.prune_template_snapshots(str(tmp_path), "current")
+    assert sorted(os.listdir(tmp_path)) == sorted(["current", "recent", ".tmp-{}-abc".format(os.getpid())])
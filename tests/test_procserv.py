@@ -0,0 +1,122 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import initiocs
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="procServ control needs POSIX process groups")
+
+
+STUB = """\
+#!{python}
+# stands in for procServ: records its arguments and serves the telnet port
+import socket, sys
+args = sys.argv[1:]
+port = int(args[-2])
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind(("127.0.0.1", port))
+server.listen()
+print("stub", " ".join(args), flush=True)
+while True:
+    connection, address = server.accept()
+    connection.close()
+"""
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def iocs(tmp_path, write_configure):
+    """ Two generated IOCs on free ports and a stub procServ, stopped again after the test """
+
+    ports = [free_port(), free_port()]
+    names = ["cam-sim1", "cam-sim2"]
+    for name, port in zip(names, ports):
+        ioc_path = tmp_path / "iocs" / name
+        ioc_path.mkdir(parents=True)
+        (ioc_path / "st.cmd").write_text("#!/bin/true\n")
+        (ioc_path / "config").write_text("NAME={}\nPORT={}\nHOST=localhost\n".format(name, port))
+    config_path = write_configure(["ADSimDetector  {}  SIM{}  {}  NA".format(name, index, port)
+        for index, (name, port) in enumerate(zip(names, ports), 1)])
+    stub = tmp_path / "procServ-stub"
+    stub.write_text(STUB.format(python=sys.executable))
+    stub.chmod(0o755)
+    yield config_path, str(stub), names, ports
+    initiocs.control_iocs("stop", config_path=config_path)
+
+
+def load(config_path, name):
+    actions, configuration, bin_flat = initiocs.read_ioc_config(config_path)
+    action = [action for action in actions if action.ioc_name == name][0]
+    return initiocs.ProcServIOC(action, configuration)
+
+
+def test_start_status_stop(iocs, capsys):
+    config_path, stub, names, ports = iocs
+    assert initiocs.control_iocs("start", config_path=config_path, timeout=10, procserv=stub) == 0
+    out = capsys.readouterr().out
+    assert out.count("started") == 2
+    assert "2 IOCs ready" in out
+    for name, port in zip(names, ports):
+        ioc = load(config_path, name)
+        assert ioc.pid() is not None
+        with socket.create_connection(("127.0.0.1", port), timeout=2):
+            pass
+        with open(ioc.log_file) as log:
+            assert "-L {} ".format(ioc.log_file) in log.read()
+
+    assert initiocs.control_iocs("status", config_path=config_path) == 0
+    assert capsys.readouterr().out.count("running") == 2
+
+    assert initiocs.control_iocs("stop", config_path=config_path) == 0
+    for name in names:
+        ioc = load(config_path, name)
+        assert ioc.pid() is None
+        assert not os.path.exists(ioc.pid_file)
+    capsys.readouterr()
+    assert initiocs.control_iocs("status", config_path=config_path) == 1
+    assert capsys.readouterr().out.count("stopped") == 2
+
+
+def test_start_reports_failed_procserv(iocs, tmp_path, capsys):
+    config_path, stub, names, ports = iocs
+    failing = tmp_path / "failing"
+    failing.write_text("#!/bin/sh\nexit 3\n")
+    failing.chmod(0o755)
+    assert initiocs.control_iocs("start", [names[0]], config_path=config_path, timeout=5, procserv=str(failing)) == 1
+    assert "procServ exited with 3" in capsys.readouterr().out
+
+
+def test_stale_pid_is_not_signalled(iocs, capsys):
+    config_path, stub, names, ports = iocs
+    ioc = load(config_path, names[0])
+    # an unrelated process that got the pid recorded for the IOC, ex. after a reboot
+    unrelated = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    try:
+        os.makedirs(os.path.dirname(ioc.pid_file), exist_ok=True)
+        with open(ioc.pid_file, "w") as pid_file:
+            pid_file.write("{}\n".format(unrelated.pid))
+        assert ioc.pid() is None
+        assert not os.path.exists(ioc.pid_file)
+
+        with open(ioc.pid_file, "w") as pid_file:
+            pid_file.write("{}\n".format(unrelated.pid))
+        assert initiocs.control_iocs("stop", [names[0]], config_path=config_path) == 0
+        assert unrelated.poll() is None
+
+        with open(ioc.pid_file, "w") as pid_file:
+            pid_file.write("{}\n".format(unrelated.pid))
+        assert initiocs.control_iocs("start", [names[0]], config_path=config_path, timeout=10, procserv=stub) == 0
+        assert "started" in capsys.readouterr().out
+        assert ioc.pid() not in [None, unrelated.pid]
+    finally:
+        unrelated.kill()
+        unrelated.wait()
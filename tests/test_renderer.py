@@ -0,0 +1,72 @@
+import initiocs
+
+
+class FakeTree:
+    """ TemplateTree stand-in holding the template files in memory """
+
+    def __init__(self, files):
+        self.files = files
+
+    def exists(self, path):
+        return path in self.files
+
+    def listdir(self, directory):
+        return sorted([path.split("/")[-1] for path in self.files if path.startswith(directory + "/")])
+
+    def read_lines(self, path):
+        return self.files[path].splitlines(True)
+
+
+FILES = {
+    "startupScripts/st_sim.cmd": '#!../bin/linux-x86_64/simDetectorApp\n< unique.cmd\n',
+    "startupScripts/st_prosilica_gige.cmd": '#!../bin/linux-x86_64/prosilicaApp\n< envPaths\n',
+    # two scripts for one driver are left out of the index
+    "startupScripts/st_pilatus.cmd": '#!../bin/linux-x86_64/pilatusApp\n',
+    "startupScripts/st-pilatus.cmd": '#!../bin/linux-x86_64/pilatusApp\n',
+    "unique.cmd": 'epicsEnvSet("PREFIX", "XF:")\n',
+    "config": "NAME=ioc\n",
+    "envPaths": 'epicsEnvSet("TOP", ".")\n',
+}
+
+
+def make_renderer():
+    tree = FakeTree(FILES)
+    index = initiocs.TemplateIndex.from_tree(tree)
+    return initiocs.TemplateRenderer(tree, index), index
+
+
+def test_indexed_drivers_are_compiled_up_front():
+    renderer, index = make_renderer()
+    assert "startupScripts/st_sim.cmd" in renderer.templates
+    assert "startupScripts/st_pilatus.cmd" not in renderer.templates
+
+
+def test_other_files_are_compiled_once_on_demand():
+    renderer, index = make_renderer()
+    compiled = renderer.get("startupScripts/st_pilatus.cmd")
+    assert renderer.get("startupScripts/st_pilatus.cmd") is compiled
+    assert renderer.render("startupScripts/st_pilatus.cmd", {"BINARY": "/epics/pilatusApp"}) == "#!/epics/pilatusApp\n"
+
+
+def test_partial_drivers_are_resolved_when_indexed():
+    renderer, index = make_renderer()
+    assert index.partial == {"prosilica"}
+    assert "startupScripts/st_prosilica_gige.cmd" in renderer.templates
+    driver = index.lookup("ADProsilica")
+    assert driver.startup == "startupScripts/st_prosilica_gige.cmd"
+    assert renderer.render(driver.startup, {"BINARY": "/epics/prosilicaApp"}) == "#!/epics/prosilicaApp\n< envPaths\n"
+
+
+def test_lookup_does_not_match_substrings():
+    renderer, index = make_renderer()
+    drivers = dict(index.drivers)
+    assert index.lookup("ADGige") is None
+    assert index.lookup("ADPilatus") is None
+    assert index.drivers == drivers
+    assert index.ambiguous == {"pilatus"}
+
+
+def test_missing_files_are_not_rendered():
+    renderer, index = make_renderer()
+    assert renderer.get("startupScripts/st_missing.cmd") is None
+    assert not renderer.has("startupScripts/st_missing.cmd")
@@ -0,0 +1,32 @@
+import initiocs
+
+
+UNIQUE = [
+    '# epicsEnvSet("PREFIX", "commented:")\n',
+    'epicsEnvSet("PREFIX", "XF:31IDA-BI{Cam:Tbl}")\n',
+    'epicsEnvSet("PREFIX_EXTRA", "keep")\n',
+    'epicsEnvSet("PORT",   "PS1")\n',
+    "\n",
+    "#HOST=commented\n",
+    "HOST=localhost\n",
+    "HOSTNAME=keep\n",
+]
+
+
+def test_rewrites_exact_keys_only():
+    lines = initiocs.rewrite_lines(UNIQUE, {"PREFIX": "XF:10ID:", "PORT": "SIM1", "HOST": "xf10id-ioc1"})
+    assert lines[1] == 'epicsEnvSet("PREFIX", "XF:10ID:")\n'
+    assert lines[2] == UNIQUE[2]
+    assert lines[3] == 'epicsEnvSet("PORT", "SIM1")\n'
+    assert lines[6] == "HOST=xf10id-ioc1\n"
+    assert lines[7] == UNIQUE[7]
+
+
+def test_commented_lines_are_kept():
+    lines = initiocs.rewrite_lines(UNIQUE, {"PREFIX": "XF:10ID:", "HOST": "xf10id-ioc1"})
+    assert lines[0] == UNIQUE[0]
+    assert lines[5] == UNIQUE[5]
+
+
+def test_unknown_keys_leave_the_file_unchanged():
+    assert initiocs.rewrite_lines(UNIQUE, {"ENGINEER": "J. Doe"}) == UNIQUE
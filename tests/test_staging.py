@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+
+import initiocs
+
+
+ROWS = ["ADSim  cam-sim1  SIM1  auto  NA", "ADCam  cam-cam1  CAM1  auto  NA"]
+
+
+def staging_dirs(ioc_top):
+    return [name for name in os.listdir(ioc_top) if name.startswith(initiocs.STAGING_PREFIX)]
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_failing_stage_keeps_the_existing_ioc(generate, tmp_path, monkeypatch):
+    generate(ROWS)
+    ioc_top = tmp_path / "iocs"
+    manifest = (ioc_top / "cam-sim1" / initiocs.MANIFEST_FILE).read_text()
+
+    def fail(self, *args):
+        if self.ioc_name == "cam-sim1":
+            raise OSError("disk full")
+    monkeypatch.setattr(initiocs.IOCAction, "update_config", fail)
+    assert generate(ROWS, force=True) == {"cam-sim1": initiocs.IOC_FAILED, "cam-cam1": initiocs.IOC_SUCCEEDED}
+    assert (ioc_top / "cam-sim1" / initiocs.MANIFEST_FILE).read_text() == manifest
+    assert staging_dirs(str(ioc_top)) == []
+
+
+def test_failing_check_only_fails_that_ioc(generate, tmp_path, monkeypatch):
+    build_manifest = initiocs.build_manifest
+
+    def fail(action, *args):
+        if action.ioc_name == "cam-sim1":
+            raise OSError("permission denied")
+        return build_manifest(action, *args)
+    monkeypatch.setattr(initiocs, "build_manifest", fail)
+    assert generate(ROWS) == {"cam-sim1": initiocs.IOC_FAILED, "cam-cam1": initiocs.IOC_SUCCEEDED}
+    assert staging_dirs(str(tmp_path / "iocs")) == []
+
+
+def test_hand_made_directory_needs_force(generate, tmp_path):
+    ioc_path = tmp_path / "iocs" / "cam-sim1"
+    ioc_path.mkdir(parents=True)
+    (ioc_path / "st.cmd").write_text("hand made\n")
+    assert generate(ROWS)["cam-sim1"] == initiocs.IOC_FAILED
+    assert (ioc_path / "st.cmd").read_text() == "hand made\n"
+    assert generate(ROWS, force=True)["cam-sim1"] == initiocs.IOC_SUCCEEDED
+    assert (ioc_path / "st.cmd").read_text() != "hand made\n"
+
+
+def test_stale_staging_of_dead_runs_is_removed(tmp_path):
+    running = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        names = ["{}{}-abc".format(initiocs.STAGING_PREFIX, pid) for pid in [dead_pid(), os.getpid(), running.pid]]
+        for name in names:
+            (tmp_path / name).mkdir()
+        initiocs.remove_stale_staging(str(tmp_path))
+        assert sorted(staging_dirs(str(tmp_path))) == sorted(names[1:])
+    finally:
+        running.kill()
+        running.wait()
+
+
+def test_ioc_moved_aside_by_a_killed_run_is_restored(tmp_path):
+    staging = tmp_path / "{}{}-abc".format(initiocs.STAGING_PREFIX, dead_pid())
+    (staging / ("cam-sim1" + initiocs.PREVIOUS_SUFFIX)).mkdir(parents=True)
+    (staging / ("cam-sim1" + initiocs.PREVIOUS_SUFFIX) / "st.cmd").write_text("previous\n")
+    # installed before the run was killed, the previous generation is not needed
+    (staging / ("cam-cam1" + initiocs.PREVIOUS_SUFFIX)).mkdir()
+    (tmp_path / "cam-cam1").mkdir()
+    (tmp_path / "cam-cam1" / "st.cmd").write_text("new\n")
+    initiocs.remove_stale_staging(str(tmp_path))
+    assert (tmp_path / "cam-sim1" / "st.cmd").read_text() == "previous\n"
+    assert (tmp_path / "cam-cam1" / "st.cmd").read_text() == "new\n"
+    assert staging_dirs(str(tmp_path)) == []
@@ -0,0 +1,48 @@
+import initiocs
+
+
+CONFIGURATION = {"HOSTNAME": "localhost", "PREFIX": "XF:10ID:", "CA_ADDRESS": "127.0.0.255"}
+
+
+def row(name, asyn_port, ioc_port, host="", line=0):
+    return initiocs.IOCRow("ADSimDetector", name, asyn_port, ioc_port, "NA", line, host)
+
+
+def issues_for(iocs, configuration=CONFIGURATION):
+    return [(ioc.ioc_name if ioc is not None else None, field, severity)
+        for ioc, field, severity, message in initiocs.validate_iocs(iocs, configuration, check_listening=False)]
+
+
+def test_valid_iocs_have_no_issues():
+    assert issues_for([row("cam-sim1", "SIM1", "4000"), row("cam-sim2", "SIM2", "4001")]) == []
+
+
+def test_duplicate_names_are_errors():
+    issues = issues_for([row("cam-sim1", "SIM1", "4000", line=7), row("cam-sim1", "SIM2", "4001", line=8)])
+    assert issues == [("cam-sim1", "ioc_name", initiocs.VALIDATION_ERROR)] * 2
+
+
+def test_duplicate_ports_are_errors_per_host():
+    issues = issues_for([row("cam-sim1", "SIM1", "4000"), row("cam-sim2", "SIM2", "4000"), row("cam-sim3", "SIM3", "4000", "xf10id-ioc2")])
+    assert sorted(issues) == [("cam-sim1", "ioc_port", initiocs.VALIDATION_ERROR), ("cam-sim2", "ioc_port", initiocs.VALIDATION_ERROR)]
+
+
+def test_auto_ports_never_collide():
+    assert issues_for([row("cam-sim1", "auto", "auto"), row("cam-sim2", "auto", "auto")]) == []
+
+
+def test_duplicate_asyn_ports_are_warnings():
+    issues = issues_for([row("cam-sim1", "SIM1", "4000"), row("cam-sim2", "SIM1", "4001")])
+    assert sorted(issues) == [("cam-sim1", "asyn_port", initiocs.VALIDATION_WARNING), ("cam-sim2", "asyn_port", initiocs.VALIDATION_WARNING)]
+
+
+def test_invalid_prefix_is_an_error():
+    configuration = dict(CONFIGURATION, PREFIX="XF 10ID")
+    assert issues_for([row("cam-sim1", "SIM1", "4000")], configuration) == [(None, "PREFIX", initiocs.VALIDATION_ERROR)]
+
+
+def test_messages_name_the_other_ioc():
+    messages = [message for ioc, field, severity, message in initiocs.validate_iocs(
+        [row("cam-sim1", "SIM1", "4000", line=7), row("cam-sim2", "SIM2", "4000", line=9)], CONFIGURATION, check_listening=False)]
+    assert "cam-sim2 (line 9)" in messages[0]
+    assert "cam-sim1 (line 7)" in messages[1]